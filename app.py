@@ -2,28 +2,27 @@ from flask import Flask, render_template, request, redirect, url_for, session, f
 from werkzeug.security import generate_password_hash, check_password_hash
 import sqlite3
 import os
-import cv2
-import numpy as np
-import mediapipe as mp
-from mediapipe.tasks import python
-from mediapipe.tasks.python import vision
-import math
+import hmac
 from flask import jsonify
 import time
 from flask import Response
+import json
+import queue
 
 
 from landmarks import *
-
-BaseOptions = python.BaseOptions
-PoseLandmarker = vision.PoseLandmarker
-PoseLandmarkerOptions = vision.PoseLandmarkerOptions
-VisionRunningMode = vision.RunningMode
-base_options = python.BaseOptions(model_asset_path='pose_landmarker.task')
-options = vision.PoseLandmarkerOptions(
-        base_options=base_options,
-        output_segmentation_masks=True)
-detector = vision.PoseLandmarker.create_from_options(options)
+from pose_frame import new_pose_frame
+from exercises import *
+from events import EventChannel
+from metrics import PipelineMetrics, process_memory
+from tracking import PoseTracker
+from upload import UploadSource
+from packets import PACKET_SIZE, LandmarkReceiver, PacketError
+from vision import VisionStack
+from sessions import SessionRegistry
+from db import Database
+from history import HistoryWriter, WorkoutLog
+from workout_plans import current_week, plan_for_user, plan_row
 
 app = Flask(__name__)
 app.secret_key = "fitcompass_secret_key"
@@ -31,639 +30,99 @@ app.secret_key = "fitcompass_secret_key"
 currentDirectory = os.path.dirname(os.path.abspath(__file__))
 db_path = os.path.join(currentDirectory, "UserLogins.db")
 
-def get_db_connection():
-    conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row
-    return conn
-
-# Create tables
-connection = get_db_connection()
-cursor = connection.cursor()
-
-# Drop old table if it exists (WARNING: deletes old user data!) Only do when adding columns to the table and want total reset
-# cursor.execute("DROP TABLE IF EXISTS UserLogins")
-
-cursor.execute("""
-CREATE TABLE IF NOT EXISTS UserLogins(
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    username TEXT UNIQUE NOT NULL,
-    email TEXT UNIQUE NOT NULL,
-    password TEXT NOT NULL,
-    goal TEXT,
-    goal_other TEXT,
-    workouts_per_week INTEGER,
-    body_part TEXT
-)
-""")
-
-connection.commit()
-
-
-
-connection.close()
-
-# Webcam setup
-camera = cv2.VideoCapture(0)
+# connections are pooled and the schema is brought up to date on first use, see db.py
+database = Database(db_path)
+
+# every counted rep ends up in the workout history, written in batches off the frame loop
+workout_history = HistoryWriter(database, hold_exercises=[name for name, spec in EXERCISE_SPECS.items() if spec.hold_state])
+HISTORY_PAGE_SIZE = 20
+
+# rep/state changes are pushed to the workout page over /exercise_events
+exercise_events = EventChannel()
+
+def exercise_status(user):
+    controller = user.exerciseManager.getCurrentExercise()
+    status = {"currentExercise": user.exerciseManager.currentExercise, "count": controller.count, "state": controller.state}
+    if user.group is not None:
+        #group station, everybody in the picture has their own count
+        status["people"] = user.group.summary()
+    return status
+
+def push_exercise_update(user):
+    status = exercise_status(user)
+    people = tuple((p["id"], p["count"], p["state"]) for p in status.get("people", ()))
+    snapshot = (status["currentExercise"], status["count"], status["state"], people)
+    if snapshot == user.last_pushed:
+        return
+    user.last_pushed = snapshot
+    user.workout_log.observe(status["currentExercise"], status["count"])
+    exercise_events.publish(user.user_ID, status)
+
+def start_workout_log(user):
+    # a new history session, counting from where the current exercise is now
+    manager = user.exerciseManager
+    return user.workout_log.start(manager.currentExercise, manager.getCurrentExercise().count)
+
+# pose detection runs in worker processes, one per core unless FITCOMPASS_INFERENCE_WORKERS
+# says otherwise. 0 keeps the detectors in this process
+inference_workers = int(os.environ.get("FITCOMPASS_INFERENCE_WORKERS", os.cpu_count() or 1))
+
+# the camera hub captures, runs pose detection and encodes each camera frame once for every
+# tab watching. streaming detectors are created per detector profile (see
+# detectors.DETECTOR_PROFILES). pose detection runs at up to inference_fps per user, and
+# idle_fps while nobody moves. set FITCOMPASS_TRACE_DIR to record every session's poses for
+# replay.py. none of it (or mediapipe) is loaded until a workout page asks, see vision.py
+vision = VisionStack(0, inference_workers, dict(inference_fps=15.0, idle_fps=3.0, on_update=push_exercise_update,
+                                                record_dir=os.environ.get("FITCOMPASS_TRACE_DIR")))
 #global variable for the latest detected frame
 
 # latest_detection = None
 
-loggedInUsers={}
+# shuts down whatever a session still has running when it is evicted or logged out
+def end_session(user):
+    stop_upload(user)
+    vision.close_user(user.user_ID)
+    user.workout_log.end()
+
+# sessions idle for FITCOMPASS_SESSION_TTL seconds are dropped, and the least recently used
+# ones once there are more than FITCOMPASS_MAX_SESSIONS. open video and event streams keep
+# their session alive
+loggedInUsers = SessionRegistry(ttl=float(os.environ.get("FITCOMPASS_SESSION_TTL", 2 * 60 * 60)),
+                                max_sessions=int(os.environ.get("FITCOMPASS_MAX_SESSIONS", 1000)),
+                                on_evict=end_session)
 class User:
     def __init__ (self,id):
         self.user_ID = id
         self.latest_detection = None
+        self.latest_pose = None #(33, 4) pose frame of the first person, None when nobody is in view
+        self.pose_buffer = new_pose_frame() #reused every frame
         self.currentExercise= None
         self.exerciseManager = ExerciseManager()
+        self.last_pushed = None #(exercise, count, state, people) last sent to /exercise_events
+        self.group = None #PoseTracker while this station counts for everybody in view
+        self.upload_source = None #UploadSource while the browser sends its own webcam
+        self.upload_hub = None #FrameHub running on upload_source
+        self.landmark_receiver = None #LandmarkReceiver once the browser sends its own landmarks
+        self.metrics = PipelineMetrics() #frame pipeline telemetry for /metrics
+        self.workout_log = WorkoutLog(workout_history, id) #reps for the workout history
         
 
 
 @app.route('/webcam_feed')
 def webcam_feed():
     user_id = session.get('user_id')
-    return Response(generate_frames(user_id),
+    #anything that is not the machine with the camera gets the lighter remote encoding
+    remote = request.remote_addr not in ('127.0.0.1', '::1')
+    vision.warm_up()
+    return Response(generate_frames(user_id, remote),
                     mimetype='multipart/x-mixed-replace; boundary=frame')
 
-#format is anglebetweenlines(endpoint one, vertex, endpoint two)
-def angleBetweenLines(a,b,c):
-    a = np.array(a) # end
-    b = np.array(b) # vertext 
-    c = np.array(c) # End 
-    radians = math.atan2(c[1] - b[1], c[0] - b[0]) - math.atan2(a[1] - b[1], a[0] - b[0])
-    angle = np.abs(radians * 180.0 / np.pi)
-    
-    if angle > 180.0:
-        angle = 360 - angle
-        
-    return angle
-
-def landmarks_to_pixels(pose_landmarks, image_shape):
-    h, w, _ = image_shape
-
-    pixel_landmarks = []
-
-    for lm in pose_landmarks:
-        x = int(lm.x * w)
-        y = int(lm.y * h)
-        pixel_landmarks.append((x, y))
-
-    return pixel_landmarks
-
-class SitUpState:
-    IDLE="IDLE"
-    DOWN = "DOWN"
-    RISING="RISING"
-    TOP="TOP"
-
-class SitUpController:
-    def __init__(self):
-        self.state=SitUpState.IDLE
-        self.count=0
-        self.bodyBendAngle=0 #the idle state means the angle between the rays from hip to head and hip to ankle has to be about flat
-        self.kneeAngle=0 #knees should be bent in a situp
-        self.heel_anchor=None #heel shouldnt move very much
-        #dont care about the arms for now
-
-    def update(self,detection_result, image_shape):
-        if not detection_result or not detection_result.pose_landmarks:
-            return
-        landmarks = detection_result.pose_landmarks[0] #only get the first person
-        pixel_landmarks = landmarks_to_pixels(landmarks, image_shape)  
-        right_hip=pixel_landmarks[RIGHT_HIP]
-        right_shoulder=pixel_landmarks[RIGHT_SHOULDER] #no head landmark
-        right_knee=pixel_landmarks[RIGHT_KNEE]
-
-        right_heel=pixel_landmarks[RIGHT_HEEL]
-
-        self.bodyBendAngle=angleBetweenLines(right_shoulder, right_hip,right_heel)
-        self.kneeAngle=angleBetweenLines(right_hip,right_knee,right_heel)
-
-        if self.state==SitUpState.IDLE:
-            self.heel_anchor = np.array(right_heel)
-            #wait until body bend angle is less than some number
-            if self.bodyBendAngle>165:
-                self.state = SitUpState.IDLE #lying flat, stay in idle
-                return
-            
-            elif self.bodyBendAngle<165 and self.kneeAngle<110: #knees must be bent and body must be bent enough to count as up 
-                #transition to up state
-                self.state=SitUpState.RISING
-                return
-        
-        elif self.state==SitUpState.RISING:
-            current_heel = np.array(right_heel)
-            heel_displacement = np.linalg.norm(current_heel - self.heel_anchor)
-
-            if self.heel_anchor is None:
-                self.state = SitUpState.IDLE
-
-            if self.kneeAngle>110 or heel_displacement > 80: #knees not bent enough! go back to idle
-                self.state=SitUpState.IDLE
-                return
-
-            elif self.bodyBendAngle<110: #more and more bent
-                self.state=SitUpState.TOP
-                return
-        elif self.state==SitUpState.TOP:
-            if self.kneeAngle>110: #knees not bent enough! go back to idle
-                self.state=SitUpState.IDLE
-                return
-            
-            elif self.bodyBendAngle>165:
-                self.count=self.count+1
-                self.state=SitUpState.IDLE
-                return
-        
-
-    def draw(self,image, detection_result):
-        annotated_image = image.copy()
-        if not detection_result.pose_landmarks:
-            return annotated_image
-        h, w, _ = image.shape
-
-        for pose_landmarks in detection_result.pose_landmarks:
-            def to_pixel(lm):
-                return int(lm.x * w), int(lm.y * h)
-            head= to_pixel(pose_landmarks[NOSE])
-            right_hip = to_pixel(pose_landmarks[RIGHT_HIP])
-            right_knee = to_pixel(pose_landmarks[RIGHT_KNEE])
-            right_ankle = to_pixel(pose_landmarks[RIGHT_HEEL])
-            
-            #head to hip, hip to ankle ignoring knee
-            cv2.line(annotated_image, right_hip, head, (0, 0, 255), 2)
-            cv2.line(annotated_image, right_hip, right_ankle, (0, 0, 255), 2)
-
-            #knee angle
-            cv2.line(annotated_image, right_hip, right_knee, (0, 255, 0), 2)
-            cv2.line(annotated_image, right_knee, right_ankle, (0, 255, 0), 2)
-        return annotated_image
-
-class SquatState:
-    IDLE="IDLE"
-    BEGIN = "BEGIN"
-    DOWN = "DOWN"
-    RISE="RISE"
-
-class SquatController:
-    def __init__(self):
-        self.state = SquatState.IDLE
-        self.count = 0
-        self.knee_angle = 0
-        self.heel_anchor = None
-        self.down_start_time = None
-
-    def update(self, detection_result, image_shape):
-        if not detection_result or not detection_result.pose_landmarks:
-            return
-        landmarks = detection_result.pose_landmarks[0] #only get the first person
-        pixel_landmarks = landmarks_to_pixels(landmarks, image_shape)  
-        left_hip = pixel_landmarks[LEFT_HIP] #both share a point at knee
-        left_knee = pixel_landmarks[LEFT_KNEE]
-        left_heel = pixel_landmarks[LEFT_HEEL]
-
-        self.left_knee_angle=angleBetweenLines(left_hip,left_knee,left_heel)
-
-        right_hip = pixel_landmarks[RIGHT_HIP] #both share a point at knee
-        right_knee = pixel_landmarks[RIGHT_KNEE]
-        right_heel = pixel_landmarks[RIGHT_HEEL]
-
-        self.right_knee_angle=angleBetweenLines(right_hip,right_knee,right_heel)
-              
-        if self.state == SquatState.IDLE:
-            if self.left_knee_angle>140 and self.right_knee_angle >140:
-                self.heel_anchor = np.array(left_heel)
-
-        
-            left_hip = np.array(left_hip)
-            left_heel = np.array(left_heel)
-
-            dx = left_heel[0] - left_hip[0]
-            dy = left_heel[1] - left_hip[1]
-            slope = dy / dx
-
-            #patching the angel franco office chair cheat
-            if(not (-2> slope or  slope>2)): #line from hip to ankle must be mostly vertical
-                return
-
-            if self.left_knee_angle<120 and self.right_knee_angle <120:
-                self.state=SquatState.BEGIN
-                return
-            
-        elif self.state==SquatState.BEGIN:
-            if self.heel_anchor is None:
-
-                self.state = SquatState.IDLE
-                return
-            current_heel = np.array(left_heel)
-            heel_displacement = np.linalg.norm(current_heel - self.heel_anchor)
-            if heel_displacement > 80:
-                self.state=SquatState.IDLE
-                return
-
-            if self.left_knee_angle<80 and self.right_knee_angle <80 : #80 degree squat
-                self.state = SquatState.DOWN
-                self.down_start_time = time.time()
-                return
-
-        elif self.state == SquatState.DOWN:
-            if self.left_knee_angle > 100 or self.right_knee_angle> 100: # User started rising too early
-                if (time.time() - self.down_start_time) >= 1.0:
-                    self.state =  SquatState.RISE
-                else:
-                    self.state = SquatState.RISE
-
-        elif self.state ==  SquatState.RISE:
-            if self.left_knee_angle <160  and self.right_knee_angle<160 :
-                self.count += 1
-                self.state = SquatState.IDLE
-                print(f"Count: {self.count}")
-    
-    def draw(self,image, detection_result):
-        annotated_image = image.copy()
-        if not detection_result.pose_landmarks:
-            return annotated_image
-        h, w, _ = image.shape
-
-        for pose_landmarks in detection_result.pose_landmarks:
-            def to_pixel(lm):
-                return int(lm.x * w), int(lm.y * h)
-            left_hip = to_pixel(pose_landmarks[LEFT_HIP])
-            left_knee = to_pixel(pose_landmarks[LEFT_KNEE])
-            left_ankle = to_pixel(pose_landmarks[LEFT_HEEL])
-            right_hip = to_pixel(pose_landmarks[RIGHT_HIP])
-            right_knee = to_pixel(pose_landmarks[RIGHT_KNEE])
-            right_ankle = to_pixel(pose_landmarks[RIGHT_HEEL])
-            
-            cv2.line(annotated_image, left_hip, left_ankle, (255, 0, 0), 2)
-
-            cv2.line(annotated_image, left_hip, left_knee, (0, 255, 0), 2)
-            cv2.line(annotated_image, left_knee, left_ankle, (0, 255, 0), 2)
-            cv2.line(annotated_image, right_hip, right_knee, (0, 255, 0), 2)
-            cv2.line(annotated_image, right_knee, right_ankle, (0, 255, 0), 2)
-        return annotated_image
-
-class LungeState:
-    IDLE="IDLE"
-    DESCENDING="DESCENDING" #left leg forward
-    ASCENDING="ASCENDING"
-    DOWN="DOWN"
-class LungeController:
-    def __init__(self):
-        self.state=LungeState.IDLE
-        self.count=0
-        self.leftKneeAngle=0
-        self.rightKneeAngle=0
-        self.heelToHeelDistance=0
-        self.calfLength=0 #this is a constant
-        self.idleHipHeight=0
-    
-    def update(self,detection_result, image_shape):
-        if not detection_result or not detection_result.pose_landmarks:
-            return
-        landmarks = detection_result.pose_landmarks[0] 
-        pixel_landmarks = landmarks_to_pixels(landmarks, image_shape)  
-        left_hip = pixel_landmarks[LEFT_HIP] #both share a point at knee
-        left_knee = pixel_landmarks[LEFT_KNEE]
-        left_heel = pixel_landmarks[LEFT_HEEL]
-
-        self.left_knee_angle=angleBetweenLines(left_hip,left_knee,left_heel)
-
-        right_hip = pixel_landmarks[RIGHT_HIP] #both share a point at knee
-        right_knee = pixel_landmarks[RIGHT_KNEE]
-        right_heel = pixel_landmarks[RIGHT_HEEL]
-
-        right_knee = np.array(right_knee)
-        right_heel = np.array(right_heel)
-        self.calfLength=np.linalg.norm(right_knee-right_heel) #this is a constant!!!!
-
-        self.right_knee_angle=angleBetweenLines(right_hip,right_knee,right_heel)
-
-
-        if self.state==LungeState.IDLE:
-
-            left_heel = np.array(left_heel)
-            right_heel = np.array(right_heel)
-                
-            self.heelToHeelDistance=np.linalg.norm(left_heel-right_heel) #this is a constant!!!!
-            
-            self.idleHipHeight = right_hip[1]
-
-            if(abs(self.heelToHeelDistance)> 1.3 * self.calfLength):
-
-                self.state=LungeState.DESCENDING
-                return
-            
-        elif self.state==LungeState.DESCENDING:
-            pass
-
-            left_heel = np.array(left_heel)
-            right_heel = np.array(right_heel)
-                
-            self.heelToHeelDistance=np.linalg.norm(left_heel-right_heel) 
-
-            if(abs(self.heelToHeelDistance)< 1.3 * self.calfLength):
-                self.state=LungeState.IDLE
-                return
-            rightCalfSlope = (right_knee[1]-right_heel[1])  / (right_knee[0]-right_heel[0])
-            leftCalfSlope = (left_knee[1]-right_heel[1])  / (left_knee[0]-left_heel[0])
-    
-            self.right_knee_angle=angleBetweenLines(right_hip,right_knee,right_heel)
-            self.left_knee_angle=angleBetweenLines(left_hip,left_knee,left_heel)
-            backLeg="dumb"
-            frontLeg="dummy"
-            if(abs(rightCalfSlope) <0.75 ): #if the slope of the right calf is near flat
-                frontLeg="left"
-                backLeg="right"
-            elif(abs(leftCalfSlope)<0.75):
-                frontLeg="right"
-                backLeg="left"
-
-            if( frontLeg=="right"  and self.left_knee_angle < 110):
-                self.state=LungeState.DOWN
-                return
-            elif(frontLeg=="left" and self.right_knee_angle< 110):
-                self.state=LungeState.DOWN
-                return
- 
-        if self.state==LungeState.DOWN:
-
-            left_heel = np.array(left_heel)
-            right_heel = np.array(right_heel)
-                
-            self.heelToHeelDistance=np.linalg.norm(left_heel-right_heel) #this is a constant!!!!
-            if(abs(self.heelToHeelDistance) < self.calfLength *1.3):
-                self.state=LungeState.ASCENDING
-                self.count=self.count+1
-                return
-        
-        if self.state==LungeState.ASCENDING:
-            self.right_knee_angle=angleBetweenLines(right_hip,right_knee,right_heel)
-            self.left_knee_angle=angleBetweenLines(left_hip,left_knee,left_heel)
-            if(self.right_knee_angle > 140 and self.left_knee_angle >140):
-                self.state=LungeState.IDLE
-                return
- 
-    def draw(self,image, detection_result):
-        annotated_image = image.copy()
-        if not detection_result.pose_landmarks:
-            return annotated_image
-        h, w, _ = image.shape
-
-        for pose_landmarks in detection_result.pose_landmarks:
-            def to_pixel(lm):
-                return int(lm.x * w), int(lm.y * h)
-            left_hip = to_pixel(pose_landmarks[LEFT_HIP])
-            left_knee = to_pixel(pose_landmarks[LEFT_KNEE])
-            left_ankle = to_pixel(pose_landmarks[LEFT_HEEL])
-            right_hip = to_pixel(pose_landmarks[RIGHT_HIP])
-            right_knee = to_pixel(pose_landmarks[RIGHT_KNEE])
-            right_ankle = to_pixel(pose_landmarks[RIGHT_HEEL])
-
-            left_ankle = np.array(left_ankle)
-            right_ankle = np.array(right_ankle)
-            
-            ankleToAnkleDistance=np.linalg.norm(left_ankle-right_ankle) #this is a constant!!!!
-
-            right_knee = np.array(right_knee)
-            rightCalfLength=np.linalg.norm(right_knee-right_ankle) #this is a constant!!!!
-            
-            if(abs(ankleToAnkleDistance) > 1.5 * rightCalfLength):
-                cv2.line(annotated_image, left_ankle, right_ankle, (0, 0, 255), 2)
-
-            else:
-                cv2.line(annotated_image, left_ankle, right_ankle, (0, 255, 0), 2)
-            
-            cv2.line(annotated_image, right_knee, right_ankle, (255, 0, 0), 2)
-            cv2.line(annotated_image, left_hip, left_knee, (0, 255, 0), 2)
-            cv2.line(annotated_image, left_knee, left_ankle, (0, 255, 0), 2)
-            cv2.line(annotated_image, right_hip, right_knee, (0, 255, 0), 2)
-        return annotated_image
-
-class RunningState:
-    TIMER = "TIMER"
-
-class RunningController:
-    def __init__(self):
-        self.state = RunningState.TIMER
-        self.count = 0
-
-    def update(self, detection_result,image_shape):
-        return
-
-    def draw(self, image,detection_result):
-        if image is None:
-            return None
-        # No extra drawing.
-        return image.copy()
-
-class JumpingJackState:
-    TIMER = "TIMER"
-
-class JumpingJacksController:
-    def __init__(self):
-        self.state = JumpingJackState.TIMER
-        self.count = 0
-
-    def update(self, detection_result,image_shape):
-        return
-
-    def draw(self,  image,detection_result):
-        if image is None:
-            return None
-        return image.copy()
-
-class GluteBridgeState():
-    IDLE = "IDLE"
-    UP = "UP"
-
-class GluteBridgeController():
-    def __init__(self):
-        self.state = GluteBridgeState.IDLE
-        self.count = 0
-        self.hipAngle = 0
-        self.kneeAngle = 0
-        self.is_lying_down = False
-    def update(self, detection_result, image_shape):
-        if not detection_result or not detection_result.pose_landmarks:
-            return
-        landmarks = detection_result.pose_landmarks[0]
-        pixel_landmarks = landmarks_to_pixels(landmarks, image_shape)
-
-        shoulder = pixel_landmarks[RIGHT_SHOULDER]
-        hip = pixel_landmarks[RIGHT_HIP]
-        knee = pixel_landmarks[RIGHT_KNEE]
-        ankle = pixel_landmarks[RIGHT_HEEL]
-
-        dx = abs(hip[0] - shoulder[0])
-        dy = abs(hip[1] - shoulder[1])
-
-        if dy > dx:
-            self.is_lying_down = False
-            return
-        else:
-            self.is_lying_down = True
-
-        self.knee_angle = angleBetweenLines(hip, knee, ankle)
-        self.hip_angle = angleBetweenLines(shoulder, hip, knee)
-
-        if self.knee_angle > 135:
-            return
-
-        if self.state == GluteBridgeState.IDLE:
-            if self.hip_angle > 165:
-                self.state = GluteBridgeState.UP
-        elif self.state == GluteBridgeState.UP:
-            if self.hip_angle < 140:
-                self.count+=1
-                self.state = GluteBridgeState.IDLE
-
-    def draw(self,image, detection_result):
-        annotated_image = image.copy()
-        if not detection_result.pose_landmarks:
-            return annotated_image
-        h, w, _ = image.shape
-        for pose_landmarks in detection_result.pose_landmarks:
-            def to_pixel(lm):
-                return int(lm.x * w), int(lm.y * h)
-
-            shoulder = to_pixel(pose_landmarks[RIGHT_SHOULDER])
-            hip = to_pixel(pose_landmarks[RIGHT_HIP])
-            knee = to_pixel(pose_landmarks[RIGHT_KNEE])
-            ankle = to_pixel(pose_landmarks[RIGHT_HEEL])
-
-            cv2.line(annotated_image, shoulder, hip, (0, 255, 0), 4)
-            cv2.line(annotated_image, hip, knee, (0, 0, 255), 4)
-            cv2.line(annotated_image, knee, ankle, (255, 0, 0), 4)
-            
-            cv2.circle(annotated_image, hip, 6, (255, 255, 255), -1)
-            cv2.circle(annotated_image, knee, 6, (255, 255, 255), -1)
-            cv2.circle(annotated_image, ankle, 6, (0, 255, 255), -1)
-            
-        return annotated_image
-
-
-class SupermanState:
-    IDLE = "IDLE"
-    UP = "UP"
-
-class SupermanController:
-    def __init__(self):
-        self.state = SupermanState.IDLE
-        self.count = 0
-        self.angle = 0
-    def update(self,detection_result, image_shape):
-        if not detection_result or not detection_result.pose_landmarks:
-            return
-            
-        landmarks = detection_result.pose_landmarks[0]
-        pixel_landmarks = landmarks_to_pixels(landmarks, image_shape)
-        
-        shoulder = pixel_landmarks[RIGHT_SHOULDER]
-        hip = pixel_landmarks[RIGHT_HIP]
-        knee = pixel_landmarks[RIGHT_KNEE]
-        
-        self.back_angle = angleBetweenLines(shoulder, hip, knee)
-        
-        if self.state == SupermanState.IDLE:
-            if self.back_angle < 165:
-                self.state = SupermanState.UP
-                
-        elif self.state == SupermanState.UP:
-            if self.back_angle > 175:
-                self.count += 1
-                self.state = SupermanState.IDLE
-    def draw(self, image, detection_result):
-        annotated_image = image.copy()
-        if not detection_result.pose_landmarks:
-            return annotated_image
-        h, w, _ = image.shape
-
-        for pose_landmarks in detection_result.pose_landmarks:
-            def to_pixel(lm):
-                return int(lm.x * w), int(lm.y * h)
-            
-            shoulder = to_pixel(pose_landmarks[RIGHT_SHOULDER])
-            hip = to_pixel(pose_landmarks[RIGHT_HIP])
-            knee = to_pixel(pose_landmarks[RIGHT_KNEE])
-            
-            color = (0, 255, 0) if self.state == GluteBridgeState.UP else (0, 0, 255)
-            
-            cv2.line(annotated_image, shoulder, hip, color, 4)
-            cv2.line(annotated_image, hip, knee, color, 4)
-        return annotated_image
-
-class PushUpState:
-    IDLE = "IDLE"
-    DOWN = "DOWN"
-
-class PushUpController:
-    def __init__(self):
-        self.state = PushUpState.IDLE
-        self.count = 0
-    def update(self, detection_result, image_shape):
-        if not detection_result or not detection_result.pose_landmarks:
-            return
-        landmarks = detection_result.pose_landmarks[0] 
-        pixel_landmarks = landmarks_to_pixels(landmarks, image_shape)
-
-        shoulder = pixel_landmarks[RIGHT_SHOULDER]
-        elbow = pixel_landmarks[RIGHT_ELBOW]
-        wrist = pixel_landmarks[RIGHT_WRIST]
-        hip = pixel_landmarks[RIGHT_HIP]
-        knee = pixel_landmarks[RIGHT_KNEE]
-
-        self.elbow_angle = angleBetweenLines(shoulder, elbow, wrist)
-        self.body_alignment = angleBetweenLines(shoulder, hip, knee)
-
-        if self.state == PushUpState.IDLE:
-            if self.elbow_angle < 85 and self.body_alignment > 150:
-                self.state = PushUpState.DOWN
-        elif self.state == PushUpState.DOWN:
-            if self.elbow_angle > 160:
-                self.count += 1
-                self.state = PushUpState.IDLE
-    def draw(self, image, detection_result):
-        annotated_image = image.copy()
-        if not detection_result.pose_landmarks:
-            return annotated_image
-        h, w, _ = image.shape
-
-        for pose_landmarks in detection_result.pose_landmarks:
-            def to_pixel(lm):
-                return int(lm.x * w), int(lm.y * h)
-            
-            shoulder = to_pixel(pose_landmarks[RIGHT_SHOULDER])
-            elbow = to_pixel(pose_landmarks[RIGHT_ELBOW])
-            wrist = to_pixel(pose_landmarks[RIGHT_WRIST])
-            hip = to_pixel(pose_landmarks[RIGHT_HIP])
-
-            color = (0, 255, 0) if self.state == PushUpState.DOWN else (0, 0, 255)
-            
-
-            cv2.line(annotated_image, shoulder, elbow, color, 4)
-            cv2.line(annotated_image, elbow, wrist, color, 4)
-            cv2.line(annotated_image, shoulder, hip, (255, 255, 0), 2)
-        return annotated_image
-
-
 sitUpController = SitUpController()
 squatController = SquatController()
 lungeController = LungeController()
 runningController = RunningController()
 jumpingjacksController = JumpingJacksController()
-pushupController = PushUpController()
-
-class ExerciseManager():
-    def __init__(self):
-        self.exercises={"squats": SquatController(), "situps" : SitUpController(), "lunges" : LungeController(), "running" : RunningController(), "jumpingjacks" : JumpingJacksController(), "pushups": PushUpController()}
-    
-        self.currentExercise="pushups"
-    def getCurrentExercise(self):
-        return self.exercises[self.currentExercise]
-    def setCurrentExercise(self,exerciseName):
-        self.currentExercise=exerciseName
-
-
+pushupController = EXERCISE_CONTROLLERS["pushups"]()
 
 
 @app.route('/switch_exercise',methods=["POST"])
@@ -675,7 +134,10 @@ def switch_exercise():
     currentUser= loggedInUsers[user_id]
     data = request.get_json()
     new_exercise = data.get('exercise')
+    if new_exercise not in EXERCISE_CONTROLLERS:
+        return jsonify(status="error", message="unknown exercise"), 400
     currentUser.exerciseManager.setCurrentExercise(new_exercise)
+    push_exercise_update(currentUser)
     return jsonify(status="success", now_doing=new_exercise)
 
 @app.route('/get_exercise_data')
@@ -685,40 +147,218 @@ def get_exercise_data():
         return
     currentUser= loggedInUsers[user_id]
 
-    currentExerciseObject=currentUser.exerciseManager.getCurrentExercise()
-    return jsonify(
-        currentExercise=currentUser.exerciseManager.currentExercise,
-        count=currentExerciseObject.count,
-        state=currentExerciseObject.state,
-    )
+    return jsonify(exercise_status(currentUser))
 
+# one camera, a whole group: {"people": n} tracks and counts up to n people, 0 or 1 goes
+# back to counting just the one person
+@app.route('/group_mode', methods=["POST"])
+def group_mode():
+    user_id = session.get('user_id')
+    if not user_id in loggedInUsers:
+        return jsonify(status="error"), 401
+    currentUser = loggedInUsers[user_id]
+    data = request.get_json(silent=True) or {}
+    try:
+        people = int(data.get('people', 0))
+    except (TypeError, ValueError):
+        return jsonify(status="error", message="people must be a number"), 400
+    people = max(0, min(people, 8))
+    currentUser.group = PoseTracker(max_people=people) if people > 1 else None
+    push_exercise_update(currentUser)
+    return jsonify(status="success", people=people if people > 1 else 1)
+
+# server-sent events version of /get_exercise_data, one message every time the count or
+# state changes. the page falls back to polling if this does not work
+@app.route('/exercise_events')
+def exercise_events_stream():
+    user_id = session.get('user_id')
+    if not user_id in loggedInUsers:
+        return Response(status=401)
+    currentUser = loggedInUsers[user_id]
+    q = exercise_events.subscribe(user_id)
 
-def generate_frames(user_id):
+    def stream():
+        try:
+            #send where we are right now so the page does not wait for the next rep
+            yield f"data: {json.dumps(exercise_status(currentUser))}\n\n"
+            while True:
+                try:
+                    event = q.get(timeout=15)
+                except queue.Empty:
+                    if not loggedInUsers.touch(user_id):
+                        break #logged out or evicted
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"data: {json.dumps(event)}\n\n"
+        finally:
+            exercise_events.unsubscribe(user_id, q)
+
+    return Response(stream(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+def generate_frames(user_id, remote=False):
     if not user_id in loggedInUsers:
         return
     currentUser= loggedInUsers[user_id]
 
-    
+    hub = currentUser.upload_hub or vision.build()
+    viewer = hub.subscribe(currentUser, remote)
+    seq = 0
+    touched = time.monotonic()
+    try:
+        while True:
+            seq, frame_bytes = viewer.wait(seq)
+            if time.monotonic() - touched > 10.0:
+                #a workout that is only watched is not an idle session
+                touched = time.monotonic()
+                loggedInUsers.touch(user_id)
+            if frame_bytes is None:
+                if viewer.closed:
+                    break
+                continue
+            yield (b'--frame\r\n'
+                b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
+    finally:
+        hub.unsubscribe(viewer)
 
-    global camera
-    while True:
+# -------------------------
+# Browser webcam upload
+# -------------------------
 
-        success, frame = camera.read()
-        if frame is None:
-            continue
-        if not success:
-            break
+# the page can send its own webcam frames instead of using the server's camera. every
+# uploading user gets a FrameHub of their own, fed by an UploadSource
+MAX_UPLOAD_BYTES = 2 * 1024 * 1024
+
+def start_upload(user):
+    if user.upload_source is not None and not user.upload_source.running:
+        #stopped itself after the browser went quiet, this is a new upload
+        stop_upload(user)
+    if user.upload_hub is None:
+        user.upload_source = UploadSource()
+        user.upload_hub = vision.new_hub(user.upload_source)
+        #counting moves over from the server camera, a reloaded /webcam_feed picks up the new hub
+        vision.close_user(user.user_ID)
+        user.upload_hub.add_user(user)
+    return user.upload_source
+
+def stop_upload(user):
+    hub, source = user.upload_hub, user.upload_source
+    user.upload_hub = None
+    user.upload_source = None
+    if source is not None:
+        source.stop()
+    if hub is not None:
+        hub.close()
+
+# body is one jpeg. the page waits for the answer before sending the next frame, and
+# frames that arrive faster than detection runs are dropped here, never queued
+@app.route('/upload_frame', methods=['POST'])
+def upload_frame():
+    user_id = session.get('user_id')
+    if not user_id in loggedInUsers:
+        return jsonify(status="error"), 401
+    currentUser = loggedInUsers[user_id]
+    if request.content_length is not None and request.content_length > MAX_UPLOAD_BYTES:
+        return jsonify(status="error", message="frame too large"), 413
+    jpeg = request.get_data(cache=False)
+    if not jpeg:
+        return jsonify(status="error", message="empty frame"), 400
+    if len(jpeg) > MAX_UPLOAD_BYTES:
+        return jsonify(status="error", message="frame too large"), 413
+
+    source = start_upload(currentUser)
+    source.push(jpeg)
+    return jsonify(status="success", dropped=source.dropped_frames)
 
-        mp_image = mp.Image(image_format=mp.ImageFormat.SRGB, data=frame)
-        currentUser.latest_detection = detector.detect(mp_image)     
-        currentUser.currentExercise = currentUser.exerciseManager.getCurrentExercise()
-        currentUser.currentExercise.update(currentUser.latest_detection, frame.shape)
+# -------------------------
+# Browser side pose estimation
+# -------------------------
 
-        annotated_image = currentUser.currentExercise.draw(frame, currentUser.latest_detection)
-        ret, buffer = cv2.imencode('.jpg', annotated_image)
-        frame_bytes = buffer.tobytes()
-        yield (b'--frame\r\n'
-            b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
+# the page can also run the pose model itself and send only the landmarks (see
+# packets.py). the server then just runs the controllers, no camera and no inference
+MAX_LANDMARK_PACKETS = 64
+
+@app.route('/landmarks', methods=['POST'])
+def receive_landmarks():
+    user_id = session.get('user_id')
+    if not user_id in loggedInUsers:
+        return jsonify(status="error"), 401
+    currentUser = loggedInUsers[user_id]
+    if request.content_length is not None and request.content_length > MAX_LANDMARK_PACKETS * PACKET_SIZE:
+        return jsonify(status="error", message="too many packets"), 413
+    data = request.get_data(cache=False)
+
+    receiver = currentUser.landmark_receiver
+    if receiver is None:
+        receiver = currentUser.landmark_receiver = LandmarkReceiver()
+        #counting moves over to the browser's landmarks
+        vision.close_user(user_id)
+        stop_upload(currentUser)
+    if currentUser.workout_log.session_id is None:
+        #a client of its own, without the workout page to open the session
+        start_workout_log(currentUser)
+
+    try:
+        for timestamp, pose, frame_shape in receiver.packets(data):
+            controller = currentUser.exerciseManager.getCurrentExercise()
+            start = time.perf_counter()
+            controller.update(pose, frame_shape, timestamp)
+            currentUser.metrics.observe("update", time.perf_counter() - start)
+            currentUser.metrics.updates.tick()
+    except PacketError as error:
+        return jsonify(status="error", message=str(error)), 400
+    push_exercise_update(currentUser)
+    return jsonify(status="success")
+
+@app.route('/upload_stop', methods=['POST'])
+def upload_stop():
+    user_id = session.get('user_id')
+    if not user_id in loggedInUsers:
+        return jsonify(status="error"), 401
+    stop_upload(loggedInUsers[user_id])
+    return jsonify(status="success")
+
+# readiness probe for the vision side: 200 once the pose model has run, 503 while it is
+# still loading (or failed, see error)
+@app.route('/vision_status')
+def vision_status():
+    status = vision.status()
+    return jsonify(status), 200 if status["ready"] else 503
+
+# frame pipeline telemetry per logged in user plus process wide numbers. it names users
+# and their sessions, so it is for the operators only: with FITCOMPASS_METRICS_TOKEN set
+# the request needs "Authorization: Bearer <token>", without it only localhost may ask
+METRICS_TOKEN = os.environ.get("FITCOMPASS_METRICS_TOKEN")
+
+def metrics_allowed():
+    if METRICS_TOKEN:
+        #a reverse proxy makes every request local, so a configured token is always required
+        return hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {METRICS_TOKEN}")
+    return request.remote_addr in ("127.0.0.1", "::1")
+
+@app.route('/metrics')
+def metrics():
+    if not metrics_allowed():
+        return jsonify(status="error"), 403
+    users = {}
+    for user_id, user in list(loggedInUsers.items()):
+        entry = user.metrics.snapshot()
+        entry.update(exercise_status(user))
+        hub, source = user.upload_hub, user.upload_source
+        if hub is not None and source is not None:
+            entry.update(upload=source.stats(), hub=hub.stats())
+        if user.landmark_receiver is not None:
+            entry.update(landmarks=user.landmark_receiver.stats())
+        users[str(user_id)] = entry
+
+    return jsonify(
+        process=dict(process_memory(), logged_in_users=len(loggedInUsers)),
+        sessions=loggedInUsers.stats(),
+        database=database.stats(),
+        history=workout_history.stats(),
+        vision=vision.stats(),
+        users=users,
+    )
 
 # -------------------------
 # Login
@@ -735,6 +375,9 @@ def reset_stats():
     
     current_ex_obj.count = 0
     current_ex_obj.state = "IDLE" 
+    if currentUser.group is not None:
+        currentUser.group.reset()
+    push_exercise_update(currentUser)
     
     return jsonify({
         "status": "success", 
@@ -747,17 +390,13 @@ def login():
         username = request.form['username']
         raw_password = request.form['password']
 
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT id, password FROM UserLogins WHERE username=?", (username,))
-        user = cursor.fetchone()
-        conn.close()
+        user = database.find_login(username)
 
         if user and check_password_hash(user["password"], raw_password):
             session['user_id'] = user["id"]
             session['username'] = username
 
-            loggedInUsers.update({user["id"]: User(user["id"])})
+            loggedInUsers.add(user["id"], User(user["id"]))
 
             return redirect(url_for('home'))
 
@@ -782,26 +421,12 @@ def register():
         body_part = request.form.get('body_part')
 
         try:
-            conn = get_db_connection()
-            cursor = conn.cursor()
-
             # Insert user
-            cursor.execute(
-                """
-                INSERT INTO UserLogins (username, email, password, goal, goal_other, workouts_per_week, body_part)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-                """,
-                (username, email, password, goal, goal_other, workouts_per_week, body_part)
-            )
-            user_id = cursor.lastrowid
-
-            conn.commit()
-            conn.close()
+            user_id = database.add_user(username, email, password, goal, goal_other, workouts_per_week, body_part)
 
             return redirect(url_for('login'))
 
         except sqlite3.IntegrityError:
-            conn.close()
             flash("Username or email already exists")
             return redirect(url_for('register'))
 
@@ -827,12 +452,39 @@ def home():
 def workoutSession():
     squat_count=0
     knee_angle=0
+    #loads the model while the page and the user get ready, /vision_status says when it is done
+    vision.warm_up()
+    user_id = session.get('user_id')
+    if user_id in loggedInUsers:
+        start_workout_log(loggedInUsers[user_id])
 
     return render_template("workoutSession.html",squat_count=squat_count,knee_angle=knee_angle)
 
+# this week's plan for the logged in user, as json. plans are made for everybody at once
+# (python workout_plans.py), a user without one gets theirs made and stored on the first
+# request. after that it is only read, never generated again that week
+@app.route('/weekly_plan')
+def weekly_plan():
+    user_id = session.get('user_id')
+    if user_id is None:
+        return jsonify(status="error"), 401
+    week = current_week()
+    plan = database.find_plan(user_id, week)
+    if plan is None:
+        user = database.find_plan_user(user_id)
+        if user is None:
+            return jsonify(status="error"), 404
+        row = plan_row(user_id, plan_for_user(user_id, user["goal"], user["workouts_per_week"], week))
+        database.save_plans([row])
+        plan = row[4]
+    #stored as json already, no need to parse it just to serialize it again
+    return Response(plan, mimetype='application/json', headers={'Cache-Control': 'private, max-age=300'})
+
 @app.route('/workoutcomplete')
 def workoutcomplete():
-
+    user_id = session.get('user_id')
+    if user_id in loggedInUsers:
+        loggedInUsers[user_id].workout_log.end()
 
     return render_template("workoutcomplete.html")
 
@@ -846,7 +498,13 @@ def profile():
 
 @app.route('/history')
 def history():
-    return render_template("workoutLog.html")
+    if 'user_id' not in session:
+        return redirect(url_for('login'))
+    #keyset pagination, ?before=<id of the last workout shown> is the next page
+    before = request.args.get('before', type=int)
+    workouts = workout_history.page(session['user_id'], before, HISTORY_PAGE_SIZE)
+    older = workouts[-1]["id"] if len(workouts) == HISTORY_PAGE_SIZE else None
+    return render_template("workoutLog.html", workouts=workouts, older=older)
 
 @app.route('/library')
 def library():
@@ -862,6 +520,7 @@ def settings():
 
 @app.route('/logout')
 def logout():
+    loggedInUsers.pop(session.get('user_id'))
     session.clear()
     return redirect(url_for('login'))
 
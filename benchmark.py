@@ -0,0 +1,264 @@
+# benchmark of the per-frame hot path, one stage at a time, without a webcam.
+#
+#   python benchmark.py                               synthetic frames and landmarks
+#   python benchmark.py --trace traces/squat.fctrace  real recorded landmark sequences
+#   python benchmark.py --video clips/squat.mp4       also time capture from a file
+#   python benchmark.py --output bench.json --compare baseline.json
+#
+# every stage reports per-call latency and the peak memory allocated by one call.
+# with --compare the run fails if a stage got slower (or allocates more) than the
+# baseline by more than --tolerance
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+import types
+
+import cv2
+import numpy as np
+
+from encoder import AdaptiveJpegStream, LOCAL_PREVIEW
+from exercises import EXERCISE_CONTROLLERS
+from motion import MotionEstimator
+from pose_frame import landmarks_to_frame, new_pose_frame, NUM_LANDMARKS
+from pose_trace import PoseTrace
+from preprocess import PosePreprocessor
+from smoothing import OneEuroFilter
+from landmarks import *
+
+
+def synthetic_frames(count, shape=(720, 1280, 3), seed=0):
+    # a noisy background with a block moving across it, so motion and jpeg are not trivial
+    rng = np.random.default_rng(seed)
+    background = rng.integers(0, 255, shape, dtype=np.uint8)
+    frames = []
+    for i in range(count):
+        frame = background.copy()
+        x = (i * 17) % (shape[1] - 200)
+        frame[200:500, x:x + 200] = (40, 180, 90)
+        frames.append(frame)
+    return frames
+
+
+def synthetic_poses(count, shape=(720, 1280, 3), seed=0):
+    # a standing skeleton whose knees and elbows bend back and forth, in pixels
+    rng = np.random.default_rng(seed)
+    h, w = shape[:2]
+    base = new_pose_frame()
+    base[:, 0] = w * 0.5 + rng.normal(0, w * 0.05, NUM_LANDMARKS)
+    base[:, 1] = np.linspace(h * 0.1, h * 0.9, NUM_LANDMARKS)
+    base[:, 3] = 0.9
+    poses = np.repeat(base[None], count, axis=0)
+    phase = np.sin(np.linspace(0, 12 * np.pi, count)).astype(np.float32)
+    for joint in (LEFT_KNEE, RIGHT_KNEE, LEFT_ELBOW, RIGHT_ELBOW):
+        poses[:, joint, 0] += phase * w * 0.08
+    return poses
+
+
+def as_landmarks(pose, shape):
+    # what mediapipe hands back: normalized objects with x, y, z and visibility
+    h, w = shape[:2]
+    return [types.SimpleNamespace(x=float(p[0]) / w, y=float(p[1]) / h, z=float(p[2]), visibility=float(p[3]))
+            for p in pose]
+
+
+# times fn(i) for i in range(calls) and then measures the peak allocation of one call
+def measure(fn, calls, alloc_calls=20):
+    timings = np.empty(calls, dtype=np.float64)
+    for i in range(calls):
+        start = time.perf_counter()
+        fn(i)
+        timings[i] = time.perf_counter() - start
+
+    tracemalloc.start()
+    peak = 0
+    for i in range(min(alloc_calls, calls)):
+        tracemalloc.reset_peak()
+        current, _ = tracemalloc.get_traced_memory()
+        fn(i)
+        peak = max(peak, tracemalloc.get_traced_memory()[1] - current)
+    tracemalloc.stop()
+
+    mean = float(timings.mean())
+    return {
+        "calls": calls,
+        "mean_us": round(mean * 1e6, 2),
+        "p50_us": round(float(np.percentile(timings, 50)) * 1e6, 2),
+        "p95_us": round(float(np.percentile(timings, 95)) * 1e6, 2),
+        "max_fps": round(1.0 / mean, 1) if mean > 0 else None,
+        "peak_alloc_bytes": int(peak),
+    }
+
+
+def bench_capture(video_path, calls):
+    from camera import FrameGrabber
+    grabber = FrameGrabber(video_path)
+    last = {"seq": 0}
+
+    def read(i):
+        seq, timestamp, frame = grabber.read_latest(last["seq"])
+        if frame is not None:
+            last["seq"] = seq
+
+    try:
+        return measure(read, calls)
+    finally:
+        grabber.release()
+
+
+def bench_detect(frames, calls):
+    from detectors import DEFAULT_PROFILE, PoseStream, VisionRunningMode, model_asset_path
+    if not os.path.exists(model_asset_path(DEFAULT_PROFILE.model)):
+        return None
+    stream = PoseStream(DEFAULT_PROFILE, VisionRunningMode.VIDEO)
+    rgb = [cv2.cvtColor(frame, cv2.COLOR_BGR2RGB) for frame in frames]
+    clock = {"t": 0.0}
+
+    def detect(i):
+        clock["t"] += 1 / 30
+        stream.submit(rgb[i % len(rgb)], clock["t"])
+
+    try:
+        return measure(detect, calls)
+    finally:
+        stream.close()
+
+
+def run(args):
+    shape = (args.height, args.width, 3)
+    frames = synthetic_frames(args.frames, shape)
+    if args.trace:
+        trace = PoseTrace(args.trace)
+        poses = np.array(trace.poses[trace.has_pose])
+        shape = trace.frame_shape
+        frames = synthetic_frames(args.frames, shape)
+    else:
+        poses = synthetic_poses(max(args.calls, 1), shape)
+    landmark_lists = [as_landmarks(poses[i], shape) for i in range(min(len(poses), 200))]
+    calls = args.calls
+
+    stages = {}
+    if args.video:
+        stages["capture"] = bench_capture(args.video, calls)
+
+    motion = MotionEstimator()
+    stages["motion"] = measure(lambda i: motion.estimate(frames[i % len(frames)]), calls)
+
+    preprocessor = PosePreprocessor()
+    stages["preprocess_full_frame"] = measure(lambda i: preprocessor.prepare(frames[i % len(frames)]), calls)
+    preprocessor.update(poses[0], shape)
+    stages["preprocess_crop"] = measure(lambda i: preprocessor.prepare(frames[i % len(frames)]), calls)
+
+    detect = bench_detect(frames, min(calls, 200))
+    stages["detect"] = detect if detect is not None else "skipped, no pose_landmarker model on disk"
+
+    pose_buffer = new_pose_frame()
+    stages["landmarks_to_frame"] = measure(
+        lambda i: landmarks_to_frame(landmark_lists[i % len(landmark_lists)], shape, pose_buffer), calls)
+
+    smoother = OneEuroFilter()
+    smoothed = new_pose_frame()
+
+    def smooth(i):
+        np.copyto(smoothed, poses[i % len(poses)])
+        smoother.filter(smoothed, i / 30)
+
+    stages["smoothing"] = measure(smooth, calls)
+
+    jpeg = AdaptiveJpegStream(LOCAL_PREVIEW)
+    stages["encode"] = measure(lambda i: jpeg.encode(frames[i % len(frames)]), min(calls, 300))
+
+    controllers = {}
+    canvas = frames[0].copy()
+    for name, controller_class in EXERCISE_CONTROLLERS.items():
+        controller = controller_class()
+        update = measure(lambda i: controller.update(poses[i % len(poses)], shape, i / 30), calls)
+        draw = measure(lambda i: controller.draw(canvas, poses[i % len(poses)]), calls)
+        #spec based exercises all share SpecController, so those go by exercise name
+        label = controller_class.__name__ if isinstance(controller_class, type) else name
+        controllers[label] = {"exercise": name, "update": update, "draw": draw}
+
+    return {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+        "machine": platform.machine(),
+        "frame_shape": list(shape),
+        "landmarks": "trace" if args.trace else "synthetic",
+        "stages": stages,
+        "controllers": controllers,
+    }
+
+
+def flatten(results):
+    flat = {}
+    for name, stage in results["stages"].items():
+        if isinstance(stage, dict):
+            flat[name] = stage
+    for name, controller in results["controllers"].items():
+        flat[f"{name}.update"] = controller["update"]
+        flat[f"{name}.draw"] = controller["draw"]
+    return flat
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    current = flatten(results)
+    for name, before in flatten(baseline).items():
+        now = current.get(name)
+        if now is None:
+            continue
+        if now["p50_us"] > before["p50_us"] * (1 + tolerance):
+            regressions.append(f"{name}: p50 {before['p50_us']}us -> {now['p50_us']}us")
+        if now["peak_alloc_bytes"] > before["peak_alloc_bytes"] * (1 + tolerance) + 1024:
+            regressions.append(f"{name}: alloc {before['peak_alloc_bytes']}B -> {now['peak_alloc_bytes']}B")
+    return regressions
+
+
+def print_results(results):
+    print(f"{'stage':40s} {'p50 us':>10s} {'p95 us':>10s} {'max fps':>10s} {'alloc B':>10s}")
+    for name, stage in flatten(results).items():
+        print(f"{name:40s} {stage['p50_us']:10.1f} {stage['p95_us']:10.1f} {stage['max_fps'] or 0:10.1f} "
+              f"{stage['peak_alloc_bytes']:10d}")
+    for name, stage in results["stages"].items():
+        if not isinstance(stage, dict):
+            print(f"{name:40s} {stage}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time each stage of the per-frame pipeline.")
+    parser.add_argument("--calls", type=int, default=500, help="calls per stage")
+    parser.add_argument("--frames", type=int, default=30, help="distinct synthetic frames to cycle through")
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--trace", help="pose trace to take landmark sequences from instead of synthetic ones")
+    parser.add_argument("--video", help="video file to time frame capture with")
+    parser.add_argument("--output", help="write the results as json here")
+    parser.add_argument("--compare", help="baseline json from an earlier --output run")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown before --compare fails")
+    args = parser.parse_args(argv)
+
+    results = run(args)
+    print_results(results)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            baseline = json.load(file)
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,117 @@
+import threading
+import time
+from collections import deque
+
+import cv2
+
+
+# owns the VideoCapture on its own thread so a slow detect() never backs up the
+# V4L buffer. consumers always get the newest frame, anything older is dropped.
+# if the camera cannot be opened or stops delivering (busy, unplugged, not there yet) it
+# is released and opened again, waiting retry_min doubling up to retry_max seconds in
+# between so a missing camera is not hammered
+class FrameGrabber:
+    def __init__(self, device=0, ring_size=3, retry_min=0.5, retry_max=10.0):
+        self.device = device
+        self.retry_min = retry_min
+        self.retry_max = retry_max
+        self.capture = None #opened on start(), so importing the app does not grab the camera
+        self.ring = deque(maxlen=ring_size) #(seq, timestamp, frame)
+        self.seq = 0
+        self.last_read_seq = 0
+        self.captured_frames = 0
+        self.dropped_frames = 0
+        self.running = False
+        self.failed = False #the last open or read failed, retrying
+        self.reopens = 0
+        self.thread = None
+        self.condition = threading.Condition()
+
+    def start(self):
+        with self.condition:
+            if self.running:
+                return self
+            self.running = True
+        self.thread = threading.Thread(target=self._capture_loop, name="FrameGrabber", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        if self.thread is not None:
+            self.thread.join(timeout=1.0)
+            self.thread = None
+
+    def release(self):
+        self.stop()
+        if self.capture is not None:
+            self.capture.release()
+            self.capture = None
+
+    def _capture_loop(self):
+        retry = self.retry_min
+        while self.running:
+            if self.capture is None:
+                self.capture = cv2.VideoCapture(self.device)
+            success, frame = self.capture.read()
+            timestamp = time.monotonic()
+            if not success or frame is None:
+                #drop the dead handle, the next pass opens the device again
+                self.capture.release()
+                self.capture = None
+                with self.condition:
+                    self.failed = True
+                    self.reopens += 1
+                    self.condition.wait_for(lambda: not self.running, retry)
+                retry = min(retry * 2, self.retry_max)
+                continue
+            retry = self.retry_min
+
+            with self.condition:
+                self.failed = False
+                self.seq += 1
+                self.captured_frames += 1
+                self.ring.append((self.seq, timestamp, frame))
+                self.condition.notify_all()
+
+    def read_latest(self, after_seq=0, timeout=1.0):
+        # blocks until there is a frame newer than after_seq, returns (seq, timestamp, frame)
+        # or (None, None, None) if the camera stopped or nothing arrived in time. while
+        # the camera is failing this just times out, the capture thread keeps retrying
+        if not self.running:
+            self.start()
+
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            while not self.ring or self.ring[-1][0] <= after_seq:
+                if not self.running:
+                    return None, None, None
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None, None, None
+                self.condition.wait(remaining)
+
+            seq, timestamp, frame = self.ring[-1]
+            if seq > self.last_read_seq:
+                #every frame between the last one we handed out and this one was never used
+                self.dropped_frames += max(0, seq - self.last_read_seq - 1)
+                self.last_read_seq = seq
+            return seq, timestamp, frame
+
+    def read(self):
+        # cv2.VideoCapture compatible
+        seq, timestamp, frame = self.read_latest(self.last_read_seq)
+        return frame is not None, frame
+
+    def stats(self):
+        with self.condition:
+            return {
+                "captured": self.captured_frames,
+                "dropped": self.dropped_frames,
+                "buffered": len(self.ring),
+                "running": self.running,
+                "failed": self.failed,
+                "reopens": self.reopens,
+            }
@@ -0,0 +1,255 @@
+# sqlite access for the web tier. connections are opened once and lent out from a small
+# pool (werkzeug starts a thread per request, so one connection per thread would mean
+# one per request), every one set up with the pragmas below. the statements are module
+# level strings so each connection's statement cache (cached_statements) prepares them
+# once and reuses them afterwards.
+#
+# the schema lives in MIGRATIONS, applied in order on the first connection. PRAGMA
+# user_version records how many have run, so adding a table is adding an entry at the end
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+PRAGMAS = (
+    "PRAGMA synchronous=NORMAL", #safe with WAL, a commit no longer waits for an fsync
+    "PRAGMA cache_size=-8000", #8 MB page cache per connection
+    "PRAGMA mmap_size=67108864", #reads come straight from the mapped file
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA foreign_keys=ON",
+)
+
+MIGRATIONS = [
+    #1: the original user table
+    """
+    CREATE TABLE IF NOT EXISTS UserLogins(
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT UNIQUE NOT NULL,
+        email TEXT UNIQUE NOT NULL,
+        password TEXT NOT NULL,
+        goal TEXT,
+        goal_other TEXT,
+        workouts_per_week INTEGER,
+        body_part TEXT
+    )
+    """,
+    #2: workout history. sets and reps are keyed by the session and a per-session set
+    #number the app hands out, so they can be written in batches without asking for ids
+    """
+    CREATE TABLE WorkoutSessions(
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL REFERENCES UserLogins(id),
+        started_at REAL NOT NULL,
+        ended_at REAL,
+        total_reps INTEGER NOT NULL DEFAULT 0
+    );
+    CREATE INDEX WorkoutSessions_by_user ON WorkoutSessions(user_id, id) WHERE total_reps > 0;
+    CREATE TABLE WorkoutSets(
+        session_id INTEGER NOT NULL REFERENCES WorkoutSessions(id),
+        set_no INTEGER NOT NULL,
+        exercise TEXT NOT NULL,
+        started_at REAL NOT NULL,
+        ended_at REAL NOT NULL,
+        reps INTEGER NOT NULL,
+        PRIMARY KEY (session_id, set_no)
+    ) WITHOUT ROWID;
+    CREATE TABLE RepEvents(
+        session_id INTEGER NOT NULL,
+        set_no INTEGER NOT NULL,
+        rep INTEGER NOT NULL,
+        at REAL NOT NULL,
+        PRIMARY KEY (session_id, set_no, rep),
+        FOREIGN KEY (session_id, set_no) REFERENCES WorkoutSets(session_id, set_no)
+    ) WITHOUT ROWID
+    """,
+    #3: each user's generated plan per ISO week, plan is WorkoutPlan.to_dict() as json
+    """
+    CREATE TABLE WorkoutPlans(
+        user_id INTEGER NOT NULL REFERENCES UserLogins(id),
+        week TEXT NOT NULL,
+        kind TEXT NOT NULL,
+        seed INTEGER NOT NULL,
+        plan TEXT NOT NULL,
+        created_at REAL NOT NULL,
+        PRIMARY KEY (user_id, week)
+    ) WITHOUT ROWID
+    """,
+    #4: timed holds (plank) are seconds held, not reps. the log lists sessions with either
+    """
+    ALTER TABLE WorkoutSets ADD COLUMN held_seconds INTEGER NOT NULL DEFAULT 0;
+    ALTER TABLE WorkoutSessions ADD COLUMN held_seconds INTEGER NOT NULL DEFAULT 0;
+    DROP INDEX WorkoutSessions_by_user;
+    CREATE INDEX WorkoutSessions_by_user ON WorkoutSessions(user_id, id) WHERE (total_reps > 0 OR held_seconds > 0)
+    """,
+]
+
+FIND_LOGIN = "SELECT id, password FROM UserLogins WHERE username=?"
+INSERT_USER = """
+INSERT INTO UserLogins (username, email, password, goal, goal_other, workouts_per_week, body_part)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+
+FIND_PLAN_USER = "SELECT id, goal, workouts_per_week FROM UserLogins WHERE id=?"
+ALL_PLAN_USERS = "SELECT id, goal, workouts_per_week FROM UserLogins ORDER BY id"
+UPSERT_PLAN = """
+INSERT INTO WorkoutPlans (user_id, week, kind, seed, plan, created_at) VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT (user_id, week) DO UPDATE SET kind=excluded.kind, seed=excluded.seed, plan=excluded.plan, created_at=excluded.created_at
+"""
+FIND_PLAN = "SELECT plan FROM WorkoutPlans WHERE user_id=? AND week=?"
+
+START_SESSION = "INSERT INTO WorkoutSessions (user_id, started_at) VALUES (?, ?)"
+UPSERT_SET = """
+INSERT INTO WorkoutSets (session_id, set_no, exercise, started_at, ended_at, reps, held_seconds) VALUES (?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (session_id, set_no) DO UPDATE SET ended_at=excluded.ended_at, reps=excluded.reps, held_seconds=excluded.held_seconds
+"""
+INSERT_REP = "INSERT OR IGNORE INTO RepEvents (session_id, set_no, rep, at) VALUES (?, ?, ?, ?)"
+ADD_SESSION_REPS = "UPDATE WorkoutSessions SET total_reps=total_reps+?, ended_at=max(coalesce(ended_at, 0), ?) WHERE id=?"
+#hold sets carry their running total, so the session's is summed again rather than added to
+SUM_SESSION_HELD = """
+UPDATE WorkoutSessions SET held_seconds=(SELECT coalesce(sum(held_seconds), 0) FROM WorkoutSets WHERE session_id=?),
+       ended_at=max(coalesce(ended_at, 0), ?) WHERE id=?
+"""
+END_SESSION = "UPDATE WorkoutSessions SET ended_at=max(coalesce(ended_at, 0), ?) WHERE id=?"
+#newest first, `before` is the id of the last session on the previous page. the partial
+#index only holds sessions with reps, so the page never wades through empty ones
+HISTORY_PAGE = """
+SELECT id, started_at, ended_at, total_reps, held_seconds,
+       (SELECT group_concat(exercise, ',') FROM (SELECT DISTINCT exercise FROM WorkoutSets WHERE session_id=s.id)) AS exercises
+FROM WorkoutSessions AS s INDEXED BY WorkoutSessions_by_user
+WHERE user_id=? AND (total_reps > 0 OR held_seconds > 0) AND id < ?
+ORDER BY id DESC LIMIT ?
+"""
+
+
+class Database:
+    # pool_size connections at most are kept open, a request that finds none free opens
+    # another and closes it afterwards. busy_timeout is how long a writer waits for the
+    # one write lock WAL has before giving up with "database is locked"
+    def __init__(self, path, pool_size=8, busy_timeout=5.0):
+        self.path = path
+        self.pool_size = pool_size
+        self.busy_timeout = busy_timeout
+        self.idle = queue.LifoQueue(maxsize=pool_size)
+        self.lock = threading.Lock()
+        self.migrated = False
+        self.opened = 0
+
+    def _open(self):
+        #check_same_thread off: a connection is used by one thread at a time, but not
+        #always the one that opened it
+        conn = sqlite3.connect(self.path, timeout=self.busy_timeout, check_same_thread=False, cached_statements=64)
+        conn.row_factory = sqlite3.Row
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        self.opened += 1
+        return conn
+
+    @contextmanager
+    def connection(self):
+        if not self.migrated:
+            self.migrate()
+        try:
+            conn = self.idle.get_nowait()
+        except queue.Empty:
+            conn = self._open()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            try:
+                self.idle.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+
+    def migrate(self):
+        # brings the schema up to date, once per process
+        with self.lock:
+            if self.migrated:
+                return
+            conn = self._open()
+            try:
+                #WAL is a property of the file, it only has to be switched on once. readers
+                #no longer wait for a writer and the other way around
+                conn.execute("PRAGMA journal_mode=WAL")
+                version = conn.execute("PRAGMA user_version").fetchone()[0]
+                for number, sql in enumerate(MIGRATIONS[version:], start=version + 1):
+                    #a failed step is rolled back when the connection closes, user_version included
+                    conn.executescript(f"BEGIN;\n{sql};\nPRAGMA user_version={number};\nCOMMIT;")
+            finally:
+                conn.close()
+            self.migrated = True
+
+    def find_login(self, username):
+        # the row with id and password hash, or None
+        with self.connection() as conn:
+            return conn.execute(FIND_LOGIN, (username,)).fetchone()
+
+    def add_user(self, username, email, password, goal, goal_other, workouts_per_week, body_part):
+        # returns the new user's id, raises sqlite3.IntegrityError if the username or email is taken
+        with self.connection() as conn:
+            with conn:
+                cursor = conn.execute(INSERT_USER, (username, email, password, goal, goal_other, workouts_per_week, body_part))
+            return cursor.lastrowid
+
+    def start_session(self, user_id, started_at):
+        # the new workout session's id
+        with self.connection() as conn:
+            with conn:
+                return conn.execute(START_SESSION, (user_id, started_at)).lastrowid
+
+    def write_history(self, sets, reps, session_reps, session_holds, ended):
+        # one transaction for everything buffered since the last flush: sets are
+        # (session_id, set_no, exercise, started_at, ended_at, reps, held_seconds), reps
+        # are (session_id, set_no, rep, at), session_reps (added reps, last rep at,
+        # session_id), session_holds (session_id, last held at, session_id) for sessions
+        # whose holds changed and ended (ended_at, session_id)
+        with self.connection() as conn:
+            with conn:
+                conn.executemany(UPSERT_SET, sets)
+                conn.executemany(INSERT_REP, reps)
+                conn.executemany(ADD_SESSION_REPS, session_reps)
+                conn.executemany(SUM_SESSION_HELD, session_holds)
+                conn.executemany(END_SESSION, ended)
+
+    def history_page(self, user_id, before=None, limit=20):
+        # rows of id, started_at, ended_at, total_reps, held_seconds, exercises (comma separated)
+        with self.connection() as conn:
+            return conn.execute(HISTORY_PAGE, (user_id, before if before is not None else 2 ** 63 - 1, limit)).fetchall()
+
+    def find_plan_user(self, user_id):
+        # id, goal and workouts_per_week, what a plan is generated from
+        with self.connection() as conn:
+            return conn.execute(FIND_PLAN_USER, (user_id,)).fetchone()
+
+    def users_for_plans(self, batch_size=1000):
+        # every user as find_plan_user() rows, read batch_size at a time
+        with self.connection() as conn:
+            cursor = conn.execute(ALL_PLAN_USERS)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    return
+                yield from rows
+
+    def save_plans(self, rows):
+        # rows of (user_id, week, kind, seed, plan json, created_at), one transaction
+        with self.connection() as conn:
+            with conn:
+                conn.executemany(UPSERT_PLAN, rows)
+
+    def find_plan(self, user_id, week):
+        # the stored plan json, or None
+        with self.connection() as conn:
+            row = conn.execute(FIND_PLAN, (user_id, week)).fetchone()
+            return row["plan"] if row is not None else None
+
+    def close(self):
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+    def stats(self):
+        return {"opened": self.opened, "idle": self.idle.qsize(), "pool_size": self.pool_size}
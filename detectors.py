@@ -0,0 +1,208 @@
+import os
+import threading
+import time
+
+import mediapipe as mp
+from mediapipe.tasks import python
+from mediapipe.tasks.python import vision
+
+BaseOptions = python.BaseOptions
+PoseLandmarker = vision.PoseLandmarker
+PoseLandmarkerOptions = vision.PoseLandmarkerOptions
+VisionRunningMode = vision.RunningMode
+
+DEFAULT_MODEL_ASSET = 'pose_landmarker.task'
+MODEL_ASSETS = {
+    "lite": 'pose_landmarker_lite.task',
+    "full": DEFAULT_MODEL_ASSET,
+    "heavy": 'pose_landmarker_heavy.task',
+}
+
+modelDirectory = os.path.dirname(os.path.abspath(__file__))
+
+
+def model_asset_path(model):
+    # falls back to the model we ship if the lite/heavy variant has not been downloaded
+    path = os.path.join(modelDirectory, MODEL_ASSETS[model])
+    if not os.path.exists(path):
+        path = os.path.join(modelDirectory, DEFAULT_MODEL_ASSET)
+    return path
+
+
+# which model variant and thresholds an exercise needs. nothing reads the segmentation
+# mask right now so it is off unless a profile asks for it. num_poses above 1 is for
+# group stations, see tracking.py
+class DetectorProfile:
+    def __init__(self, model="full", min_pose_detection_confidence=0.5, min_pose_presence_confidence=0.5,
+                 min_tracking_confidence=0.5, output_segmentation_masks=False, num_poses=1):
+        if model not in MODEL_ASSETS:
+            raise ValueError(f"unknown pose model {model}, expected one of {list(MODEL_ASSETS)}")
+        self.model = model
+        self.min_pose_detection_confidence = min_pose_detection_confidence
+        self.min_pose_presence_confidence = min_pose_presence_confidence
+        self.min_tracking_confidence = min_tracking_confidence
+        self.output_segmentation_masks = output_segmentation_masks
+        self.num_poses = num_poses
+
+    def key(self):
+        return (self.model, self.min_pose_detection_confidence, self.min_pose_presence_confidence,
+                self.min_tracking_confidence, self.output_segmentation_masks, self.num_poses)
+
+    def with_num_poses(self, num_poses):
+        return DetectorProfile(self.model, self.min_pose_detection_confidence, self.min_pose_presence_confidence,
+                               self.min_tracking_confidence, self.output_segmentation_masks, num_poses)
+
+    def options(self, running_mode, result_callback=None):
+        return PoseLandmarkerOptions(
+            base_options=BaseOptions(model_asset_path=model_asset_path(self.model)),
+            running_mode=running_mode,
+            min_pose_detection_confidence=self.min_pose_detection_confidence,
+            min_pose_presence_confidence=self.min_pose_presence_confidence,
+            min_tracking_confidence=self.min_tracking_confidence,
+            output_segmentation_masks=self.output_segmentation_masks,
+            num_poses=self.num_poses,
+            result_callback=result_callback)
+
+
+DEFAULT_PROFILE = DetectorProfile("full")
+
+# keyed the same as ExerciseManager.exercises
+DETECTOR_PROFILES = {
+    "squats": DetectorProfile("full"),
+    "situps": DetectorProfile("full", min_pose_detection_confidence=0.4), #lying down is harder to pick up
+    "lunges": DetectorProfile("full"),
+    "running": DetectorProfile("lite"),
+    "jumpingjacks": DetectorProfile("lite"),
+    "pushups": DetectorProfile("lite"),
+    "glutebridges": DetectorProfile("full", min_pose_detection_confidence=0.4),
+    "supermans": DetectorProfile("full", min_pose_detection_confidence=0.4),
+    "plank": DetectorProfile("full", min_pose_detection_confidence=0.4),
+    "calfraises": DetectorProfile("full"), #heel vs toe is a few pixels, lite is too jumpy
+}
+
+
+def get_profile(exercise_name):
+    return DETECTOR_PROFILES.get(exercise_name, DEFAULT_PROFILE)
+
+
+# wraps a PoseLandmarker running in VIDEO or LIVE_STREAM mode so the model tracks the
+# person between frames instead of running full person detection every time.
+# results are handed to every listener as listener(detection_result, timestamp, roi), roi
+# being whatever was passed to submit() with that frame
+class PoseStream:
+    def __init__(self, profile=DEFAULT_PROFILE, running_mode=VisionRunningMode.LIVE_STREAM):
+        if running_mode == VisionRunningMode.IMAGE:
+            raise ValueError("PoseStream needs VIDEO or LIVE_STREAM running mode")
+        self.profile = profile
+        self.running_mode = running_mode
+        self.listeners = []
+        self.lock = threading.Lock()
+        self.submit_lock = threading.Lock() #detector calls have to go in timestamp order
+        self.last_timestamp_ms = -1
+        self.submitted_frames = 0
+        self.skipped_frames = 0
+        self.pending_rois = {} #timestamp_ms -> (roi, submitted at) of frames still in the detector
+        self.last_latency = 0.0 #seconds from submit() to the result of the latest frame
+
+        callback = self._on_result if running_mode == VisionRunningMode.LIVE_STREAM else None
+        self.detector = PoseLandmarker.create_from_options(profile.options(running_mode, callback))
+
+    def add_listener(self, listener):
+        with self.lock:
+            self.listeners.append(listener)
+
+    def remove_listener(self, listener):
+        with self.lock:
+            if listener in self.listeners:
+                self.listeners.remove(listener)
+
+    def submit(self, image, timestamp, roi=None):
+        # image is an RGB array, timestamp is time.monotonic() seconds of when the frame was captured.
+        # mediapipe needs strictly increasing milliseconds, a frame that is not newer than
+        # the last one (e.g. the same frame handed to two viewers) is skipped
+        timestamp_ms = int(timestamp * 1000)
+        with self.submit_lock:
+            if timestamp_ms <= self.last_timestamp_ms:
+                self.skipped_frames += 1
+                return False
+            self.last_timestamp_ms = timestamp_ms
+            self.submitted_frames += 1
+
+            mp_image = mp.Image(image_format=mp.ImageFormat.SRGB, data=image)
+            if self.running_mode == VisionRunningMode.LIVE_STREAM:
+                #returns straight away, the result comes back through _on_result
+                with self.lock:
+                    self.pending_rois[timestamp_ms] = (roi, time.perf_counter())
+                self.detector.detect_async(mp_image, timestamp_ms)
+            else:
+                start = time.perf_counter()
+                detection_result = self.detector.detect_for_video(mp_image, timestamp_ms)
+                self.last_latency = time.perf_counter() - start
+                self._dispatch(detection_result, timestamp_ms, roi)
+        return True
+
+    def _on_result(self, detection_result, output_image, timestamp_ms):
+        with self.lock:
+            roi, submitted = self.pending_rois.pop(timestamp_ms, (None, None))
+            #live stream mode may drop frames without a result, forget their rois
+            for stale in [t for t in self.pending_rois if t < timestamp_ms]:
+                del self.pending_rois[stale]
+        if submitted is not None:
+            self.last_latency = time.perf_counter() - submitted
+        self._dispatch(detection_result, timestamp_ms, roi)
+
+    def _dispatch(self, detection_result, timestamp_ms, roi):
+        with self.lock:
+            listeners = list(self.listeners)
+        for listener in listeners:
+            listener(detection_result, timestamp_ms / 1000.0, roi)
+
+    def close(self):
+        self.detector.close()
+
+
+# one PoseStream per distinct profile, shared by every user whose exercise maps to it
+class DetectorPool:
+    # with an inference_pool (see inference_pool.py) the detectors run in worker
+    # processes instead of this one
+    def __init__(self, running_mode=VisionRunningMode.LIVE_STREAM, inference_pool=None):
+        self.running_mode = running_mode
+        self.inference_pool = inference_pool
+        self.streams = {}
+        self.lock = threading.Lock()
+
+    def get(self, profile):
+        key = profile.key()
+        with self.lock:
+            stream = self.streams.get(key)
+            if stream is None:
+                if self.inference_pool is not None:
+                    stream = self.inference_pool.stream(profile)
+                else:
+                    stream = PoseStream(profile, self.running_mode)
+                self.streams[key] = stream
+            return stream
+
+    def discard(self, profile, stream=None):
+        # closes and forgets the profile's stream (only if it is still `stream`, when
+        # given), the next get() opens a fresh detector. for one that failed to load
+        key = profile.key()
+        with self.lock:
+            current = self.streams.get(key)
+            if current is None or (stream is not None and current is not stream):
+                return
+            del self.streams[key]
+        current.close()
+
+    def get_for_exercise(self, exercise_name, num_poses=1):
+        profile = get_profile(exercise_name)
+        if num_poses != profile.num_poses:
+            profile = profile.with_num_poses(num_poses)
+        return self.get(profile)
+
+    def close_all(self):
+        with self.lock:
+            streams = list(self.streams.values())
+            self.streams.clear()
+        for stream in streams:
+            stream.close()
@@ -0,0 +1,117 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+
+# what one mjpeg stream is allowed to cost. quality and scale are walked between their
+# min and max to land near target_bytes_per_second
+class EncoderSettings:
+    def __init__(self, target_bytes_per_second, min_quality=40, max_quality=85, min_scale=0.4, max_scale=1.0):
+        self.target_bytes_per_second = target_bytes_per_second
+        self.min_quality = min_quality
+        self.max_quality = max_quality
+        self.min_scale = min_scale
+        self.max_scale = max_scale
+
+
+#the browser on the same machine as the camera can take a lot more than someone remote
+LOCAL_PREVIEW = EncoderSettings(4_000_000, min_quality=60, max_quality=90, min_scale=0.5, max_scale=1.0)
+REMOTE_VIEWER = EncoderSettings(600_000, min_quality=35, max_quality=75, min_scale=0.35, max_scale=0.75)
+
+
+# adaptive quality/scale state for one output stream. only one frame is encoded at a
+# time per stream, a frame that arrives while the last one is still encoding is dropped
+class AdaptiveJpegStream:
+    def __init__(self, settings, window=1.0):
+        self.settings = settings
+        self.quality = settings.max_quality
+        self.scale = settings.max_scale
+        self.window = window
+        self.window_start = None
+        self.window_bytes = 0
+        self.bytes_per_second = 0.0
+        self.busy = False
+        self.encoded_frames = 0
+        self.dropped_frames = 0
+        self.last_encode_seconds = 0.0
+        self.resized = None #reused resize target
+
+    def encode(self, image):
+        start = time.perf_counter()
+        if self.scale < 1.0:
+            h, w = image.shape[:2]
+            size = (max(1, int(w * self.scale)), max(1, int(h * self.scale)))
+            if self.resized is None or self.resized.shape[1::-1] != size:
+                self.resized = np.empty((size[1], size[0], 3), dtype=np.uint8)
+            cv2.resize(image, size, dst=self.resized, interpolation=cv2.INTER_AREA)
+            image = self.resized
+
+        ret, buffer = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, int(self.quality)])
+        if not ret:
+            return None
+        self.encoded_frames += 1
+        self._account(len(buffer), time.monotonic())
+        jpeg = buffer.tobytes()
+        self.last_encode_seconds = time.perf_counter() - start
+        return jpeg
+
+    def _account(self, size, now):
+        if self.window_start is None:
+            self.window_start = now
+        self.window_bytes += size
+        elapsed = now - self.window_start
+        if elapsed < self.window:
+            return
+        self.bytes_per_second = self.window_bytes / elapsed
+        self.window_start = now
+        self.window_bytes = 0
+        self._adapt()
+
+    def _adapt(self):
+        s = self.settings
+        target = s.target_bytes_per_second
+        #quality is the cheap knob, only touch the resolution once quality is used up
+        if self.bytes_per_second > target * 1.1:
+            if self.quality > s.min_quality:
+                self.quality = max(s.min_quality, self.quality - 5)
+            else:
+                self.scale = max(s.min_scale, round(self.scale - 0.1, 2))
+        elif self.bytes_per_second < target * 0.7:
+            if self.scale < s.max_scale:
+                self.scale = min(s.max_scale, round(self.scale + 0.1, 2))
+            else:
+                self.quality = min(s.max_quality, self.quality + 5)
+
+
+# encodes on worker threads so the hub loop can go back to the camera straight away.
+# cv2.imencode releases the GIL so the workers really run in parallel
+class JpegEncoder:
+    def __init__(self, workers=2):
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="JpegEncoder")
+        self.lock = threading.Lock()
+
+    def submit(self, stream, image, on_encoded):
+        # on_encoded(jpeg_bytes) is called on the worker thread. returns False if the
+        # stream was still busy with the previous frame and this one was dropped
+        with self.lock:
+            if stream.busy:
+                stream.dropped_frames += 1
+                return False
+            stream.busy = True
+        self.pool.submit(self._encode, stream, image, on_encoded)
+        return True
+
+    def _encode(self, stream, image, on_encoded):
+        try:
+            jpeg = stream.encode(image)
+        finally:
+            with self.lock:
+                stream.busy = False
+        if jpeg is not None:
+            on_encoded(jpeg)
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False)
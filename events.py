@@ -0,0 +1,44 @@
+import queue
+import threading
+
+
+# per-user fan out of small json-able events (rep counted, state changed) to whoever is
+# listening, e.g. the server-sent events stream of an open workout page.
+# a listener that stops reading only loses its oldest events, publishing never blocks
+class EventChannel:
+    def __init__(self, maxsize=32):
+        self.maxsize = maxsize
+        self.listeners = {} #user_id -> [queue.Queue]
+        self.lock = threading.Lock()
+
+    def subscribe(self, user_id):
+        q = queue.Queue(maxsize=self.maxsize)
+        with self.lock:
+            self.listeners.setdefault(user_id, []).append(q)
+        return q
+
+    def unsubscribe(self, user_id, q):
+        with self.lock:
+            user_listeners = self.listeners.get(user_id, [])
+            if q in user_listeners:
+                user_listeners.remove(q)
+            if not user_listeners:
+                self.listeners.pop(user_id, None)
+
+    def has_listeners(self, user_id):
+        with self.lock:
+            return bool(self.listeners.get(user_id))
+
+    def publish(self, user_id, event):
+        with self.lock:
+            user_listeners = list(self.listeners.get(user_id, ()))
+        for q in user_listeners:
+            while True:
+                try:
+                    q.put_nowait(event)
+                    break
+                except queue.Full:
+                    try:
+                        q.get_nowait()
+                    except queue.Empty:
+                        pass
@@ -0,0 +1,410 @@
+# exercise controllers. each one gets the (33, 4) pose frame of the first person
+# (see pose_frame.py) and the capture timestamp in seconds, so they run the same on the
+# live camera and on recorded video (see replay.py). exercises that are only angle
+# thresholds are ExerciseSpecs (see rep_engine.py), the ones that track anchors over
+# time are still written out by hand
+import numpy as np
+
+from landmarks import *
+from pose_frame import joint_triples, joint_angles
+from overlay import draw_overlay
+from rep_engine import Angle, ExerciseSpec, Lift, Steepness, Transition
+
+
+class SitUpState:
+    IDLE="IDLE"
+    DOWN = "DOWN"
+    RISING="RISING"
+    TOP="TOP"
+
+class SitUpController:
+    #(end, vertex, end) triples, joint_angles gives them back in this order
+    JOINTS = joint_triples((RIGHT_SHOULDER, RIGHT_HIP, RIGHT_HEEL), (RIGHT_HIP, RIGHT_KNEE, RIGHT_HEEL))
+    #head to hip, hip to ankle ignoring knee, then the knee angle
+    SEGMENTS = [(RIGHT_HIP, NOSE, (0, 0, 255), 2), (RIGHT_HIP, RIGHT_HEEL, (0, 0, 255), 2),
+                (RIGHT_HIP, RIGHT_KNEE, (0, 255, 0), 2), (RIGHT_KNEE, RIGHT_HEEL, (0, 255, 0), 2)]
+
+    __slots__ = ("state", "count", "bodyBendAngle", "kneeAngle", "heel_anchor", "has_heel_anchor")
+
+    def __init__(self):
+        self.state=SitUpState.IDLE
+        self.count=0
+        self.bodyBendAngle=0 #the idle state means the angle between the rays from hip to head and hip to ankle has to be about flat
+        self.kneeAngle=0 #knees should be bent in a situp
+        self.heel_anchor=np.zeros(2, dtype=np.float32) #heel shouldnt move very much
+        self.has_heel_anchor=False
+        #dont care about the arms for now
+
+    def update(self, pose, image_shape, timestamp):
+        if pose is None:
+            return
+        right_heel=pose[RIGHT_HEEL, :2]
+
+        self.bodyBendAngle, self.kneeAngle = joint_angles(pose, self.JOINTS)
+
+        if self.state==SitUpState.IDLE:
+            self.heel_anchor[:] = right_heel
+            self.has_heel_anchor = True
+            #wait until body bend angle is less than some number
+            if self.bodyBendAngle>165:
+                self.state = SitUpState.IDLE #lying flat, stay in idle
+                return
+            
+            elif self.bodyBendAngle<165 and self.kneeAngle<110: #knees must be bent and body must be bent enough to count as up 
+                #transition to up state
+                self.state=SitUpState.RISING
+                return
+        
+        elif self.state==SitUpState.RISING:
+            if not self.has_heel_anchor:
+                self.state = SitUpState.IDLE
+                return
+
+            heel_displacement = np.hypot(*(right_heel - self.heel_anchor))
+
+            if self.kneeAngle>110 or heel_displacement > 80: #knees not bent enough! go back to idle
+                self.state=SitUpState.IDLE
+                return
+
+            elif self.bodyBendAngle<110: #more and more bent
+                self.state=SitUpState.TOP
+                return
+        elif self.state==SitUpState.TOP:
+            if self.kneeAngle>110: #knees not bent enough! go back to idle
+                self.state=SitUpState.IDLE
+                return
+            
+            elif self.bodyBendAngle>165:
+                self.count=self.count+1
+                self.state=SitUpState.IDLE
+                return
+        
+
+    def draw(self, image, pose):
+        return draw_overlay(image, pose, self.SEGMENTS)
+
+class SquatState:
+    IDLE="IDLE"
+    BEGIN = "BEGIN"
+    DOWN = "DOWN"
+    RISE="RISE"
+
+class SquatController:
+    JOINTS = joint_triples((LEFT_HIP, LEFT_KNEE, LEFT_HEEL), (RIGHT_HIP, RIGHT_KNEE, RIGHT_HEEL)) #both share a point at knee
+    SEGMENTS = [(LEFT_HIP, LEFT_HEEL, (255, 0, 0), 2),
+                (LEFT_HIP, LEFT_KNEE, (0, 255, 0), 2), (LEFT_KNEE, LEFT_HEEL, (0, 255, 0), 2),
+                (RIGHT_HIP, RIGHT_KNEE, (0, 255, 0), 2), (RIGHT_KNEE, RIGHT_HEEL, (0, 255, 0), 2)]
+
+    __slots__ = ("state", "count", "knee_angle", "left_knee_angle", "right_knee_angle", "heel_anchor",
+                 "has_heel_anchor", "down_start_time")
+
+    def __init__(self):
+        self.state = SquatState.IDLE
+        self.count = 0
+        self.knee_angle = 0
+        self.heel_anchor = np.zeros(2, dtype=np.float32)
+        self.has_heel_anchor = False
+        self.down_start_time = None
+
+    def update(self, pose, image_shape, timestamp):
+        if pose is None:
+            return
+        left_hip = pose[LEFT_HIP, :2]
+        left_heel = pose[LEFT_HEEL, :2]
+
+        self.left_knee_angle, self.right_knee_angle = joint_angles(pose, self.JOINTS)
+              
+        if self.state == SquatState.IDLE:
+            if self.left_knee_angle>140 and self.right_knee_angle >140:
+                self.heel_anchor[:] = left_heel
+                self.has_heel_anchor = True
+
+            dx = left_heel[0] - left_hip[0]
+            dy = left_heel[1] - left_hip[1]
+            slope = dy / dx if dx != 0 else float("inf")
+
+            #patching the angel franco office chair cheat
+            if(not (-2> slope or  slope>2)): #line from hip to ankle must be mostly vertical
+                return
+
+            if self.left_knee_angle<120 and self.right_knee_angle <120:
+                self.state=SquatState.BEGIN
+                return
+            
+        elif self.state==SquatState.BEGIN:
+            if not self.has_heel_anchor:
+
+                self.state = SquatState.IDLE
+                return
+            heel_displacement = np.hypot(*(left_heel - self.heel_anchor))
+            if heel_displacement > 80:
+                self.state=SquatState.IDLE
+                return
+
+            if self.left_knee_angle<80 and self.right_knee_angle <80 : #80 degree squat
+                self.state = SquatState.DOWN
+                self.down_start_time = timestamp
+                return
+
+        elif self.state == SquatState.DOWN:
+            if self.left_knee_angle > 100 or self.right_knee_angle> 100: # User started rising too early
+                if (timestamp - self.down_start_time) >= 1.0:
+                    self.state =  SquatState.RISE
+                else:
+                    self.state = SquatState.RISE
+
+        elif self.state ==  SquatState.RISE:
+            if self.left_knee_angle <160  and self.right_knee_angle<160 :
+                self.count += 1
+                self.state = SquatState.IDLE
+                print(f"Count: {self.count}")
+    
+    def draw(self, image, pose):
+        return draw_overlay(image, pose, self.SEGMENTS)
+
+class LungeState:
+    IDLE="IDLE"
+    DESCENDING="DESCENDING" #left leg forward
+    ASCENDING="ASCENDING"
+    DOWN="DOWN"
+class LungeController:
+    JOINTS = joint_triples((LEFT_HIP, LEFT_KNEE, LEFT_HEEL), (RIGHT_HIP, RIGHT_KNEE, RIGHT_HEEL)) #both share a point at knee
+    #heel to heel line goes red once the feet are further apart than 1.5 calf lengths
+    SEGMENTS = [(LEFT_HEEL, RIGHT_HEEL, (0, 255, 0), 2), (RIGHT_KNEE, RIGHT_HEEL, (255, 0, 0), 2),
+                (LEFT_HIP, LEFT_KNEE, (0, 255, 0), 2), (LEFT_KNEE, LEFT_HEEL, (0, 255, 0), 2),
+                (RIGHT_HIP, RIGHT_KNEE, (0, 255, 0), 2)]
+    SEGMENTS_APART = [(LEFT_HEEL, RIGHT_HEEL, (0, 0, 255), 2)] + SEGMENTS[1:]
+
+    __slots__ = ("state", "count", "leftKneeAngle", "rightKneeAngle", "left_knee_angle", "right_knee_angle",
+                 "heelToHeelDistance", "calfLength", "idleHipHeight")
+
+    def __init__(self):
+        self.state=LungeState.IDLE
+        self.count=0
+        self.leftKneeAngle=0
+        self.rightKneeAngle=0
+        self.heelToHeelDistance=0
+        self.calfLength=0 #this is a constant
+        self.idleHipHeight=0
+    
+    def update(self, pose, image_shape, timestamp):
+        if pose is None:
+            return
+        left_knee = pose[LEFT_KNEE, :2]
+        left_heel = pose[LEFT_HEEL, :2]
+        right_hip = pose[RIGHT_HIP, :2]
+        right_knee = pose[RIGHT_KNEE, :2]
+        right_heel = pose[RIGHT_HEEL, :2]
+
+        self.calfLength=np.hypot(*(right_knee-right_heel)) #this is a constant!!!!
+        self.heelToHeelDistance=np.hypot(*(left_heel-right_heel))
+
+        self.left_knee_angle, self.right_knee_angle = joint_angles(pose, self.JOINTS)
+
+
+        if self.state==LungeState.IDLE:
+            
+            self.idleHipHeight = right_hip[1]
+
+            if(abs(self.heelToHeelDistance)> 1.3 * self.calfLength):
+
+                self.state=LungeState.DESCENDING
+                return
+            
+        elif self.state==LungeState.DESCENDING:
+
+            if(abs(self.heelToHeelDistance)< 1.3 * self.calfLength):
+                self.state=LungeState.IDLE
+                return
+            rightCalfRun = right_knee[0]-right_heel[0]
+            leftCalfRun = left_knee[0]-left_heel[0]
+            rightCalfSlope = (right_knee[1]-right_heel[1]) / rightCalfRun if rightCalfRun != 0 else float("inf")
+            leftCalfSlope = (left_knee[1]-right_heel[1]) / leftCalfRun if leftCalfRun != 0 else float("inf")
+    
+            backLeg="dumb"
+            frontLeg="dummy"
+            if(abs(rightCalfSlope) <0.75 ): #if the slope of the right calf is near flat
+                frontLeg="left"
+                backLeg="right"
+            elif(abs(leftCalfSlope)<0.75):
+                frontLeg="right"
+                backLeg="left"
+
+            if( frontLeg=="right"  and self.left_knee_angle < 110):
+                self.state=LungeState.DOWN
+                return
+            elif(frontLeg=="left" and self.right_knee_angle< 110):
+                self.state=LungeState.DOWN
+                return
+ 
+        if self.state==LungeState.DOWN:
+
+            if(abs(self.heelToHeelDistance) < self.calfLength *1.3):
+                self.state=LungeState.ASCENDING
+                self.count=self.count+1
+                return
+        
+        if self.state==LungeState.ASCENDING:
+            if(self.right_knee_angle > 140 and self.left_knee_angle >140):
+                self.state=LungeState.IDLE
+                return
+ 
+    def draw(self, image, pose):
+        if pose is None:
+            return image
+        ankleToAnkleDistance=np.hypot(*(pose[LEFT_HEEL, :2]-pose[RIGHT_HEEL, :2]))
+        rightCalfLength=np.hypot(*(pose[RIGHT_KNEE, :2]-pose[RIGHT_HEEL, :2])) #this is a constant!!!!
+        segments = self.SEGMENTS_APART if abs(ankleToAnkleDistance) > 1.5 * rightCalfLength else self.SEGMENTS
+        return draw_overlay(image, pose, segments)
+
+class RunningState:
+    TIMER = "TIMER"
+
+class RunningController:
+    __slots__ = ("state", "count")
+
+    def __init__(self):
+        self.state = RunningState.TIMER
+        self.count = 0
+
+    def update(self, pose, image_shape, timestamp):
+        return
+
+    def draw(self, image, pose):
+        # No extra drawing.
+        return image
+
+class JumpingJackState:
+    TIMER = "TIMER"
+
+class JumpingJacksController:
+    __slots__ = ("state", "count")
+
+    def __init__(self):
+        self.state = JumpingJackState.TIMER
+        self.count = 0
+
+    def update(self, pose, image_shape, timestamp):
+        return
+
+    def draw(self, image, pose):
+        # No extra drawing.
+        return image
+
+# the rest are plain data for rep_engine, see ExerciseSpec
+
+GLUTE_BRIDGES = ExerciseSpec(
+    "glutebridges",
+    features={
+        "knee": Angle(RIGHT_HIP, RIGHT_KNEE, RIGHT_HEEL),
+        "hip": Angle(RIGHT_SHOULDER, RIGHT_HIP, RIGHT_KNEE),
+        "torso_steepness": Steepness(RIGHT_HIP, RIGHT_SHOULDER),
+    },
+    states=("IDLE", "UP"),
+    #lying on the back (torso flatter than upright) with the knees bent
+    requires=[("torso_steepness", "<=", 1.0), ("knee", "<=", 135)],
+    transitions=[
+        Transition("IDLE", "UP", [("hip", ">", 165)]),
+        Transition("UP", "IDLE", [("hip", "<", 140)], count=True),
+    ],
+    segments=[(RIGHT_SHOULDER, RIGHT_HIP, (0, 255, 0), 4), (RIGHT_HIP, RIGHT_KNEE, (0, 0, 255), 4),
+              (RIGHT_KNEE, RIGHT_HEEL, (255, 0, 0), 4)],
+    points=[(RIGHT_HIP, 6, (255, 255, 255)), (RIGHT_KNEE, 6, (255, 255, 255)), (RIGHT_HEEL, 6, (0, 255, 255))],
+)
+
+SUPERMANS = ExerciseSpec(
+    "supermans",
+    features={"back": Angle(RIGHT_SHOULDER, RIGHT_HIP, RIGHT_KNEE)},
+    states=("IDLE", "UP"),
+    transitions=[
+        Transition("IDLE", "UP", [("back", "<", 165)]),
+        Transition("UP", "IDLE", [("back", ">", 175)], count=True),
+    ],
+    segments=[(RIGHT_SHOULDER, RIGHT_HIP, (0, 0, 255), 4), (RIGHT_HIP, RIGHT_KNEE, (0, 0, 255), 4)],
+    state_segments={"UP": [(RIGHT_SHOULDER, RIGHT_HIP, (0, 255, 0), 4), (RIGHT_HIP, RIGHT_KNEE, (0, 255, 0), 4)]},
+)
+
+PUSHUPS = ExerciseSpec(
+    "pushups",
+    features={
+        "elbow": Angle(RIGHT_SHOULDER, RIGHT_ELBOW, RIGHT_WRIST),
+        "body": Angle(RIGHT_SHOULDER, RIGHT_HIP, RIGHT_KNEE),
+    },
+    states=("IDLE", "DOWN"),
+    transitions=[
+        Transition("IDLE", "DOWN", [("elbow", "<", 85), ("body", ">", 150)]),
+        Transition("DOWN", "IDLE", [("elbow", ">", 160)], count=True),
+    ],
+    segments=[(RIGHT_SHOULDER, RIGHT_ELBOW, (0, 0, 255), 4), (RIGHT_ELBOW, RIGHT_WRIST, (0, 0, 255), 4),
+              (RIGHT_SHOULDER, RIGHT_HIP, (255, 255, 0), 2)],
+    state_segments={"DOWN": [(RIGHT_SHOULDER, RIGHT_ELBOW, (0, 255, 0), 4), (RIGHT_ELBOW, RIGHT_WRIST, (0, 255, 0), 4),
+                             (RIGHT_SHOULDER, RIGHT_HIP, (255, 255, 0), 2)]},
+)
+
+#count is seconds held with a straight, roughly horizontal body
+PLANK = ExerciseSpec(
+    "plank",
+    features={
+        "body": Angle(RIGHT_SHOULDER, RIGHT_HIP, RIGHT_ANKLE),
+        "body_steepness": Steepness(RIGHT_SHOULDER, RIGHT_ANKLE),
+    },
+    states=("IDLE", "HOLD"),
+    transitions=[
+        Transition("IDLE", "HOLD", [("body", ">", 160), ("body_steepness", "<", 0.5)]),
+        Transition("HOLD", "IDLE", [("body", "<", 150)]),
+        Transition("HOLD", "IDLE", [("body_steepness", ">", 0.7)]),
+    ],
+    hold_state="HOLD",
+    segments=[(RIGHT_SHOULDER, RIGHT_HIP, (0, 0, 255), 4), (RIGHT_HIP, RIGHT_ANKLE, (0, 0, 255), 4)],
+    state_segments={"HOLD": [(RIGHT_SHOULDER, RIGHT_HIP, (0, 255, 0), 4), (RIGHT_HIP, RIGHT_ANKLE, (0, 255, 0), 4)]},
+)
+
+#heel lift is in calf lengths, standing flat it is about 0
+CALF_RAISES = ExerciseSpec(
+    "calfraises",
+    features={
+        "knee": Angle(RIGHT_HIP, RIGHT_KNEE, RIGHT_ANKLE),
+        "heel_lift": Lift(RIGHT_HEEL, RIGHT_FOOT_INDEX, RIGHT_KNEE, RIGHT_ANKLE),
+    },
+    states=("IDLE", "UP"),
+    requires=[("knee", ">", 150)], #straight legs, otherwise it is a squat
+    transitions=[
+        Transition("IDLE", "UP", [("heel_lift", ">", 0.15)]),
+        Transition("UP", "IDLE", [("heel_lift", "<", 0.05)], count=True),
+    ],
+    segments=[(RIGHT_KNEE, RIGHT_ANKLE, (0, 0, 255), 4), (RIGHT_HEEL, RIGHT_FOOT_INDEX, (0, 0, 255), 4)],
+    state_segments={"UP": [(RIGHT_KNEE, RIGHT_ANKLE, (0, 255, 0), 4), (RIGHT_HEEL, RIGHT_FOOT_INDEX, (0, 255, 0), 4)]},
+)
+
+EXERCISE_SPECS = {spec.name: spec for spec in (GLUTE_BRIDGES, SUPERMANS, PUSHUPS, PLANK, CALF_RAISES)}
+
+
+# keyed the same as detectors.DETECTOR_PROFILES and the names the workout page sends
+EXERCISE_CONTROLLERS = {
+    "squats": SquatController,
+    "situps": SitUpController,
+    "lunges": LungeController,
+    "running": RunningController,
+    "jumpingjacks": JumpingJacksController,
+    "pushups": PUSHUPS.controller,
+    "glutebridges": GLUTE_BRIDGES.controller,
+    "supermans": SUPERMANS.controller,
+    "plank": PLANK.controller,
+    "calfraises": CALF_RAISES.controller,
+}
+
+# a user's controllers, each one made the first time its exercise is picked
+class ExerciseManager():
+    __slots__ = ("exercises", "currentExercise")
+
+    def __init__(self):
+        self.exercises={}
+    
+        self.currentExercise="pushups"
+    def getCurrentExercise(self):
+        controller = self.exercises.get(self.currentExercise)
+        if controller is None:
+            controller = self.exercises[self.currentExercise] = EXERCISE_CONTROLLERS[self.currentExercise]()
+        return controller
+    def setCurrentExercise(self,exerciseName):
+        self.currentExercise=exerciseName
@@ -0,0 +1,231 @@
+# workout history. every rep the controllers count is written to the database, but not
+# from the frame loop: WorkoutLog.observe() only appends to HistoryWriter's buffer, and
+# the writer's thread flushes the buffer in one transaction every flush_interval seconds
+# (sooner once max_buffer reps are waiting). a set is one run of an exercise, it ends when
+# the user switches exercise or resets the counter. timed holds (plank) count seconds, not
+# reps, and are kept as the set's held_seconds without rep rows
+import atexit
+import logging
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+log = logging.getLogger(__name__)
+
+EXERCISE_TITLES = {
+    "squats": "Squats",
+    "situps": "Sit-ups",
+    "lunges": "Lunges",
+    "running": "Running",
+    "jumpingjacks": "Jumping Jacks",
+    "pushups": "Push-ups",
+    "glutebridges": "Glute Bridges",
+    "supermans": "Supermans",
+    "plank": "Plank",
+    "calfraises": "Calf Raises",
+}
+
+
+class HistoryWriter:
+    # hold_exercises are the exercise names whose count is seconds held
+    def __init__(self, database, flush_interval=2.0, max_buffer=500, max_pending=50000, hold_exercises=()):
+        self.database = database
+        self.hold_exercises = frozenset(hold_exercises)
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.max_pending = max_pending #reps kept for a retry while the database fails, beyond that they are dropped
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.sets = {} #(session_id, set_no) -> latest set row
+        self.reps = []
+        self.ended = {} #session_id -> ended_at
+        self.thread = None
+        self.flushes = 0
+        self.written_reps = 0
+        self.failed_flushes = 0
+        self.dropped_reps = 0
+
+    def start_session(self, user_id):
+        # the one synchronous write, once per workout and never per rep
+        return self.database.start_session(user_id, time.time())
+
+    def add(self, set_row, rep_row=None):
+        # set_row is the set as it is now, rep_row the rep just counted (None for a hold).
+        # called from the frame loop, only touches memory
+        with self.lock:
+            self.sets[set_row[:2]] = set_row
+            if rep_row is not None:
+                self.reps.append(rep_row)
+            full = len(self.reps) >= self.max_buffer
+            if self.thread is None:
+                self._start()
+        if full:
+            self.wake.set()
+
+    def end_session(self, session_id):
+        with self.lock:
+            self.ended[session_id] = time.time()
+            if self.thread is None:
+                self._start()
+        self.wake.set()
+
+    def _start(self):
+        # under the lock
+        self.thread = threading.Thread(target=self._run, name="HistoryWriter", daemon=True)
+        self.thread.start()
+        atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            self.wake.wait(self.flush_interval)
+            self.wake.clear()
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            sets, self.sets = self.sets, {}
+            reps, self.reps = self.reps, []
+            ended, self.ended = self.ended, {}
+        if not (sets or reps or ended):
+            return
+
+        session_reps = {} #session_id -> [added reps, last rep at]
+        for session_id, _, _, at in reps:
+            entry = session_reps.setdefault(session_id, [0, at])
+            entry[0] += 1
+            entry[1] = max(entry[1], at)
+        session_holds = {} #session_id -> last hold set's ended_at
+        for session_id, _, _, _, ended_at, _, held in sets.values():
+            if held:
+                session_holds[session_id] = max(session_holds.get(session_id, 0), ended_at)
+        try:
+            self.database.write_history(list(sets.values()), reps,
+                                        [(n, at, session_id) for session_id, (n, at) in session_reps.items()],
+                                        [(session_id, at, session_id) for session_id, at in session_holds.items()],
+                                        [(at, session_id) for session_id, at in ended.items()])
+        except sqlite3.Error:
+            log.exception("writing workout history failed, keeping %d reps for the next flush", len(reps))
+            with self.lock:
+                self.failed_flushes += 1
+                #newer set rows win over the ones being put back
+                self.sets = {**sets, **self.sets}
+                self.reps = reps + self.reps
+                self.ended = {**ended, **self.ended}
+                if len(self.reps) > self.max_pending:
+                    self.dropped_reps += len(self.reps) - self.max_pending
+                    self.reps = self.reps[-self.max_pending:]
+            return
+        with self.lock:
+            self.flushes += 1
+            self.written_reps += len(reps)
+
+    def page(self, user_id, before=None, limit=20):
+        # one page of the user's workouts for the log, newest first. the next page is
+        # page(user_id, before=<id of the last one>)
+        workouts = []
+        for row in self.database.history_page(user_id, before, limit):
+            exercises = (row["exercises"] or "").split(",")
+            finished = datetime.fromtimestamp(row["ended_at"] or row["started_at"])
+            workouts.append({
+                "id": row["id"],
+                "name": ", ".join(EXERCISE_TITLES.get(e, e) for e in exercises if e),
+                "completed_date": finished.strftime("%b %d, %Y %H:%M"),
+                "reps": row["total_reps"],
+                "held_seconds": row["held_seconds"],
+                "summary": workout_summary(row["total_reps"], row["held_seconds"]),
+                "minutes": round(((row["ended_at"] or row["started_at"]) - row["started_at"]) / 60),
+            })
+        return workouts
+
+    def stats(self):
+        with self.lock:
+            return {
+                "buffered_reps": len(self.reps),
+                "flushes": self.flushes,
+                "written_reps": self.written_reps,
+                "failed_flushes": self.failed_flushes,
+                "dropped_reps": self.dropped_reps,
+            }
+
+
+def workout_summary(reps, held_seconds):
+    # "24 reps", "1:30 held" or both
+    parts = []
+    if reps or not held_seconds:
+        parts.append(f"{reps} reps")
+    if held_seconds:
+        parts.append(f"{held_seconds // 60}:{held_seconds % 60:02d} held")
+    return ", ".join(parts)
+
+
+# one user's current workout session. observe() is given the controller's count every
+# time it changes and turns increases into rep rows, or into the seconds held for a hold.
+# observe() runs on the frame path and never writes, sessions are only opened by start()
+# from a request handler; counts seen while there is none are not recorded
+class WorkoutLog:
+    __slots__ = ("writer", "user_id", "session_id", "set_no", "exercise", "base", "last_count", "set_started", "lock")
+
+    def __init__(self, writer, user_id):
+        self.writer = writer
+        self.user_id = user_id
+        self.session_id = None
+        self.set_no = 0
+        self.exercise = None
+        self.base = 0 #controller count when the set started
+        self.last_count = 0
+        self.set_started = None
+        self.lock = threading.Lock()
+
+    def start(self, exercise=None, count=0):
+        # a new workout session, ending the one before. exercise and count are where the
+        # user's controller is now, the first set counts from there. returns False if the
+        # session could not be stored, the workout then goes unrecorded
+        self.end()
+        try:
+            session_id = self.writer.start_session(self.user_id)
+        except sqlite3.Error:
+            log.exception("starting a workout session for user %s failed", self.user_id)
+            return False
+        with self.lock:
+            self.session_id = session_id
+            self.set_no = 0 if exercise is None else 1
+            self.exercise = exercise
+            self.base = count
+            self.last_count = count
+            self.set_started = time.time()
+        return True
+
+    def observe(self, exercise, count):
+        if count == self.last_count and exercise == self.exercise:
+            return
+        now = time.time()
+        with self.lock:
+            if self.session_id is None:
+                return
+            if exercise != self.exercise or count < self.last_count:
+                #switched exercise or reset, controllers keep their count so the set
+                #counts from where it is now
+                self.set_no += 1
+                self.exercise = exercise
+                self.base = count
+                self.last_count = count
+                self.set_started = now
+                return
+            if exercise in self.writer.hold_exercises:
+                #the count is whole seconds held, only the set's total is kept
+                self.writer.add((self.session_id, self.set_no, exercise, self.set_started, now, 0, count - self.base))
+                self.last_count = count
+                return
+            for count in range(self.last_count + 1, count + 1):
+                reps = count - self.base
+                self.writer.add((self.session_id, self.set_no, exercise, self.set_started, now, reps, 0),
+                                (self.session_id, self.set_no, reps, now))
+            self.last_count = count
+
+    def end(self):
+        with self.lock:
+            session_id, self.session_id = self.session_id, None
+            self.exercise = None
+        if session_id is not None:
+            self.writer.end_session(session_id)
@@ -0,0 +1,427 @@
+import os
+import threading
+import time
+
+import numpy as np
+
+from detectors import DetectorPool, VisionRunningMode
+from encoder import AdaptiveJpegStream, JpegEncoder, LOCAL_PREVIEW, REMOTE_VIEWER
+from motion import InferenceScheduler, MotionEstimator
+from pose_frame import NUM_LANDMARKS, landmarks_to_frame
+from pose_trace import TRACE_EXTENSION, PoseTraceWriter
+from preprocess import PosePreprocessor
+from smoothing import OneEuroFilter
+
+
+# one MJPEG client (a browser tab). the hub publishes the newest jpeg for its user and
+# the client waits on it, a slow client just skips frames
+class Viewer:
+    def __init__(self, user_id, remote=False):
+        self.user_id = user_id
+        self.remote = remote #remote viewers get the smaller REMOTE_VIEWER encoding
+        self.condition = threading.Condition()
+        self.jpeg = None
+        self.seq = 0
+        self.closed = False
+
+    def publish(self, jpeg, seq):
+        with self.condition:
+            self.jpeg = jpeg
+            self.seq = seq
+            self.condition.notify_all()
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+    def wait(self, after_seq, timeout=1.0):
+        # returns (seq, jpeg) of the first frame newer than after_seq, (after_seq, None) on timeout
+        with self.condition:
+            if self.seq <= after_seq and not self.closed:
+                self.condition.wait(timeout)
+            if self.seq <= after_seq or self.closed:
+                return after_seq, None
+            return self.seq, self.jpeg
+
+
+# captures, infers and encodes each frame once for everybody watching one video source.
+# users are fed from the detection results of their exercise's detector profile, and
+# every viewer of the same user shares one annotated jpeg. on_update(user) is called
+# after every controller update, on whatever thread the result came back on.
+# with record_dir set every user's poses are also saved as a pose trace (see pose_trace.py)
+# inference_fps is the cpu budget per profile (so per user), idle_fps is what we drop
+# to while nothing in the picture moves. with smoothing every user's landmarks go
+# through a One Euro filter, and frames that skip inference get a predicted pose so the
+# controllers still see every camera frame
+class FrameHub:
+    def __init__(self, source, running_mode=VisionRunningMode.LIVE_STREAM, inference_fps=15.0, idle_fps=3.0,
+                 motion_threshold=0.01, encode_workers=2, on_update=None, record_dir=None, smoothing=True,
+                 inference_pool=None):
+        self.source = source
+        self.smoothing = smoothing
+        self.smoothers = {} #user_id -> OneEuroFilter
+        self.last_update = {} #user_id -> timestamp the controller last saw
+        #results come back on the detector's thread, predictions on the hub's
+        self.update_lock = threading.Lock()
+        self.on_update = on_update
+        self.record_dir = record_dir
+        self.trace_writers = {} #user_id -> PoseTraceWriter while recording
+        #streams track one video source, so every hub gets its own pool. the worker
+        #processes behind it (inference_pool) can be shared by every hub
+        self.detector_pool = DetectorPool(running_mode, inference_pool)
+        self.motion = MotionEstimator()
+        self.inference_fps = inference_fps
+        self.idle_fps = idle_fps
+        self.motion_threshold = motion_threshold
+        self.schedulers = {} #PoseStream -> InferenceScheduler
+        self.preprocessors = {} #PoseStream -> PosePreprocessor, each crops around its own last result
+        self.users = {} #user_id -> [User, number of subscriptions]
+        self.viewers = {} #user_id -> [Viewer]
+        self.listening = set() #PoseStreams we already listen to
+        self.frame_shape = None
+        self.stream_poses = {} #PoseStream -> (num_poses, 33, 4), converted once per result, copied to each user
+        self.encoder = JpegEncoder(encode_workers)
+        self.encode_streams = {} #(user_id, remote) -> AdaptiveJpegStream
+        self.render_buffers = {} #user_id -> frame sized buffer the overlay is drawn on
+        self.lock = threading.Lock()
+        self.wakeup = threading.Condition(self.lock)
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        with self.lock:
+            if self.running:
+                return self
+            self.running = True
+        self.thread = threading.Thread(target=self._loop, name="FrameHub", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        with self.lock:
+            self.running = False
+            self.wakeup.notify_all()
+        self._close_viewers()
+        if self.thread is not None:
+            self.thread.join(timeout=1.0)
+            self.thread = None
+
+    def close(self):
+        # for hubs that own their source (see upload.py), also frees the detectors
+        self.stop()
+        self._release()
+        self.encoder.shutdown()
+
+    def _release(self):
+        # the trace files and detector streams, once nothing will be detected any more
+        with self.lock:
+            writers = list(self.trace_writers.values())
+            self.trace_writers.clear()
+        for writer in writers:
+            writer.close()
+        self.detector_pool.close_all()
+
+    def add_user(self, user):
+        # subscribe a user's ExerciseManager to detection results
+        with self.lock:
+            entry = self.users.get(user.user_ID)
+            if entry is None:
+                self.users[user.user_ID] = [user, 1]
+            else:
+                entry[0] = user
+                entry[1] += 1
+            self.wakeup.notify_all()
+        self.start()
+
+    def remove_user(self, user_id):
+        writer = None
+        with self.lock:
+            entry = self.users.get(user_id)
+            if entry is None:
+                return
+            entry[1] -= 1
+            if entry[1] <= 0:
+                del self.users[user_id]
+                self.smoothers.pop(user_id, None)
+                self.last_update.pop(user_id, None)
+                writer = self.trace_writers.pop(user_id, None)
+        if writer is not None:
+            writer.close()
+
+    def subscribe(self, user, remote=False):
+        # new MJPEG client for this user, also keeps the user's counting running
+        viewer = Viewer(user.user_ID, remote)
+        with self.lock:
+            self.viewers.setdefault(user.user_ID, []).append(viewer)
+        self.add_user(user)
+        return viewer
+
+    def unsubscribe(self, viewer):
+        viewer.close()
+        with self.lock:
+            user_viewers = self.viewers.get(viewer.user_id, [])
+            if viewer in user_viewers:
+                user_viewers.remove(viewer)
+            if not any(v.remote == viewer.remote for v in user_viewers):
+                self.encode_streams.pop((viewer.user_id, viewer.remote), None)
+            if not user_viewers:
+                self.viewers.pop(viewer.user_id, None)
+                self.render_buffers.pop(viewer.user_id, None)
+        self.remove_user(viewer.user_id)
+
+    def viewer_count(self):
+        with self.lock:
+            return sum(len(v) for v in self.viewers.values())
+
+    def _loop(self):
+        last_seq = 0
+        while True:
+            with self.lock:
+                while self.running and not self.users:
+                    self.wakeup.wait()
+                if not self.running:
+                    return
+                users = [entry[0] for entry in self.users.values()]
+
+            seq, timestamp, frame = self.source.read_latest(last_seq)
+            if frame is None:
+                if not self.source.running:
+                    with self.lock:
+                        self.running = False
+                    self._close_viewers()
+                    #the source is done (an upload gone idle), its detectors are not
+                    #kept until somebody closes the hub
+                    self._release()
+                    return
+                continue
+            last_seq = seq
+            self.frame_shape = frame.shape
+            #how old the frame already is when we pick it up
+            age = time.monotonic() - timestamp
+            for user in users:
+                user.metrics.observe("capture", age)
+
+            #one inference per profile in use, no matter how many users share it.
+            #skipped frames get a predicted pose, or leave the users on their last one
+            motion = self.motion.estimate(frame)
+            streams = []
+            for user in users:
+                stream = self._stream_for(user)
+                if stream not in streams:
+                    streams.append(stream)
+            for stream in streams:
+                self._listen(stream)
+                if self.schedulers[stream].should_infer(motion, timestamp):
+                    image, roi = self.preprocessors[stream].prepare(frame)
+                    stream.submit(image, timestamp, roi)
+                elif self.smoothing and not stream.pending_rois:
+                    #only while nothing is in flight, a late result must not go back in time
+                    self._predict(stream, users, timestamp)
+
+            self._publish(frame, seq)
+
+    def _stream_for(self, user):
+        # group stations ask the detector for up to max_people poses
+        num_poses = user.group.max_people if user.group is not None else 1
+        return self.detector_pool.get_for_exercise(user.exerciseManager.currentExercise, num_poses)
+
+    def _listen(self, stream):
+        if stream in self.listening:
+            return
+        self.listening.add(stream)
+        self.schedulers[stream] = InferenceScheduler(self.inference_fps, self.idle_fps, self.motion_threshold)
+        #multi-pose detectors always get the whole frame, see preprocess.py
+        self.preprocessors[stream] = PosePreprocessor(crop=stream.profile.num_poses == 1)
+        stream.add_listener(lambda detection_result, timestamp, roi: self._on_result(stream, detection_result, timestamp, roi))
+
+    def _on_result(self, stream, detection_result, timestamp, roi):
+        with self.lock:
+            users = [entry[0] for entry in self.users.values()]
+
+        #every person found, mapped from the crop back to full-frame pixels
+        people = detection_result.pose_landmarks or []
+        buffer = self.stream_poses.get(stream)
+        if buffer is None or len(buffer) < len(people):
+            buffer = np.zeros((max(len(people), stream.profile.num_poses), NUM_LANDMARKS, 4), dtype=np.float32)
+            self.stream_poses[stream] = buffer
+        for i, landmarks in enumerate(people):
+            landmarks_to_frame(landmarks, self.frame_shape, buffer[i], roi)
+        poses = buffer[:len(people)]
+        pose = poses[0] if len(people) else None
+        self.preprocessors[stream].update(pose, self.frame_shape)
+
+        for user in users:
+            if self._stream_for(user) is not stream:
+                continue
+            user.metrics.observe("detect", stream.last_latency)
+            user.latest_detection = detection_result
+            if user.group is not None:
+                with self.update_lock:
+                    self._update_group(user, user.group.update(poses, timestamp), timestamp)
+                if self.on_update is not None:
+                    self.on_update(user)
+                continue
+            with self.update_lock:
+                smoother = self._smoother(user)
+                if pose is None:
+                    user.latest_pose = None
+                    if smoother is not None:
+                        smoother.reset()
+                else:
+                    np.copyto(user.pose_buffer, pose)
+                    if smoother is not None:
+                        smoother.filter(user.pose_buffer, timestamp)
+                    user.latest_pose = user.pose_buffer
+                self._update(user, timestamp)
+            #traces hold what the controller saw, predicted frames are left out
+            if self.record_dir is not None:
+                self._record(user, timestamp)
+            if self.on_update is not None:
+                self.on_update(user)
+
+    def _predict(self, stream, users, timestamp):
+        for user in users:
+            if self._stream_for(user) is not stream:
+                continue
+            with self.update_lock:
+                if user.group is not None:
+                    if timestamp > self.last_update.get(user.user_ID, timestamp):
+                        self._update_group(user, user.group.predict(timestamp), timestamp)
+                    continue
+                smoother = self.smoothers.get(user.user_ID)
+                if smoother is None or timestamp <= self.last_update.get(user.user_ID, timestamp):
+                    continue
+                if user.latest_pose is None or smoother.predict(timestamp, user.pose_buffer) is None:
+                    continue
+                self._update(user, timestamp)
+            if self.on_update is not None:
+                self.on_update(user)
+
+    def _update_group(self, user, tracks, timestamp):
+        # every tracked person's controller follows the user's exercise, update_lock held
+        exercise = user.exerciseManager.currentExercise
+        start = time.perf_counter()
+        for track in tracks:
+            track.step(exercise, self.frame_shape, timestamp)
+        user.metrics.observe("update", time.perf_counter() - start)
+        user.metrics.updates.tick()
+        self.last_update[user.user_ID] = timestamp
+
+    def _smoother(self, user):
+        if not self.smoothing:
+            return None
+        smoother = self.smoothers.get(user.user_ID)
+        if smoother is None:
+            smoother = OneEuroFilter()
+            self.smoothers[user.user_ID] = smoother
+        return smoother
+
+    def _update(self, user, timestamp):
+        # runs the user's controller on user.latest_pose, called with update_lock held
+        user.currentExercise = user.exerciseManager.getCurrentExercise()
+        start = time.perf_counter()
+        user.currentExercise.update(user.latest_pose, self.frame_shape, timestamp)
+        user.metrics.observe("update", time.perf_counter() - start)
+        user.metrics.updates.tick()
+        self.last_update[user.user_ID] = timestamp
+
+    def _record(self, user, timestamp):
+        # under the lock, remove_user() and close() close the writers from other threads.
+        # a result that comes in after the user left (or the hub stopped) is not recorded,
+        # it would open a new trace nobody closes
+        with self.lock:
+            entry = self.users.get(user.user_ID)
+            if not self.running or entry is None or entry[0] is not user:
+                return
+            writer = self.trace_writers.get(user.user_ID)
+            if writer is None:
+                os.makedirs(self.record_dir, exist_ok=True)
+                name = f"user{user.user_ID}-{time.strftime('%Y%m%d-%H%M%S')}{TRACE_EXTENSION}"
+                writer = PoseTraceWriter(os.path.join(self.record_dir, name), self.frame_shape)
+                self.trace_writers[user.user_ID] = writer
+            writer.write(timestamp, user.latest_pose)
+
+    def _publish(self, frame, seq):
+        with self.lock:
+            targets = [(self.users[user_id][0], list(user_viewers))
+                       for user_id, user_viewers in self.viewers.items() if user_id in self.users]
+
+        #nobody watching means nothing is drawn. a user whose encoders are still busy with
+        #the last frame is skipped too, their render buffer may still be getting read
+        jobs = []
+        for user, user_viewers in targets:
+            groups = []
+            for remote in (False, True):
+                group = [v for v in user_viewers if v.remote == remote]
+                if group:
+                    groups.append((self._encode_stream(user.user_ID, remote), group))
+            if not any(stream.busy for stream, group in groups):
+                jobs.append((user, groups))
+            else:
+                user.metrics.dropped_encodes += 1
+
+        #the overlay is drawn in place. the last user gets the camera frame itself (nobody
+        #else reads it after this), everyone before gets a copy in their reused buffer
+        for i, (user, groups) in enumerate(jobs):
+            if i == len(jobs) - 1:
+                canvas = frame
+            else:
+                canvas = self.render_buffers.get(user.user_ID)
+                if canvas is None or canvas.shape != frame.shape:
+                    canvas = np.empty_like(frame)
+                    self.render_buffers[user.user_ID] = canvas
+                np.copyto(canvas, frame)
+
+            start = time.perf_counter()
+            if user.group is not None:
+                annotated_image = user.group.draw(canvas)
+            else:
+                controller = user.exerciseManager.getCurrentExercise()
+                annotated_image = controller.draw(canvas, user.latest_pose)
+            user.metrics.observe("draw", time.perf_counter() - start)
+            #draw once per user, every tab of the same kind shares the encoded bytes
+            for stream, group in groups:
+                self.encoder.submit(stream, annotated_image,
+                                    lambda jpeg, user=user, stream=stream, group=group: self._deliver(user, stream, group, jpeg, seq))
+
+    def _encode_stream(self, user_id, remote):
+        key = (user_id, remote)
+        stream = self.encode_streams.get(key)
+        if stream is None:
+            stream = AdaptiveJpegStream(REMOTE_VIEWER if remote else LOCAL_PREVIEW)
+            self.encode_streams[key] = stream
+        return stream
+
+    def _deliver(self, user, stream, viewers, jpeg, seq):
+        user.metrics.observe("encode", stream.last_encode_seconds)
+        user.metrics.frames_sent.tick()
+        for viewer in viewers:
+            viewer.publish(jpeg, seq)
+
+    def stats(self):
+        # process wide numbers for /metrics
+        with self.lock:
+            users = len(self.users)
+            viewers = sum(len(v) for v in self.viewers.values())
+            schedulers = list(self.schedulers.items())
+        return {
+            "running": self.running,
+            "users": users,
+            "active_streams": viewers,
+            "detector_instances": len(self.detector_pool.streams),
+            "inference": [{"model": stream.profile.model, "inferred": scheduler.inferred_frames,
+                           "skipped": scheduler.skipped_frames, "detector_skipped": stream.skipped_frames}
+                          for stream, scheduler in schedulers],
+        }
+
+    def _close_viewers(self, user_id=None):
+        with self.lock:
+            viewers = [v for uid, user_viewers in self.viewers.items() for v in user_viewers
+                       if user_id is None or uid == user_id]
+        for viewer in viewers:
+            viewer.close()
+
+    def close_user(self, user_id):
+        # ends every stream of this user, their generators unsubscribe and the user drops out
+        self._close_viewers(user_id)
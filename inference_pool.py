@@ -0,0 +1,312 @@
+# pose inference in worker processes so sessions are not all serialized on one
+# interpreter. every PooledPoseStream sticks to one worker (the model tracks the person
+# between frames, so its frames have to keep going to the same PoseLandmarker) and new
+# streams go to the least busy worker, so throughput grows with the number of cores as
+# sessions are added.
+#
+# frames are not pickled: each stream owns a SharedMemory block the frame is copied into
+# and the worker reads it from there. results come back as one float32
+# (people, 33, 4) array of normalized x, y, z, visibility.
+#
+# a worker that dies (a crash inside mediapipe, the OOM killer) is replaced by the results
+# thread: its streams are opened again in the new process and the frames it had are
+# answered with an error, so nobody waits out result_timeout for them
+import itertools
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from detectors import PoseStream, VisionRunningMode
+from pose_frame import NUM_LANDMARKS
+
+log = logging.getLogger(__name__)
+
+
+def _worker_main(requests, results):
+    # runs in the worker process. requests are ("open", stream_id, profile),
+    # ("frame", stream_id, shm_name, shape, timestamp_ms), ("close", stream_id) or None to stop
+    import mediapipe as mp
+    from detectors import PoseLandmarker
+
+    detectors = {} #stream_id -> PoseLandmarker
+    frames = {} #stream_id -> SharedMemory, attached on first use
+    while True:
+        message = requests.get()
+        if message is None:
+            break
+        kind, stream_id = message[0], message[1]
+        if kind == "open":
+            try:
+                detectors[stream_id] = PoseLandmarker.create_from_options(message[2].options(VisionRunningMode.VIDEO))
+            except Exception as exc:
+                #a missing model must not take the worker down, the stream's frames
+                #come back with this as their error instead
+                detectors[stream_id] = exc
+            continue
+        if kind == "close":
+            detector = detectors.pop(stream_id, None)
+            if detector is not None and not isinstance(detector, Exception):
+                detector.close()
+            shm = frames.pop(stream_id, None)
+            if shm is not None:
+                shm.close()
+            continue
+
+        shm_name, shape, timestamp_ms = message[2:]
+        start = time.perf_counter()
+        try:
+            detector = detectors[stream_id]
+            if isinstance(detector, Exception):
+                raise detector
+            shm = frames.get(stream_id)
+            if shm is None or shm.name != shm_name:
+                #first frame, or the stream grew its buffer for a bigger frame
+                if shm is not None:
+                    shm.close()
+                shm = frames[stream_id] = _attach(shm_name)
+            frame = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf)
+            #mp.Image copies, the shared buffer is free again after this line
+            image = mp.Image(image_format=mp.ImageFormat.SRGB, data=frame)
+            del frame
+            result = detector.detect_for_video(image, timestamp_ms)
+            poses = np.array([[(lm.x, lm.y, lm.z, lm.visibility or 0.0) for lm in person]
+                              for person in result.pose_landmarks], dtype=np.float32).reshape(-1, NUM_LANDMARKS, 4)
+            error = None
+        except Exception as exc:
+            poses = np.zeros((0, NUM_LANDMARKS, 4), dtype=np.float32)
+            error = repr(exc)
+        results.put((stream_id, timestamp_ms, poses, time.perf_counter() - start, error))
+
+    for detector in detectors.values():
+        if not isinstance(detector, Exception):
+            detector.close()
+    for shm in frames.values():
+        shm.close()
+
+
+def _attach(name):
+    # spawned workers share the parent's resource tracker, so attaching does not add a
+    # second owner. the parent unlinks the block when the stream closes
+    return shared_memory.SharedMemory(name=name)
+
+
+# what the listeners get, shaped like mediapipe's result. each entry of pose_landmarks is
+# a (33, 4) array, landmarks_to_frame takes those directly
+class PooledDetectionResult:
+    def __init__(self, poses):
+        self.pose_landmarks = list(poses)
+
+
+# a PoseStream whose detector lives in a pool worker. same listeners, submit() and
+# counters, so a FrameHub cannot tell the difference. like LIVE_STREAM mode a frame
+# submitted while the last one is still in the worker is skipped
+class PooledPoseStream(PoseStream):
+    def __init__(self, pool, worker, stream_id, profile):
+        self.pool = pool
+        self.worker = worker
+        self.stream_id = stream_id
+        self.profile = profile
+        self.running_mode = VisionRunningMode.LIVE_STREAM
+        self.listeners = []
+        self.lock = threading.Lock()
+        self.submit_lock = threading.Lock()
+        self.last_timestamp_ms = -1
+        self.submitted_frames = 0
+        self.skipped_frames = 0
+        self.pending_rois = {} #timestamp_ms -> (roi, submitted at), at most one
+        self.result_timeout = 2.0 #a frame the worker never answered is given up after this
+        self.last_latency = 0.0
+        self.worker_latency = 0.0 #just the detect call inside the worker
+        self.last_error = None
+        self.shm = None
+        self.closed = False
+        worker.requests.put(("open", stream_id, profile))
+
+    def submit(self, image, timestamp, roi=None):
+        timestamp_ms = int(timestamp * 1000)
+        with self.submit_lock:
+            with self.lock:
+                now = time.perf_counter()
+                for stale, (_, submitted) in list(self.pending_rois.items()):
+                    if now - submitted > self.result_timeout:
+                        del self.pending_rois[stale]
+                if self.closed or timestamp_ms <= self.last_timestamp_ms or self.pending_rois:
+                    self.skipped_frames += 1
+                    return False
+                self.pending_rois[timestamp_ms] = (roi, time.perf_counter())
+            self.last_timestamp_ms = timestamp_ms
+            self.submitted_frames += 1
+
+            if self.shm is None or self.shm.size < image.nbytes:
+                #nothing is in flight here, the worker switches over on the next frame
+                self._release_shm()
+                self.shm = shared_memory.SharedMemory(create=True, size=image.nbytes)
+            np.copyto(np.ndarray(image.shape, dtype=np.uint8, buffer=self.shm.buf), image)
+            self.worker.requests.put(("frame", self.stream_id, self.shm.name, image.shape, timestamp_ms))
+        return True
+
+    def _reopen(self, worker):
+        # the old worker is gone, frames go to this one from now on. returns the
+        # timestamps that were in flight, they will never be answered
+        with self.submit_lock:
+            with self.lock:
+                self.worker = worker
+                lost = list(self.pending_rois)
+                if not self.closed:
+                    worker.requests.put(("open", self.stream_id, self.profile))
+        return lost
+
+    def _on_pool_result(self, timestamp_ms, poses, worker_latency, error):
+        with self.lock:
+            roi, submitted = self.pending_rois.pop(timestamp_ms, (None, None))
+        if submitted is None:
+            return #given up on already, or the stream was closed
+        self.last_latency = time.perf_counter() - submitted
+        self.worker_latency = worker_latency
+        self.last_error = error
+        self._dispatch(PooledDetectionResult(poses), timestamp_ms, roi)
+
+    def _release_shm(self):
+        if self.shm is not None:
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+
+    def close(self):
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            self.listeners = []
+        self.pool._forget(self)
+        self.worker.requests.put(("close", self.stream_id))
+        with self.submit_lock:
+            self._release_shm()
+
+
+class _Worker:
+    def __init__(self, context, results, index):
+        self.requests = context.Queue()
+        self.streams = 0
+        self.process = context.Process(target=_worker_main, args=(self.requests, results),
+                                       name=f"PoseWorker-{index}", daemon=True)
+        self.process.start()
+        self.started = time.monotonic()
+
+
+# one per server, shared by every FrameHub (pass it to DetectorPool). workers are
+# spawned on the first stream, not when the pool is made
+class InferencePool:
+    def __init__(self, workers=None):
+        self.size = workers or os.cpu_count() or 1
+        #spawn, not fork: the parent has threads and mediapipe state a fork would copy half of
+        self.context = multiprocessing.get_context("spawn")
+        self.workers = []
+        self.results = None
+        self.streams = {} #stream_id -> PooledPoseStream
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+        self.reader = None
+        self.running = False
+        self.check_interval = 0.5 #how often the results thread looks for dead workers
+        self.restart_delay = 1.0 #a worker that keeps dying is replaced at most this often
+        self.restarts = 0
+
+    def _start(self):
+        self.results = self.context.Queue()
+        self.workers = [_Worker(self.context, self.results, i) for i in range(self.size)]
+        self.running = True
+        self.reader = threading.Thread(target=self._read_results, name="InferencePoolResults", daemon=True)
+        self.reader.start()
+
+    def stream(self, profile):
+        with self.lock:
+            if not self.running:
+                self._start()
+            worker = min(self.workers, key=lambda w: w.streams)
+            worker.streams += 1
+            stream = PooledPoseStream(self, worker, next(self.ids), profile)
+            self.streams[stream.stream_id] = stream
+            return stream
+
+    def _forget(self, stream):
+        with self.lock:
+            if self.streams.pop(stream.stream_id, None) is not None:
+                stream.worker.streams -= 1
+
+    def _read_results(self):
+        last_check = time.monotonic()
+        while self.running:
+            if time.monotonic() - last_check >= self.check_interval:
+                last_check = time.monotonic()
+                self._replace_dead_workers()
+            try:
+                stream_id, timestamp_ms, poses, worker_latency, error = self.results.get(timeout=self.check_interval)
+            except queue.Empty:
+                continue
+            except (EOFError, OSError):
+                return
+            stream = self.streams.get(stream_id)
+            if stream is not None:
+                self._deliver(stream, timestamp_ms, poses, worker_latency, error)
+
+    def _deliver(self, stream, timestamp_ms, poses, worker_latency, error):
+        # this is the only results thread, a failing listener must not end it
+        try:
+            stream._on_pool_result(timestamp_ms, poses, worker_latency, error)
+        except Exception:
+            log.exception("pose result listener failed for stream %s", stream.stream_id)
+
+    def _replace_dead_workers(self):
+        now = time.monotonic()
+        replaced = []
+        with self.lock:
+            if not self.running:
+                return
+            for index, worker in enumerate(self.workers):
+                if worker.process.is_alive() or now - worker.started < self.restart_delay:
+                    continue
+                log.error("pose worker %s exited with %s, starting a new one", worker.process.name, worker.process.exitcode)
+                new = _Worker(self.context, self.results, index)
+                new.streams = worker.streams
+                self.workers[index] = new
+                self.restarts += 1
+                #nothing reads the old queue any more, exiting must not wait on it
+                worker.requests.cancel_join_thread()
+                worker.requests.close()
+                replaced.append((worker, new))
+            streams = list(self.streams.values())
+        for worker, new in replaced:
+            error = repr(RuntimeError(f"pose worker exited with {worker.process.exitcode}"))
+            for stream in streams:
+                if stream.worker is worker:
+                    for timestamp_ms in stream._reopen(new):
+                        self._deliver(stream, timestamp_ms, np.zeros((0, NUM_LANDMARKS, 4), dtype=np.float32), 0.0, error)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "workers": self.size,
+                "alive": sum(w.process.is_alive() for w in self.workers),
+                "restarts": self.restarts,
+                "streams": [w.streams for w in self.workers],
+            }
+
+    def close(self):
+        with self.lock:
+            streams = list(self.streams.values())
+        for stream in streams:
+            stream.close()
+        with self.lock:
+            self.running = False
+            workers, self.workers = self.workers, []
+        for worker in workers:
+            worker.requests.put(None)
+        for worker in workers:
+            worker.process.join(timeout=2.0)
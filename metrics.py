@@ -0,0 +1,104 @@
+import bisect
+import os
+import sys
+import time
+
+try:
+    import resource
+except ImportError: #windows
+    resource = None
+
+# upper bounds of the latency buckets in milliseconds, the last one catches everything
+BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, float("inf"))
+
+PIPELINE_STAGES = ("capture", "detect", "update", "draw", "encode")
+
+
+# fixed bucket histogram, observe() is a bisect and two additions so it can stay on
+# all the time. no lock, a lost increment under contention does not matter here
+class LatencyHistogram:
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS_MS)
+        self.total = 0
+        self.sum_ms = 0.0
+
+    def observe(self, seconds):
+        ms = seconds * 1000.0
+        self.counts[bisect.bisect_left(BUCKETS_MS, ms)] += 1
+        self.total += 1
+        self.sum_ms += ms
+
+    def snapshot(self):
+        return {
+            "count": self.total,
+            "mean_ms": round(self.sum_ms / self.total, 3) if self.total else None,
+            "buckets_ms": {("+Inf" if bound == float("inf") else str(bound)): count
+                           for bound, count in zip(BUCKETS_MS, self.counts)},
+        }
+
+
+# counts events and turns them into a rate over roughly the last `window` seconds
+class RateCounter:
+    def __init__(self, window=5.0):
+        self.window = window
+        self.total = 0
+        self.window_start = time.monotonic()
+        self.window_count = 0
+        self.rate = 0.0
+
+    def tick(self, now=None):
+        now = time.monotonic() if now is None else now
+        self.total += 1
+        self.window_count += 1
+        elapsed = now - self.window_start
+        if elapsed >= self.window:
+            self.rate = self.window_count / elapsed
+            self.window_start = now
+            self.window_count = 0
+
+    def current(self, now=None):
+        now = time.monotonic() if now is None else now
+        elapsed = now - self.window_start
+        #nothing ticked for a whole window (the stream has stalled) or the first window
+        #is still filling up, either way the open window is all there is
+        if elapsed >= self.window or (self.total == self.window_count and elapsed > 0):
+            return self.window_count / elapsed
+        return self.rate
+
+
+# per-user frame pipeline telemetry, filled in by the frame hub
+class PipelineMetrics:
+    def __init__(self):
+        self.stages = {stage: LatencyHistogram() for stage in PIPELINE_STAGES}
+        self.updates = RateCounter() #detection results that reached the controller
+        self.frames_sent = RateCounter() #annotated frames handed to the user's viewers
+        self.dropped_encodes = 0 #frames not encoded because the encoder was still busy
+
+    def observe(self, stage, seconds):
+        self.stages[stage].observe(seconds)
+
+    def snapshot(self):
+        now = time.monotonic()
+        return {
+            "update_fps": round(self.updates.current(now), 2),
+            "stream_fps": round(self.frames_sent.current(now), 2),
+            "updates": self.updates.total,
+            "frames_sent": self.frames_sent.total,
+            "dropped_encodes": self.dropped_encodes,
+            "stages": {stage: histogram.snapshot() for stage, histogram in self.stages.items()},
+        }
+
+
+def process_memory():
+    # current and peak resident memory in bytes, None where the platform cannot tell us
+    peak = None
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        peak = peak if sys.platform == "darwin" else peak * 1024 #ru_maxrss is KiB on linux
+    current = None
+    try:
+        with open("/proc/self/statm") as file:
+            current = int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        pass
+    return {"rss_bytes": current, "peak_rss_bytes": peak}
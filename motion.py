@@ -0,0 +1,54 @@
+import cv2
+import numpy as np
+
+
+# cheap "is anything moving" check: frame difference of a tiny grayscale copy.
+# the two small buffers are swapped each frame so nothing is allocated per call
+class MotionEstimator:
+    def __init__(self, size=(64, 48)):
+        self.size = size
+        self.small = np.zeros((size[1], size[0], 3), dtype=np.uint8)
+        self.gray = np.zeros((size[1], size[0]), dtype=np.uint8)
+        self.previous = np.zeros((size[1], size[0]), dtype=np.uint8)
+        self.diff = np.zeros((size[1], size[0]), dtype=np.uint8)
+        self.has_previous = False
+        self.motion = 1.0
+
+    def estimate(self, frame):
+        # mean absolute difference to the last frame, 0 (still) .. 1
+        cv2.resize(frame, self.size, dst=self.small, interpolation=cv2.INTER_AREA)
+        cv2.cvtColor(self.small, cv2.COLOR_BGR2GRAY, dst=self.gray)
+        if self.has_previous:
+            cv2.absdiff(self.gray, self.previous, dst=self.diff)
+            self.motion = cv2.mean(self.diff)[0] / 255.0
+        else:
+            self.motion = 1.0 #nothing to compare with yet, assume movement
+            self.has_previous = True
+        self.gray, self.previous = self.previous, self.gray
+        return self.motion
+
+
+# decides whether a frame goes to the detector. while the user is moving we run at
+# max_fps (the cpu budget per user), while still we drop to idle_fps and the controllers
+# keep the last pose. any movement above the threshold goes straight back to full rate
+class InferenceScheduler:
+    def __init__(self, max_fps=15.0, idle_fps=3.0, motion_threshold=0.01):
+        self.max_fps = max_fps
+        self.idle_fps = idle_fps
+        self.motion_threshold = motion_threshold
+        self.last_inference = None
+        self.inferred_frames = 0
+        self.skipped_frames = 0
+
+    def current_fps(self, motion):
+        return self.max_fps if motion >= self.motion_threshold else self.idle_fps
+
+    def should_infer(self, motion, timestamp):
+        fps = self.current_fps(motion)
+        due = fps > 0 and (self.last_inference is None or timestamp - self.last_inference >= 1.0 / fps)
+        if not due:
+            self.skipped_frames += 1
+            return False
+        self.last_inference = timestamp
+        self.inferred_frames += 1
+        return True
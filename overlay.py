@@ -0,0 +1,17 @@
+import cv2
+
+from pose_frame import pixel
+
+
+# controllers declare what they draw as data instead of hand-writing cv2 calls:
+#   segments = [(landmark, landmark, color, thickness), ...]
+#   points = [(landmark, radius, color), ...]
+# drawing happens straight onto the image that is passed in, nothing is copied
+def draw_overlay(image, pose, segments, points=()):
+    if pose is None:
+        return image
+    for start, end, color, thickness in segments:
+        cv2.line(image, pixel(pose, start), pixel(pose, end), color, thickness)
+    for index, radius, color in points:
+        cv2.circle(image, pixel(pose, index), radius, color, -1)
+    return image
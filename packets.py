@@ -0,0 +1,96 @@
+# landmark packets for browsers that run pose estimation themselves. the server then
+# only runs the exercise controllers, no inference at all.
+#
+# packet layout (little endian, 251 bytes), a request body is one or more of them:
+#   header  4s magic b'FCLM', u1 version, u1 flags, u1 landmarks (33), u1 reserved,
+#           f8 timestamp in seconds, u2 width, u2 height of the frame the points are from
+#   points  33 x (u2 x, u2 y, i2 z, u1 visibility)
+# x and y are normalized 0..1 scaled to 0..65535, z is scaled by 16384 (about +-2),
+# visibility 0..1 scaled to 0..255
+import math
+import struct
+
+import numpy as np
+
+from pose_frame import NUM_LANDMARKS, new_pose_frame
+
+MAGIC = b'FCLM'
+VERSION = 1
+HEADER = struct.Struct('<4sBBBBdHH')
+HAS_POSE = 1 #flags bit, off when the browser found nobody
+
+POINT_DTYPE = np.dtype([('x', '<u2'), ('y', '<u2'), ('z', '<i2'), ('visibility', 'u1')])
+PACKET_SIZE = HEADER.size + NUM_LANDMARKS * POINT_DTYPE.itemsize
+
+XY_SCALE = 65535.0
+Z_SCALE = 16384.0
+VISIBILITY_SCALE = 255.0
+
+
+class PacketError(ValueError):
+    pass
+
+
+def encode_packet(timestamp, pose, frame_shape):
+    # pose is a pixel (33, 4) pose frame or None. the browser builds these itself, this
+    # is for tests and tools
+    h, w = frame_shape[:2]
+    points = np.zeros(NUM_LANDMARKS, dtype=POINT_DTYPE)
+    flags = 0
+    if pose is not None:
+        flags = HAS_POSE
+        points['x'] = np.clip(np.rint(pose[:, 0] / w * XY_SCALE), 0, XY_SCALE)
+        points['y'] = np.clip(np.rint(pose[:, 1] / h * XY_SCALE), 0, XY_SCALE)
+        points['z'] = np.clip(np.rint(pose[:, 2] * Z_SCALE), -32768, 32767)
+        points['visibility'] = np.clip(np.rint(pose[:, 3] * VISIBILITY_SCALE), 0, VISIBILITY_SCALE)
+    return HEADER.pack(MAGIC, VERSION, flags, NUM_LANDMARKS, 0, timestamp, w, h) + points.tobytes()
+
+
+# decodes one user's packets into a reused pose frame and drops anything stale
+class LandmarkReceiver:
+    def __init__(self):
+        self.pose = new_pose_frame()
+        self.last_timestamp = None
+        self.received_packets = 0
+        self.stale_packets = 0
+        self.rejected_packets = 0
+
+    def packets(self, data):
+        # yields (timestamp, pose or None, frame_shape) for every packet in data that is
+        # newer than the last one. the pose is the same buffer every time, use it before
+        # asking for the next packet. raises PacketError if data is not a run of packets
+        if not data or len(data) % PACKET_SIZE:
+            self.rejected_packets += 1
+            raise PacketError(f"body is {len(data)} bytes, not a multiple of {PACKET_SIZE}")
+        view = memoryview(data)
+        for offset in range(0, len(data), PACKET_SIZE):
+            magic, version, flags, landmarks, reserved, timestamp, w, h = HEADER.unpack_from(view, offset)
+            if magic != MAGIC or version != VERSION or landmarks != NUM_LANDMARKS:
+                self.rejected_packets += 1
+                raise PacketError(f"not a version {VERSION} landmark packet")
+            if not math.isfinite(timestamp) or w == 0 or h == 0:
+                self.rejected_packets += 1
+                raise PacketError("bad timestamp or frame size")
+            self.received_packets += 1
+            if self.last_timestamp is not None and timestamp <= self.last_timestamp:
+                self.stale_packets += 1
+                continue
+            self.last_timestamp = timestamp
+
+            if not flags & HAS_POSE:
+                yield timestamp, None, (h, w, 3)
+                continue
+            points = np.frombuffer(view, dtype=POINT_DTYPE, count=NUM_LANDMARKS, offset=offset + HEADER.size)
+            pose = self.pose
+            np.multiply(points['x'], w / XY_SCALE, out=pose[:, 0])
+            np.multiply(points['y'], h / XY_SCALE, out=pose[:, 1])
+            np.multiply(points['z'], 1.0 / Z_SCALE, out=pose[:, 2])
+            np.multiply(points['visibility'], 1.0 / VISIBILITY_SCALE, out=pose[:, 3])
+            yield timestamp, pose, (h, w, 3)
+
+    def stats(self):
+        return {
+            "received": self.received_packets,
+            "stale": self.stale_packets,
+            "rejected": self.rejected_packets,
+        }
@@ -0,0 +1,59 @@
+import numpy as np
+
+NUM_LANDMARKS = 33
+
+# a pose frame is one float32 (33, 4) array per person: pixel x, pixel y, z, visibility.
+# it is filled once per detection and shared by the controller's update() and draw()
+
+
+def new_pose_frame():
+    return np.zeros((NUM_LANDMARKS, 4), dtype=np.float32)
+
+
+def landmarks_to_frame(pose_landmarks, image_shape, out=None, roi=None):
+    # roi is (x0, y0, width, height) of the region the detector actually saw, in
+    # pixels of the full image, when the frame was cropped before inference
+    if roi is None:
+        h, w = image_shape[:2]
+        roi = (0, 0, w, h)
+    x0, y0, w, h = roi
+    if out is None:
+        out = new_pose_frame()
+
+    if isinstance(pose_landmarks, np.ndarray):
+        #already a normalized (33, 4) array, from inference_pool
+        out[:] = pose_landmarks
+    else:
+        for i, lm in enumerate(pose_landmarks):
+            out[i] = (lm.x, lm.y, lm.z, lm.visibility or 0.0)
+    out[:, 0] *= w
+    out[:, 1] *= h
+    out[:, 0] += x0
+    out[:, 1] += y0
+    return out
+
+
+def joint_triples(*triples):
+    # [(end, vertex, end), ...] -> int array that joint_angles can index with
+    return np.array(triples, dtype=np.intp).reshape(-1, 3)
+
+
+# batched version of the old angleBetweenLines(a, b, c): every (end, vertex, end) row of
+# triples in one go, in degrees between 0 and 180. frame can also be a (frames, 33, 4)
+# stack of pose frames, the result is then (frames, len(triples))
+def joint_angles(frame, triples, out=None):
+    a = frame[..., triples[:, 0], :2]
+    b = frame[..., triples[:, 1], :2]
+    c = frame[..., triples[:, 2], :2]
+
+    radians = (np.arctan2(c[..., 1] - b[..., 1], c[..., 0] - b[..., 0])
+               - np.arctan2(a[..., 1] - b[..., 1], a[..., 0] - b[..., 0]))
+    angles = np.degrees(radians, out=out)
+    np.abs(angles, out=angles)
+    np.subtract(360.0, angles, out=angles, where=angles > 180.0)
+    return angles
+
+
+def pixel(frame, index):
+    # cv2 drawing wants plain int tuples
+    return int(frame[index, 0]), int(frame[index, 1])
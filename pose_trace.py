@@ -0,0 +1,113 @@
+# compact binary recording of pose frames so counting changes can be re-checked
+# without running the model again.
+#
+# file layout (little endian):
+#   header  8s magic, u2 version, u2 landmarks, u2 channels, u2 reserved, u4 width, u4 height
+#   records timestamp f8, flags u4, reserved u4, pose f4[33][4]   (544 bytes each)
+# records are only ever appended. a record cut short by a crash is ignored on read
+import os
+import struct
+
+import numpy as np
+
+from pose_frame import NUM_LANDMARKS
+
+MAGIC = b'FCTRACE\0'
+VERSION = 1
+TRACE_EXTENSION = '.fctrace'
+HEADER = struct.Struct('<8sHHHHII')
+HEADER_SIZE = HEADER.size
+
+HAS_POSE = 1 #flags bit, off when nobody was in view on that frame
+
+RECORD_DTYPE = np.dtype([
+    ('timestamp', '<f8'),
+    ('flags', '<u4'),
+    ('reserved', '<u4'),
+    ('pose', '<f4', (NUM_LANDMARKS, 4)),
+])
+
+
+class PoseTraceWriter:
+    def __init__(self, path, frame_shape):
+        self.path = path
+        self.frame_shape = frame_shape
+        h, w = frame_shape[:2]
+        exists = os.path.exists(path) and os.path.getsize(path) >= HEADER_SIZE
+        if exists:
+            with open(path, 'rb') as file:
+                header = read_header(file)
+            if (header["width"], header["height"]) != (w, h):
+                raise ValueError(f"{path} was recorded at {header['width']}x{header['height']}, not {w}x{h}")
+        self.file = open(path, 'ab')
+        if not exists:
+            self.file.write(HEADER.pack(MAGIC, VERSION, NUM_LANDMARKS, 4, 0, w, h))
+        self.record = np.zeros(1, dtype=RECORD_DTYPE) #reused for every write
+        self.frames = 0
+
+    def write(self, timestamp, pose):
+        record = self.record[0]
+        record['timestamp'] = timestamp
+        if pose is None:
+            record['flags'] = 0
+            record['pose'] = 0
+        else:
+            record['flags'] = HAS_POSE
+            record['pose'] = pose
+        self.file.write(self.record.data)
+        self.frames += 1
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+
+
+def read_header(file):
+    raw = file.read(HEADER_SIZE)
+    if len(raw) < HEADER_SIZE:
+        raise ValueError("not a pose trace, file is too short")
+    magic, version, landmarks, channels, reserved, width, height = HEADER.unpack(raw)
+    if magic != MAGIC:
+        raise ValueError("not a pose trace, bad magic")
+    if version != VERSION or landmarks != NUM_LANDMARKS or channels != 4:
+        raise ValueError(f"unsupported pose trace version {version} ({landmarks}x{channels})")
+    return {"version": version, "width": width, "height": height}
+
+
+# memory maps a trace, nothing is read until it is used
+class PoseTrace:
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as file:
+            header = read_header(file)
+        self.frame_shape = (header["height"], header["width"], 3)
+        count = (os.path.getsize(path) - HEADER_SIZE) // RECORD_DTYPE.itemsize
+        if count > 0:
+            self.records = np.memmap(path, dtype=RECORD_DTYPE, mode='r', offset=HEADER_SIZE, shape=(count,))
+        else:
+            self.records = np.zeros(0, dtype=RECORD_DTYPE)
+
+    def __len__(self):
+        return len(self.records)
+
+    @property
+    def timestamps(self):
+        return self.records['timestamp']
+
+    @property
+    def poses(self):
+        return self.records['pose'] #(frames, 33, 4)
+
+    @property
+    def has_pose(self):
+        return (self.records['flags'] & HAS_POSE) != 0
+
+    def frames(self):
+        # (timestamp, pose or None) in recording order, poses are views into the map
+        poses = self.poses
+        has_pose = self.has_pose
+        for i, timestamp in enumerate(self.timestamps):
+            yield float(timestamp), (poses[i] if has_pose[i] else None)
@@ -0,0 +1,83 @@
+import cv2
+import numpy as np
+
+
+# turns a full BGR camera frame into the small RGB image the detector sees.
+# once we know where the person is, a padded square around them is cropped and resized
+# to input_size, otherwise the whole frame is scaled down to full_frame_width.
+# prepare() also returns the roi (x0, y0, width, height) in full-frame pixels so the
+# landmarks can be mapped back with landmarks_to_frame(..., roi=roi).
+# with crop=False (detectors looking for several people) it always sends the whole
+# frame: a crop around the people already found would hide anybody walking in, and two
+# people far apart do not fit in one square anyway
+class PosePreprocessor:
+    def __init__(self, input_size=256, full_frame_width=640, padding=1.5, min_visibility=0.5, crop=True):
+        self.use_crop = crop
+        self.input_size = input_size
+        self.full_frame_width = full_frame_width
+        self.padding = padding
+        self.min_visibility = min_visibility
+        self.crop = None #(x0, y0, side) of the current person crop, None = whole frame
+        self.resized = None
+        self.rgb = None
+
+    def prepare(self, frame):
+        h, w = frame.shape[:2]
+        crop = self.crop
+        if crop is None:
+            x0, y0 = 0, 0
+            crop_w, crop_h = w, h
+            out_w = min(w, self.full_frame_width)
+            out_h = int(round(h * out_w / w))
+        else:
+            x0, y0, side = crop
+            crop_w = crop_h = side
+            out_w = out_h = self.input_size
+
+        region = frame[y0:y0 + crop_h, x0:x0 + crop_w]
+        if self.resized is None or self.resized.shape[:2] != (out_h, out_w):
+            self.resized = np.empty((out_h, out_w, 3), dtype=np.uint8)
+            self.rgb = np.empty((out_h, out_w, 3), dtype=np.uint8)
+
+        if (crop_w, crop_h) == (out_w, out_h):
+            cv2.cvtColor(region, cv2.COLOR_BGR2RGB, dst=self.rgb)
+        else:
+            cv2.resize(region, (out_w, out_h), dst=self.resized, interpolation=cv2.INTER_AREA)
+            #the camera gives BGR, mediapipe wants SRGB. convert once, on the small image
+            cv2.cvtColor(self.resized, cv2.COLOR_BGR2RGB, dst=self.rgb)
+        return self.rgb, (x0, y0, crop_w, crop_h)
+
+    def update(self, pose, frame_shape):
+        # pose is the full-frame (33, 4) pose frame of the last result, or None if nobody was found
+        if pose is None or not self.use_crop:
+            self.crop = None
+            return
+        h, w = frame_shape[:2]
+        visible = pose[:, 3] >= self.min_visibility
+        if visible.sum() < 4:
+            self.crop = None
+            return
+
+        xs = pose[visible, 0]
+        ys = pose[visible, 1]
+        left, right = float(xs.min()), float(xs.max())
+        top, bottom = float(ys.min()), float(ys.max())
+
+        #keep the current crop while the person is comfortably inside it so the detector
+        #does not see the picture shift around every frame
+        if self.crop is not None:
+            x0, y0, side = self.crop
+            margin = side * 0.1
+            body = max(right - left, bottom - top) * self.padding
+            inside = (left > x0 + margin and right < x0 + side - margin and
+                      top > y0 + margin and bottom < y0 + side - margin)
+            if inside and body > side * 0.6:
+                return
+
+        side = int(max(right - left, bottom - top) * self.padding)
+        side = min(max(side, self.input_size), w, h)
+        cx = (left + right) / 2
+        cy = (top + bottom) / 2
+        x0 = int(min(max(cx - side / 2, 0), w - side))
+        y0 = int(min(max(cy - side / 2, 0), h - side))
+        self.crop = (x0, y0, side)
@@ -0,0 +1,223 @@
+# declarative rep counting. an exercise is an ExerciseSpec, plain data: the joint
+# features it looks at, its states and the transitions between them with their
+# thresholds. the predicates are compiled into arrays once, then
+#   SpecController   runs them on one pose frame at a time for the live camera
+#   ExerciseSpec.evaluate   runs them on a whole (frames, 33, 4) recording in one pass
+# both count exactly the same way, so a recorded trace re-scores like the live session
+import numpy as np
+
+from overlay import draw_overlay
+from pose_frame import joint_angles, joint_triples
+
+OPERATORS = {"<": np.less, "<=": np.less_equal, ">": np.greater, ">=": np.greater_equal}
+
+
+# features work on (..., 33, 4), one pose frame or a stack of them
+
+class Angle:
+    # angle at the vertex between the rays to the two ends, 0..180 degrees
+    def __init__(self, end, vertex, other_end):
+        self.triple = (end, vertex, other_end)
+
+
+class Steepness:
+    # |dy| / |dx| of the line between two landmarks, above 1 the line is more upright than flat
+    def __init__(self, a, b):
+        self.a = a
+        self.b = b
+
+    def compute(self, poses):
+        dx = np.abs(poses[..., self.a, 0] - poses[..., self.b, 0])
+        dy = np.abs(poses[..., self.a, 1] - poses[..., self.b, 1])
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return dy / dx
+
+
+class Lift:
+    # how far point is above reference, in lengths of the scale_a to scale_b segment so
+    # it does not depend on how far away the person stands
+    def __init__(self, point, reference, scale_a, scale_b):
+        self.point = point
+        self.reference = reference
+        self.scale_a = scale_a
+        self.scale_b = scale_b
+
+    def compute(self, poses):
+        scale = np.hypot(poses[..., self.scale_a, 0] - poses[..., self.scale_b, 0],
+                         poses[..., self.scale_a, 1] - poses[..., self.scale_b, 1])
+        with np.errstate(divide="ignore", invalid="ignore"):
+            #image y grows downwards
+            return (poses[..., self.reference, 1] - poses[..., self.point, 1]) / scale
+
+
+# when is a list of (feature, operator, threshold) that all have to hold
+class Transition:
+    def __init__(self, source, target, when, count=False):
+        self.source = source
+        self.target = target
+        self.when = list(when)
+        self.count = count
+
+
+class ExerciseSpec:
+    # states[0] is where a new controller starts. requires is checked before any
+    # transition, while it does not hold the state is left alone (for example not lying
+    # down for a bridge). with hold_state the count is whole seconds spent in that state
+    # instead of reps
+    def __init__(self, name, features, states, transitions, requires=(), hold_state=None,
+                 segments=(), state_segments=None, points=()):
+        self.name = name
+        self.feature_names = list(features)
+        self.states = list(states)
+        self.transitions = list(transitions)
+        self.requires = list(requires)
+        self.hold_state = hold_state
+        self.segments = list(segments)
+        self.state_segments = state_segments or {}
+        self.points = list(points)
+        self._compile(features)
+
+    def _compile(self, features):
+        index = {name: i for i, name in enumerate(self.feature_names)}
+        self.angle_columns = [index[name] for name, f in features.items() if isinstance(f, Angle)]
+        self.angle_triples = joint_triples(*[f.triple for f in features.values() if isinstance(f, Angle)])
+        self.other_features = [(index[name], f) for name, f in features.items() if not isinstance(f, Angle)]
+
+        #every transition's conditions, requires included, flattened into parallel arrays
+        conditions = []
+        for transition in self.transitions:
+            conditions.extend(self.requires + transition.when)
+        self.condition_feature = np.array([index[feature] for feature, op, threshold in conditions], dtype=np.intp)
+        self.condition_threshold = np.array([threshold for feature, op, threshold in conditions], dtype=np.float64)
+        self.condition_ops = [(OPERATORS[op], np.array([i for i, c in enumerate(conditions) if c[1] == op], dtype=np.intp))
+                              for op in OPERATORS if any(c[1] == op for c in conditions)]
+        #(transitions, conditions) marks which conditions belong to which transition
+        self.membership = np.zeros((len(self.transitions), len(conditions)), dtype=bool)
+        start = 0
+        for t, transition in enumerate(self.transitions):
+            end = start + len(self.requires) + len(transition.when)
+            self.membership[t, start:end] = True
+            start = end
+
+        state_index = {state: i for i, state in enumerate(self.states)}
+        self.transition_source = np.array([state_index[t.source] for t in self.transitions], dtype=np.intp)
+        self.transition_target = np.array([state_index[t.target] for t in self.transitions], dtype=np.intp)
+        self.transition_count = np.array([t.count for t in self.transitions], dtype=bool)
+        #transitions leaving each state in the order they were declared, the first that holds wins
+        self.outgoing = [[t for t in range(len(self.transitions)) if self.transition_source[t] == s]
+                         for s in range(len(self.states))]
+        self.hold_index = state_index[self.hold_state] if self.hold_state is not None else None
+
+    def features(self, poses):
+        # (..., features) in feature_names order
+        values = np.empty(poses.shape[:-2] + (len(self.feature_names),), dtype=np.float64)
+        if self.angle_columns:
+            values[..., self.angle_columns] = joint_angles(poses, self.angle_triples)
+        for column, feature in self.other_features:
+            values[..., column] = feature.compute(poses)
+        return values
+
+    def transitions_ok(self, values):
+        # (..., transitions) bool, true where every condition of the transition holds
+        current = values[..., self.condition_feature]
+        results = np.empty(current.shape, dtype=bool)
+        for op, columns in self.condition_ops:
+            results[..., columns] = op(current[..., columns], self.condition_threshold[columns])
+        return (results[..., None, :] | ~self.membership).all(axis=-1)
+
+    def evaluate(self, poses, timestamps, has_pose=None):
+        # re-scores a recording. returns (states, counts), the state index and the count
+        # after every frame. frames where has_pose is false leave the state alone
+        frames = len(poses)
+        ok = self.transitions_ok(self.features(poses))
+        if has_pose is not None:
+            ok &= np.asarray(has_pose, dtype=bool)[:, None]
+
+        #next state and whether it counts, for every (state, frame) pair. filled in reverse
+        #so the first declared transition of a state is the one left standing
+        next_state = np.repeat(np.arange(len(self.states), dtype=np.intp)[:, None], frames, axis=1)
+        counted = np.zeros((len(self.states), frames), dtype=bool)
+        for t in reversed(range(len(self.transitions))):
+            source = self.transition_source[t]
+            next_state[source, ok[:, t]] = self.transition_target[t]
+            counted[source, ok[:, t]] = self.transition_count[t]
+
+        #the only sequential part left is following the table, plain int lookups
+        states = np.empty(frames, dtype=np.intp)
+        reps = np.empty(frames, dtype=bool)
+        next_rows = next_state.tolist()
+        counted_rows = counted.tolist()
+        state = 0
+        for i in range(frames):
+            reps[i] = counted_rows[state][i]
+            state = next_rows[state][i]
+            states[i] = state
+
+        if self.hold_index is None:
+            return states, np.cumsum(reps)
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+        previous = np.concatenate(([0], states[:-1]))
+        #time only counts between two frames that both had a pose, like SpecController
+        seen = np.ones(frames, dtype=bool) if has_pose is None else np.asarray(has_pose, dtype=bool)
+        both_seen = seen & np.concatenate(([False], seen[:-1]))
+        elapsed = np.diff(timestamps, prepend=timestamps[:1]) * ((previous == self.hold_index) & both_seen)
+        return states, np.floor(np.cumsum(elapsed)).astype(np.int64)
+
+    def controller(self):
+        return SpecController(self)
+
+
+# the live side of an ExerciseSpec, same update()/draw() as the hand written controllers
+class SpecController:
+    __slots__ = ("spec", "state_index", "_count", "held_seconds", "last_timestamp", "values")
+
+    def __init__(self, spec):
+        self.spec = spec
+        self.state_index = 0
+        self.count = 0
+        self.last_timestamp = None #of the last frame that had a pose
+        self.values = None #latest feature values, in spec.feature_names order
+
+    #the state name, setting it (the reset button does) moves the state index too
+    @property
+    def state(self):
+        return self.spec.states[self.state_index]
+
+    @state.setter
+    def state(self, name):
+        self.state_index = self.spec.states.index(name)
+
+    #for a hold the count is whole seconds held, setting it (the reset button, replay)
+    #sets the hold time too so the next frame does not bring the old count back
+    @property
+    def count(self):
+        return self._count
+
+    @count.setter
+    def count(self, value):
+        self._count = value
+        self.held_seconds = float(value)
+
+    def update(self, pose, image_shape, timestamp):
+        if pose is None:
+            #nobody in view stops the hold clock, like evaluate()
+            self.last_timestamp = None
+            return
+        #hold time only runs between two frames that both had a pose
+        if self.spec.hold_index is not None and self.last_timestamp is not None and self.state_index == self.spec.hold_index:
+            self.held_seconds += timestamp - self.last_timestamp
+            self._count = int(self.held_seconds)
+        self.last_timestamp = timestamp
+
+        self.values = self.spec.features(pose)
+        ok = self.spec.transitions_ok(self.values)
+        for t in self.spec.outgoing[self.state_index]:
+            if ok[t]:
+                self.state_index = int(self.spec.transition_target[t])
+                if self.spec.transition_count[t]:
+                    self.count += 1
+                return
+
+    def draw(self, image, pose):
+        segments = self.spec.state_segments.get(self.state, self.spec.segments)
+        return draw_overlay(image, pose, segments, self.spec.points)
@@ -0,0 +1,225 @@
+# headless replay of recorded workout videos through the exercise controllers.
+#
+#   python replay.py squats clips/squat_front.mp4
+#   python replay.py lunges clips/ --json lunges.json
+#   python replay.py squats clips/ --record traces/     (also save the poses, see pose_trace.py)
+#   python replay.py squats traces/                     (re-score saved poses, no model needed)
+#
+# frames are read as fast as the cpu allows and every frame is stamped with
+# frame_index / video fps, so results do not depend on how fast the machine is
+import argparse
+import json
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from exercises import EXERCISE_CONTROLLERS, EXERCISE_SPECS
+from pose_frame import landmarks_to_frame, new_pose_frame
+from pose_trace import TRACE_EXTENSION, PoseTrace, PoseTraceWriter
+from smoothing import OneEuroFilter
+
+VIDEO_EXTENSIONS = ('.mp4', '.mov', '.avi', '.mkv', '.webm', '.m4v')
+
+
+def find_videos(path):
+    if os.path.isdir(path):
+        return sorted(os.path.join(path, name) for name in os.listdir(path)
+                      if name.lower().endswith(VIDEO_EXTENSIONS + (TRACE_EXTENSION,)))
+    return [path]
+
+
+# feeds (pose, image_shape, timestamp) into a fresh controller and keeps track of what it did
+class ReplayRecorder:
+    def __init__(self, exercise):
+        self.exercise = exercise
+        self.controller = EXERCISE_CONTROLLERS[exercise]()
+        self.transitions = [] #(frame_index, timestamp, from_state, to_state, count)
+        self.frames = 0
+        self.frames_with_pose = 0
+
+    def step(self, pose, image_shape, timestamp):
+        before = self.controller.state
+        self.controller.update(pose, image_shape, timestamp)
+        self.frames += 1
+        if pose is not None:
+            self.frames_with_pose += 1
+        if self.controller.state != before:
+            self.transitions.append((self.frames - 1, round(timestamp, 3), before, self.controller.state,
+                                     self.controller.count))
+
+    def summary(self):
+        return {
+            "exercise": self.exercise,
+            "reps": self.controller.count,
+            "final_state": self.controller.state,
+            "frames": self.frames,
+            "frames_with_pose": self.frames_with_pose,
+            "transitions": self.transitions,
+        }
+
+
+def replay_video(path, exercise, max_frames=None, record_path=None, smoothing=True):
+    #mediapipe is only needed when there is video to run the model on
+    from detectors import PoseStream, VisionRunningMode, get_profile
+
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        raise IOError(f"could not open {path}")
+    fps = capture.get(cv2.CAP_PROP_FPS) or 30.0
+
+    recorder = ReplayRecorder(exercise)
+    pose_buffer = new_pose_frame()
+    smoother = OneEuroFilter() if smoothing else None #same filtering as the live hub
+    latest = {}
+
+    def on_detection(detection_result, timestamp, roi):
+        latest["result"] = detection_result
+
+    #VIDEO mode is synchronous, the listener has run by the time submit() returns.
+    #a new stream per video so tracking does not carry over between clips
+    stream = PoseStream(get_profile(exercise), VisionRunningMode.VIDEO)
+    stream.add_listener(on_detection)
+
+    writer = None
+    start = time.perf_counter()
+    frame_index = 0
+    try:
+        while max_frames is None or frame_index < max_frames:
+            success, frame = capture.read()
+            if not success or frame is None:
+                break
+            #+1 so the first frame is not at 0 ms, the stream wants strictly increasing times
+            timestamp = (frame_index + 1) / fps
+            rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            stream.submit(rgb, timestamp)
+
+            result = latest.pop("result", None)
+            pose = None
+            if result is not None and result.pose_landmarks:
+                pose = landmarks_to_frame(result.pose_landmarks[0], frame.shape, pose_buffer)
+                if smoother is not None:
+                    smoother.filter(pose, timestamp)
+            elif smoother is not None:
+                smoother.reset()
+            if record_path is not None:
+                if writer is None:
+                    writer = PoseTraceWriter(record_path, frame.shape)
+                writer.write(timestamp, pose)
+            recorder.step(pose, frame.shape, timestamp)
+            frame_index += 1
+    finally:
+        stream.close()
+        capture.release()
+        if writer is not None:
+            writer.close()
+
+    return finish_summary(recorder, path, fps, frame_index, time.perf_counter() - start)
+
+
+def replay_trace(path, exercise, max_frames=None):
+    trace = PoseTrace(path)
+    start = time.perf_counter()
+    spec = EXERCISE_SPECS.get(exercise)
+    if spec is not None:
+        #declarative exercises re-score the whole trace as arrays in one go
+        frame_index = len(trace) if max_frames is None else min(len(trace), max_frames)
+        recorder = score_trace(spec, trace, frame_index)
+    else:
+        recorder = ReplayRecorder(exercise)
+        frame_index = 0
+        for timestamp, pose in trace.frames():
+            if max_frames is not None and frame_index >= max_frames:
+                break
+            recorder.step(pose, trace.frame_shape, timestamp)
+            frame_index += 1
+
+    timestamps = trace.timestamps
+    duration = float(timestamps[frame_index - 1] - timestamps[0]) if frame_index > 1 else 0.0
+    fps = (frame_index - 1) / duration if duration > 0 else 30.0
+    return finish_summary(recorder, path, fps, frame_index, time.perf_counter() - start)
+
+
+def score_trace(spec, trace, frames):
+    # the same summary ReplayRecorder builds, from ExerciseSpec.evaluate
+    timestamps = trace.timestamps[:frames]
+    has_pose = trace.has_pose[:frames]
+    states, counts = spec.evaluate(trace.poses[:frames], timestamps, has_pose)
+
+    recorder = ReplayRecorder(spec.name)
+    recorder.frames = frames
+    recorder.frames_with_pose = int(np.count_nonzero(has_pose))
+    previous = np.concatenate(([0], states[:-1]))
+    for i in np.flatnonzero(states != previous):
+        recorder.transitions.append((int(i), round(float(timestamps[i]), 3), spec.states[previous[i]],
+                                     spec.states[states[i]], int(counts[i])))
+    if frames:
+        recorder.controller.state = spec.states[states[-1]]
+        recorder.controller.count = int(counts[-1])
+    return recorder
+
+
+def finish_summary(recorder, path, fps, frame_index, elapsed):
+    summary = recorder.summary()
+    summary.update({
+        "video": path,
+        "video_fps": round(fps, 2),
+        "seconds": round(elapsed, 3),
+        "processing_fps": round(frame_index / elapsed, 1) if elapsed > 0 else 0.0,
+        "realtime_factor": round((frame_index / fps) / elapsed, 2) if elapsed > 0 else 0.0,
+    })
+    return summary
+
+
+def print_summary(summary, show_transitions=False):
+    print(f"{summary['video']}: {summary['reps']} {summary['exercise']} "
+          f"({summary['frames']} frames, pose in {summary['frames_with_pose']}, "
+          f"{summary['processing_fps']} fps, {summary['realtime_factor']}x realtime)")
+    if show_transitions:
+        for frame_index, timestamp, before, after, count in summary["transitions"]:
+            print(f"  frame {frame_index:6d}  {timestamp:8.3f}s  {before} -> {after}  count={count}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run an exercise controller over recorded video without a webcam.")
+    parser.add_argument("exercise", choices=sorted(EXERCISE_CONTROLLERS))
+    parser.add_argument("path", help="video file or a directory of videos")
+    parser.add_argument("--max-frames", type=int, default=None)
+    parser.add_argument("--transitions", action="store_true", help="print every state transition")
+    parser.add_argument("--json", dest="json_path", help="also write the results to this file")
+    parser.add_argument("--record", dest="record_dir", help="save the detected poses of each video as a pose trace here")
+    parser.add_argument("--no-smooth", action="store_true", help="feed the raw landmarks to the controller")
+    args = parser.parse_args(argv)
+    if args.record_dir:
+        os.makedirs(args.record_dir, exist_ok=True)
+
+    videos = find_videos(args.path)
+    if not videos:
+        print(f"no videos found in {args.path}", file=sys.stderr)
+        return 1
+
+    results = []
+    for video in videos:
+        if video.endswith(TRACE_EXTENSION):
+            summary = replay_trace(video, args.exercise, args.max_frames)
+        else:
+            record_path = None
+            if args.record_dir:
+                name = os.path.splitext(os.path.basename(video))[0] + TRACE_EXTENSION
+                record_path = os.path.join(args.record_dir, name)
+                if os.path.exists(record_path):
+                    os.remove(record_path) #traces only append, start this one over
+            summary = replay_video(video, args.exercise, args.max_frames, record_path, not args.no_smooth)
+        print_summary(summary, args.transitions)
+        results.append(summary)
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
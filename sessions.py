@@ -0,0 +1,121 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+# logged in users by user id, least recently used first. a session nobody has touched for
+# ttl seconds is evicted, and so is the oldest one once there are more than max_sessions.
+# on_evict(user) runs for every session that goes (evicted, logged out or replaced by a new
+# login) so whatever it holds, camera streams or an upload hub, can be shut down.
+#
+# reading a session (registry[user_id]) counts as using it, the checks `user_id in
+# registry` and items() do not. expired sessions are swept on login and at most every
+# sweep_interval seconds when a session is read, never in between a check and a read
+class SessionRegistry:
+    def __init__(self, ttl=2 * 60 * 60, max_sessions=1000, on_evict=None, sweep_interval=60.0):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.on_evict = on_evict
+        self.sweep_interval = sweep_interval
+        self.sessions = OrderedDict() #user_id -> (user, last used)
+        self.lock = threading.Lock()
+        self.last_sweep = time.monotonic()
+        self.evicted = 0
+
+    def add(self, user_id, user):
+        now = time.monotonic()
+        with self.lock:
+            old = self.sessions.pop(user_id, None)
+            self.sessions[user_id] = (user, now)
+            gone = self._expired(now)
+            while len(self.sessions) > self.max_sessions:
+                gone.append(self.sessions.popitem(last=False)[1][0])
+        if old is not None and old[0] is not user:
+            gone.append(old[0])
+        self._evicted(gone)
+        return user
+
+    def __getitem__(self, user_id):
+        now = time.monotonic()
+        gone = []
+        with self.lock:
+            user = self.sessions[user_id][0]
+            self.sessions[user_id] = (user, now)
+            self.sessions.move_to_end(user_id)
+            if now - self.last_sweep > self.sweep_interval:
+                gone = self._expired(now)
+        self._evicted(gone)
+        return user
+
+    def get(self, user_id, default=None):
+        try:
+            return self[user_id]
+        except KeyError:
+            return default
+
+    def touch(self, user_id):
+        # keeps a session alive from a long running request (a video or event stream),
+        # returns False once it is gone
+        with self.lock:
+            entry = self.sessions.get(user_id)
+            if entry is None:
+                return False
+            self.sessions[user_id] = (entry[0], time.monotonic())
+            self.sessions.move_to_end(user_id)
+            return True
+
+    def pop(self, user_id):
+        # logout. returns the user, or None if there was no session
+        with self.lock:
+            entry = self.sessions.pop(user_id, None)
+        if entry is None:
+            return None
+        self._evicted([entry[0]])
+        return entry[0]
+
+    def sweep(self):
+        with self.lock:
+            gone = self._expired(time.monotonic())
+        self._evicted(gone)
+        return len(gone)
+
+    def _expired(self, now):
+        # under the lock. the dict is in last used order, so stop at the first live one
+        self.last_sweep = now
+        gone = []
+        while self.sessions:
+            user_id, (user, last_used) = next(iter(self.sessions.items()))
+            if now - last_used <= self.ttl:
+                break
+            del self.sessions[user_id]
+            gone.append(user)
+        return gone
+
+    def _evicted(self, users):
+        self.evicted += len(users)
+        if self.on_evict is not None:
+            for user in users:
+                self.on_evict(user)
+
+    def __contains__(self, user_id):
+        with self.lock:
+            return user_id in self.sessions
+
+    def __len__(self):
+        with self.lock:
+            return len(self.sessions)
+
+    def items(self):
+        with self.lock:
+            return [(user_id, user) for user_id, (user, _) in self.sessions.items()]
+
+    def stats(self):
+        with self.lock:
+            now = time.monotonic()
+            return {
+                "sessions": len(self.sessions),
+                "max_sessions": self.max_sessions,
+                "ttl": self.ttl,
+                "evicted": self.evicted,
+                "oldest_idle_seconds": round(now - next(iter(self.sessions.values()))[1], 1) if self.sessions else None,
+            }
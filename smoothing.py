@@ -0,0 +1,83 @@
+# One Euro filter (Casiez et al.) over all landmarks of a pose frame at once. slow
+# movement gets a low cutoff so the jitter goes away, fast movement raises the cutoff so
+# reps do not lag. only pixel x and y are filtered, z and visibility pass through.
+#
+# the filter also keeps a velocity per landmark, which predict() uses to fill in the
+# frames inference was skipped on
+import math
+
+import numpy as np
+
+from pose_frame import NUM_LANDMARKS
+
+
+class OneEuroFilter:
+    # min_cutoff in Hz, beta per pixel/second of speed. max_prediction is how far past
+    # the last real detection predict() is willing to extrapolate, in seconds
+    def __init__(self, min_cutoff=1.0, beta=0.007, d_cutoff=1.0, max_prediction=0.3):
+        self.min_cutoff = min_cutoff
+        self.beta = beta
+        self.d_cutoff = d_cutoff
+        self.max_prediction = max_prediction
+        self.position = np.zeros((NUM_LANDMARKS, 2), dtype=np.float32)
+        self.velocity = np.zeros((NUM_LANDMARKS, 2), dtype=np.float32)
+        self.speed = np.empty(NUM_LANDMARKS, dtype=np.float32) #work buffers, reused
+        self.alpha = np.empty((NUM_LANDMARKS, 1), dtype=np.float32)
+        self.delta = np.empty((NUM_LANDMARKS, 2), dtype=np.float32)
+        self.last_timestamp = None
+        self.last_extra = np.zeros((NUM_LANDMARKS, 2), dtype=np.float32) #z and visibility of the last detection
+
+    def reset(self):
+        self.last_timestamp = None
+
+    @staticmethod
+    def _alpha(cutoff, dt):
+        return 1.0 / (1.0 + 1.0 / (2.0 * math.pi * cutoff * dt))
+
+    def filter(self, pose, timestamp):
+        # smooths pose in place and returns it
+        xy = pose[:, :2]
+        self.last_extra[:] = pose[:, 2:]
+        dt = None if self.last_timestamp is None else timestamp - self.last_timestamp
+        if dt is None or dt <= 0:
+            self.position[:] = xy
+            self.velocity[:] = 0
+            self.last_timestamp = timestamp
+            return pose
+        self.last_timestamp = timestamp
+
+        #velocity is smoothed with a fixed cutoff
+        np.subtract(xy, self.position, out=self.delta)
+        self.delta /= dt
+        self.delta -= self.velocity
+        self.velocity += self._alpha(self.d_cutoff, dt) * self.delta
+
+        #position cutoff rises with how fast each landmark moves
+        np.hypot(self.velocity[:, 0], self.velocity[:, 1], out=self.speed)
+        cutoff = self.speed
+        cutoff *= self.beta
+        cutoff += self.min_cutoff
+        #alpha = 1 / (1 + 1 / (2 pi cutoff dt)) per landmark
+        np.multiply(cutoff, 2.0 * math.pi * dt, out=self.alpha[:, 0])
+        np.reciprocal(self.alpha, out=self.alpha)
+        self.alpha += 1.0
+        np.reciprocal(self.alpha, out=self.alpha)
+
+        np.subtract(xy, self.position, out=self.delta)
+        self.delta *= self.alpha
+        self.position += self.delta
+        xy[:] = self.position
+        return pose
+
+    def predict(self, timestamp, out):
+        # writes where the landmarks should be at timestamp into out and returns it, or
+        # None if there is nothing to go on or the last detection is too old
+        if self.last_timestamp is None:
+            return None
+        dt = timestamp - self.last_timestamp
+        if dt <= 0 or dt > self.max_prediction:
+            return None
+        np.multiply(self.velocity, dt, out=out[:, :2])
+        out[:, :2] += self.position
+        out[:, 2:] = self.last_extra
+        return out
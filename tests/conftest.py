@@ -0,0 +1,5 @@
+import os
+import sys
+
+# the app is flat modules next to app.py, not a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
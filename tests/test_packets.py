@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+
+from packets import HEADER, MAGIC, PACKET_SIZE, VERSION, LandmarkReceiver, PacketError, encode_packet
+from pose_frame import new_pose_frame
+
+FRAME_SHAPE = (480, 640, 3)
+
+
+def sample_pose(seed=0):
+    rng = np.random.default_rng(seed)
+    pose = new_pose_frame()
+    pose[:, 0] = rng.uniform(0, FRAME_SHAPE[1], 33)
+    pose[:, 1] = rng.uniform(0, FRAME_SHAPE[0], 33)
+    pose[:, 2] = rng.uniform(-1, 1, 33)
+    pose[:, 3] = rng.uniform(0, 1, 33)
+    return pose
+
+
+def test_round_trip():
+    pose = sample_pose()
+    data = encode_packet(12.5, pose, FRAME_SHAPE)
+    assert len(data) == PACKET_SIZE
+
+    (timestamp, decoded, frame_shape), = LandmarkReceiver().packets(data)
+    assert timestamp == 12.5
+    assert frame_shape == FRAME_SHAPE
+    #quantized to 16 bits for x, y and z, 8 for visibility
+    np.testing.assert_allclose(decoded[:, 0], pose[:, 0], atol=FRAME_SHAPE[1] / 65535)
+    np.testing.assert_allclose(decoded[:, 1], pose[:, 1], atol=FRAME_SHAPE[0] / 65535)
+    np.testing.assert_allclose(decoded[:, 2], pose[:, 2], atol=1 / 16384)
+    np.testing.assert_allclose(decoded[:, 3], pose[:, 3], atol=1 / 255)
+
+
+def test_several_packets_and_nobody_in_view():
+    data = encode_packet(1.0, sample_pose(1), FRAME_SHAPE) + encode_packet(2.0, None, FRAME_SHAPE)
+    received = [(timestamp, pose is None) for timestamp, pose, _ in LandmarkReceiver().packets(data)]
+    assert received == [(1.0, False), (2.0, True)]
+
+
+def test_stale_packets_are_dropped():
+    receiver = LandmarkReceiver()
+    list(receiver.packets(encode_packet(5.0, None, FRAME_SHAPE)))
+    data = encode_packet(4.0, None, FRAME_SHAPE) + encode_packet(5.0, None, FRAME_SHAPE) + encode_packet(6.0, None, FRAME_SHAPE)
+    assert [timestamp for timestamp, _, _ in receiver.packets(data)] == [6.0]
+    assert receiver.stats() == {"received": 4, "stale": 2, "rejected": 0}
+
+
+def packet_with(**fields):
+    values = dict(magic=MAGIC, version=VERSION, flags=0, landmarks=33, reserved=0, timestamp=1.0, w=640, h=480)
+    values.update(fields)
+    return HEADER.pack(*values.values()) + bytes(PACKET_SIZE - HEADER.size)
+
+
+@pytest.mark.parametrize("data", [
+    b"",
+    encode_packet(1.0, None, FRAME_SHAPE)[:-1],
+    encode_packet(1.0, None, FRAME_SHAPE) + b"\0",
+    packet_with(magic=b"JPEG"),
+    packet_with(version=VERSION + 1),
+    packet_with(landmarks=17),
+    packet_with(timestamp=float("nan")),
+    packet_with(timestamp=float("inf")),
+    packet_with(w=0),
+    packet_with(h=0),
+], ids=["empty", "short", "long", "magic", "version", "landmarks", "nan", "inf", "width", "height"])
+def test_rejected(data):
+    receiver = LandmarkReceiver()
+    with pytest.raises(PacketError):
+        list(receiver.packets(data))
+    assert receiver.stats()["rejected"] == 1
+
+
+def test_bad_packet_after_good_ones():
+    # the good packets before it are still handed out, then the request fails
+    receiver = LandmarkReceiver()
+    received = []
+    with pytest.raises(PacketError):
+        for timestamp, _, _ in receiver.packets(encode_packet(1.0, None, FRAME_SHAPE) + packet_with(magic=b"JPEG")):
+            received.append(timestamp)
+    assert received == [1.0]
@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+
+from pose_trace import RECORD_DTYPE, TRACE_EXTENSION, PoseTrace, PoseTraceWriter
+
+FRAME_SHAPE = (480, 640, 3)
+
+
+def sample_poses(frames, seed=0):
+    return np.random.default_rng(seed).uniform(0, 600, (frames, 33, 4)).astype(np.float32)
+
+
+def write_trace(path, timestamps, poses, frame_shape=FRAME_SHAPE):
+    writer = PoseTraceWriter(path, frame_shape)
+    for timestamp, pose in zip(timestamps, poses):
+        writer.write(timestamp, pose)
+    writer.close()
+    return writer
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / f"user1{TRACE_EXTENSION}")
+    poses = sample_poses(5)
+    written = [poses[0], None, poses[2], poses[3], None]
+    assert write_trace(path, [0.0, 0.1, 0.2, 0.3, 0.4], written).frames == 5
+
+    trace = PoseTrace(path)
+    assert len(trace) == 5
+    assert trace.frame_shape == FRAME_SHAPE
+    np.testing.assert_array_equal(trace.timestamps, [0.0, 0.1, 0.2, 0.3, 0.4])
+    assert list(trace.has_pose) == [True, False, True, True, False]
+    for (timestamp, pose), expected in zip(trace.frames(), written):
+        if expected is None:
+            assert pose is None
+        else:
+            np.testing.assert_array_equal(pose, expected)
+
+
+def test_reopening_appends(tmp_path):
+    path = str(tmp_path / f"user1{TRACE_EXTENSION}")
+    poses = sample_poses(4)
+    write_trace(path, [0.0, 0.1], poses[:2])
+    write_trace(path, [0.2, 0.3], poses[2:])
+    trace = PoseTrace(path)
+    np.testing.assert_array_equal(trace.timestamps, [0.0, 0.1, 0.2, 0.3])
+    np.testing.assert_array_equal(trace.poses, poses)
+
+
+def test_reopening_at_another_size_fails(tmp_path):
+    path = str(tmp_path / f"user1{TRACE_EXTENSION}")
+    write_trace(path, [0.0], sample_poses(1))
+    with pytest.raises(ValueError):
+        PoseTraceWriter(path, (720, 1280, 3))
+
+
+def test_record_cut_short_is_ignored(tmp_path):
+    path = tmp_path / f"user1{TRACE_EXTENSION}"
+    write_trace(str(path), [0.0, 0.1], sample_poses(2))
+    with open(path, "ab") as file:
+        file.write(bytes(RECORD_DTYPE.itemsize // 2))
+    assert len(PoseTrace(str(path))) == 2
+
+
+def test_empty_trace(tmp_path):
+    path = str(tmp_path / f"user1{TRACE_EXTENSION}")
+    PoseTraceWriter(path, FRAME_SHAPE).close()
+    trace = PoseTrace(path)
+    assert len(trace) == 0
+    assert list(trace.frames()) == []
+
+
+@pytest.mark.parametrize("data", [b"", b"FCTRACE", b"NOTATRACE\0\0\0\0\0\0\0\0\0\0\0\0\0\0\0"],
+                         ids=["empty", "short", "magic"])
+def test_not_a_trace(tmp_path, data):
+    path = tmp_path / "other.bin"
+    path.write_bytes(data)
+    with pytest.raises(ValueError):
+        PoseTrace(str(path))
@@ -0,0 +1,145 @@
+import numpy as np
+import pytest
+
+from exercises import EXERCISE_CONTROLLERS, EXERCISE_SPECS, PLANK
+from landmarks import *
+from pose_frame import joint_angles, joint_triples, new_pose_frame
+
+FRAME_SHAPE = (720, 1280, 3)
+
+
+def random_recording(frames=4000, seed=1):
+    # poses all over the frame so every threshold gets crossed, with a few frames of nobody
+    rng = np.random.default_rng(seed)
+    poses = rng.uniform(0, 600, (frames, 33, 4)).astype(np.float32)
+    poses[:, :, 3] = 1
+    has_pose = rng.random(frames) > 0.05
+    return poses, np.arange(frames) / 30, has_pose
+
+
+def run_live(controller, poses, timestamps, has_pose):
+    states, counts = [], []
+    for pose, timestamp, seen in zip(poses, timestamps, has_pose):
+        controller.update(pose if seen else None, FRAME_SHAPE, timestamp)
+        states.append(controller.state)
+        counts.append(controller.count)
+    return states, counts
+
+
+# the hand written controllers the specs replaced, to check they still count the same
+
+class OldPushUps:
+    JOINTS = joint_triples((RIGHT_SHOULDER, RIGHT_ELBOW, RIGHT_WRIST), (RIGHT_SHOULDER, RIGHT_HIP, RIGHT_KNEE))
+
+    def __init__(self):
+        self.state = "IDLE"
+        self.count = 0
+
+    def update(self, pose, image_shape, timestamp):
+        if pose is None:
+            return
+        elbow, body = joint_angles(pose, self.JOINTS)
+        if self.state == "IDLE":
+            if elbow < 85 and body > 150:
+                self.state = "DOWN"
+        elif elbow > 160:
+            self.count += 1
+            self.state = "IDLE"
+
+
+class OldSupermans:
+    JOINTS = joint_triples((RIGHT_SHOULDER, RIGHT_HIP, RIGHT_KNEE))
+
+    def __init__(self):
+        self.state = "IDLE"
+        self.count = 0
+
+    def update(self, pose, image_shape, timestamp):
+        if pose is None:
+            return
+        back = joint_angles(pose, self.JOINTS)[0]
+        if self.state == "IDLE":
+            if back < 165:
+                self.state = "UP"
+        elif back > 175:
+            self.count += 1
+            self.state = "IDLE"
+
+
+class OldGluteBridges:
+    JOINTS = joint_triples((RIGHT_HIP, RIGHT_KNEE, RIGHT_HEEL), (RIGHT_SHOULDER, RIGHT_HIP, RIGHT_KNEE))
+
+    def __init__(self):
+        self.state = "IDLE"
+        self.count = 0
+
+    def update(self, pose, image_shape, timestamp):
+        if pose is None:
+            return
+        dx = abs(pose[RIGHT_HIP, 0] - pose[RIGHT_SHOULDER, 0])
+        dy = abs(pose[RIGHT_HIP, 1] - pose[RIGHT_SHOULDER, 1])
+        if dy > dx:
+            return
+        knee, hip = joint_angles(pose, self.JOINTS)
+        if knee > 135:
+            return
+        if self.state == "IDLE":
+            if hip > 165:
+                self.state = "UP"
+        elif hip < 140:
+            self.count += 1
+            self.state = "IDLE"
+
+
+@pytest.mark.parametrize("name, old", [("pushups", OldPushUps), ("supermans", OldSupermans),
+                                       ("glutebridges", OldGluteBridges)])
+def test_spec_counts_like_the_old_controller(name, old):
+    recording = random_recording()
+    expected = run_live(old(), *recording)
+    assert expected[1][-1] > 0
+    assert run_live(EXERCISE_CONTROLLERS[name](), *recording) == expected
+
+
+@pytest.mark.parametrize("name", sorted(EXERCISE_SPECS))
+def test_evaluate_matches_live(name):
+    spec = EXERCISE_SPECS[name]
+    poses, timestamps, has_pose = random_recording()
+    states, counts = run_live(EXERCISE_CONTROLLERS[name](), poses, timestamps, has_pose)
+    batch_states, batch_counts = spec.evaluate(poses, timestamps, has_pose)
+    assert [spec.states[s] for s in batch_states] == states
+    assert list(batch_counts) == counts
+
+
+def plank_pose():
+    pose = new_pose_frame()
+    pose[:, 3] = 1
+    pose[RIGHT_SHOULDER, :2] = (100, 300)
+    pose[RIGHT_HIP, :2] = (300, 305)
+    pose[RIGHT_ANKLE, :2] = (500, 310)
+    return pose
+
+
+def test_plank_clock_stops_while_nobody_is_in_view():
+    pose = plank_pose()
+    frames = [True] * 31 + [False] * 600 + [True] * 11 #3 s held, 60 s away, 1 s back
+    timestamps = np.arange(len(frames)) * 0.1
+    controller = PLANK.controller()
+    for seen, timestamp in zip(frames, timestamps):
+        controller.update(pose if seen else None, FRAME_SHAPE, timestamp)
+        if timestamp == pytest.approx(3.0):
+            assert controller.count == 3
+    assert controller.count == 4
+
+    _, counts = PLANK.evaluate(np.repeat(pose[None], len(frames), axis=0), timestamps, np.array(frames))
+    assert counts[-1] == controller.count
+
+
+def test_plank_reset_does_not_bring_the_old_count_back():
+    pose = plank_pose()
+    controller = PLANK.controller()
+    for i in range(51):
+        controller.update(pose, FRAME_SHAPE, i * 0.1)
+    assert controller.count == 5
+    controller.count = 0
+    controller.update(pose, FRAME_SHAPE, 5.1)
+    assert controller.count == 0
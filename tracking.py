@@ -0,0 +1,128 @@
+# keeps track of who is who when one camera sees several people (a group class at one
+# station). detections are matched frame to frame by the centroid of their shoulders and
+# hips, nearest first. every tracked person gets their own ExerciseManager, so one
+# multi-pose inference counts reps for everybody in the picture
+import cv2
+import numpy as np
+
+from exercises import ExerciseManager
+from landmarks import *
+from pose_frame import new_pose_frame, pixel
+from smoothing import OneEuroFilter
+
+TORSO = np.array([LEFT_SHOULDER, RIGHT_SHOULDER, LEFT_HIP, RIGHT_HIP], dtype=np.intp)
+
+
+def torso_centroids(poses):
+    # (people, 33, 4) -> centroid (people, 2) and torso length (people,) in pixels
+    torso = poses[:, TORSO, :2]
+    centroids = torso.mean(axis=1)
+    shoulders = torso[:, :2].mean(axis=1)
+    hips = torso[:, 2:].mean(axis=1)
+    return centroids, np.hypot(*(shoulders - hips).T)
+
+
+class Track:
+    def __init__(self, track_id, smoothing=True):
+        self.track_id = track_id
+        self.pose = new_pose_frame()
+        self.centroid = np.zeros(2, dtype=np.float32)
+        self.visible = False #matched a detection on the latest result
+        self.last_seen = None
+        self.exerciseManager = ExerciseManager()
+        self.smoother = OneEuroFilter() if smoothing else None
+
+    def step(self, exercise, frame_shape, timestamp):
+        # runs this person's controller for the user's current exercise
+        if self.exerciseManager.currentExercise != exercise:
+            self.exerciseManager.setCurrentExercise(exercise)
+        controller = self.exerciseManager.getCurrentExercise()
+        controller.update(self.pose if self.visible else None, frame_shape, timestamp)
+
+
+class PoseTracker:
+    # max_people is also what the detector is asked for (num_poses). a detection further
+    # than max_jump torso lengths from every track starts a new one, a track that has not
+    # been matched for max_missing seconds is dropped along with its counts
+    def __init__(self, max_people=4, max_jump=1.0, max_missing=2.0, smoothing=True):
+        self.max_people = max_people
+        self.max_jump = max_jump
+        self.max_missing = max_missing
+        self.smoothing = smoothing
+        self.tracks = []
+        self.next_id = 1
+
+    def reset(self):
+        self.tracks = []
+
+    def update(self, poses, timestamp):
+        # poses is (people, 33, 4) for one detection result. returns the live tracks
+        self.tracks = [t for t in self.tracks if t.last_seen is not None and timestamp - t.last_seen <= self.max_missing]
+        for track in self.tracks:
+            track.visible = False
+        if len(poses) == 0:
+            for track in self.tracks:
+                if track.smoother is not None:
+                    track.smoother.reset()
+            return self.tracks
+
+        centroids, torso = torso_centroids(poses)
+        limit = np.maximum(torso, 1.0) * self.max_jump
+        matched = np.zeros(len(poses), dtype=bool)
+        if self.tracks:
+            known = np.array([t.centroid for t in self.tracks])
+            distance = np.hypot(known[:, None, 0] - centroids[None, :, 0], known[:, None, 1] - centroids[None, :, 1])
+            #greedy, closest pair first. a handful of people so this is tiny
+            for flat in np.argsort(distance, axis=None):
+                t, d = divmod(int(flat), len(poses))
+                track = self.tracks[t]
+                if track.visible or matched[d] or distance[t, d] > limit[d]:
+                    continue
+                self._assign(track, poses[d], centroids[d], timestamp)
+                matched[d] = True
+
+        for d in np.flatnonzero(~matched):
+            if len(self.tracks) >= self.max_people:
+                break
+            track = Track(self.next_id, self.smoothing)
+            self.next_id += 1
+            self.tracks.append(track)
+            self._assign(track, poses[d], centroids[d], timestamp)
+
+        for track in self.tracks:
+            if not track.visible and track.smoother is not None:
+                track.smoother.reset()
+        return self.tracks
+
+    def _assign(self, track, pose, centroid, timestamp):
+        np.copyto(track.pose, pose)
+        if track.smoother is not None:
+            track.smoother.filter(track.pose, timestamp)
+        track.centroid[:] = centroid
+        track.visible = True
+        track.last_seen = timestamp
+
+    def predict(self, timestamp):
+        # fills in the pose of every visible track for a frame without inference,
+        # returns the tracks that got one
+        predicted = []
+        for track in self.tracks:
+            if track.visible and track.smoother is not None and track.smoother.predict(timestamp, track.pose) is not None:
+                predicted.append(track)
+        return predicted
+
+    def draw(self, image):
+        # each person's overlay plus their number and count above the head
+        for track in self.tracks:
+            if not track.visible:
+                continue
+            controller = track.exerciseManager.getCurrentExercise()
+            controller.draw(image, track.pose)
+            x, y = pixel(track.pose, NOSE)
+            cv2.putText(image, f"#{track.track_id}  {controller.count}", (x - 30, max(y - 40, 20)),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 255, 255), 2, cv2.LINE_AA)
+        return image
+
+    def summary(self):
+        return [{"id": t.track_id, "visible": t.visible, "count": t.exerciseManager.getCurrentExercise().count,
+                 "state": t.exerciseManager.getCurrentExercise().state} for t in self.tracks]
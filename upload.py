@@ -0,0 +1,91 @@
+import threading
+import time
+
+import cv2
+import numpy as np
+
+
+# frames a browser uploads from its own webcam, one source per user. same read_latest()
+# as camera.FrameGrabber so a FrameHub can run on it unchanged. there is one slot: a
+# frame that arrives before the hub took the last one replaces it, so slow inference
+# drops frames instead of queueing them. the jpeg is only decoded when the hub takes it,
+# a dropped frame costs nothing but the upload. a browser that goes away without
+# /upload_stop (closed tab, lost network) leaves the source idle, after idle_timeout seconds
+# without a frame it stops itself and with it the hub
+class UploadSource:
+    def __init__(self, max_width=1280, idle_timeout=30.0):
+        self.max_width = max_width
+        self.idle_timeout = idle_timeout
+        self.created = time.monotonic()
+        self.condition = threading.Condition()
+        self.pending = None #(seq, timestamp, jpeg bytes) waiting for the hub
+        self.seq = 0
+        self.received_frames = 0
+        self.dropped_frames = 0
+        self.bad_frames = 0
+        self.last_received = None
+        self.running = True
+
+    def push(self, jpeg):
+        # called from the upload request. returns False if the source was stopped
+        with self.condition:
+            if not self.running:
+                return False
+            if self.pending is not None:
+                self.dropped_frames += 1
+            self.seq += 1
+            self.received_frames += 1
+            self.last_received = time.monotonic()
+            self.pending = (self.seq, self.last_received, jpeg)
+            self.condition.notify_all()
+        return True
+
+    def read_latest(self, after_seq=0, timeout=1.0):
+        # blocks until there is a frame newer than after_seq, returns (seq, timestamp, frame)
+        # or (None, None, None) if the source stopped or nothing arrived in time
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            while self.pending is None or self.pending[0] <= after_seq:
+                if not self.running:
+                    return None, None, None
+                now = time.monotonic()
+                if now - (self.last_received or self.created) > self.idle_timeout:
+                    self.running = False
+                    self.pending = None
+                    self.condition.notify_all()
+                    return None, None, None
+                remaining = deadline - now
+                if remaining <= 0:
+                    return None, None, None
+                self.condition.wait(remaining)
+            seq, timestamp, jpeg = self.pending
+            self.pending = None
+
+        frame = cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if frame is None:
+            self.bad_frames += 1
+            return None, None, None
+        if frame.shape[1] > self.max_width:
+            #the client is meant to downscale, do it here if it did not
+            scale = self.max_width / frame.shape[1]
+            frame = cv2.resize(frame, (self.max_width, int(frame.shape[0] * scale)), interpolation=cv2.INTER_AREA)
+        return seq, timestamp, frame
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.pending = None
+            self.condition.notify_all()
+
+    def release(self):
+        self.stop()
+
+    def stats(self):
+        with self.condition:
+            return {
+                "captured": self.received_frames,
+                "dropped": self.dropped_frames,
+                "bad": self.bad_frames,
+                "seconds_since_last": round(time.monotonic() - self.last_received, 2) if self.last_received else None,
+                "running": self.running,
+            }
@@ -0,0 +1,128 @@
+# the camera, pose detectors and frame hub, built only once a workout needs them so
+# the web pages (and anything importing app.py) never wait for mediapipe. importing
+# this module is cheap, the heavy imports happen in build().
+#
+# warm_up() builds everything on a background thread and runs one inference on a blank
+# frame, so the model is loaded before the first real frame arrives. status() is what
+# the readiness route reports
+import os
+import threading
+import time
+
+COLD = "cold"
+WARMING = "warming"
+READY = "ready"
+FAILED = "failed"
+
+
+class VisionStack:
+    # hub_options are passed to every FrameHub (the camera's and the upload ones).
+    # inference_workers 0 keeps the detectors in this process, see inference_pool.py
+    def __init__(self, camera_device=0, inference_workers=None, hub_options=None):
+        self.camera_device = camera_device
+        if inference_workers is None:
+            inference_workers = os.cpu_count() or 1
+        self.inference_workers = inference_workers
+        self.hub_options = hub_options or {}
+        self.camera = None
+        self.inference_pool = None
+        self.camera_hub = None
+        self.state = COLD
+        self.error = None
+        self.started = None
+        self.ready_seconds = None
+        self.lock = threading.Lock()
+        self.build_lock = threading.Lock()
+
+    def build(self):
+        # builds the stack on first use and returns the camera hub. blocks while another
+        # thread is building, never waits for the model warm-up
+        with self.build_lock:
+            if self.camera_hub is None:
+                from camera import FrameGrabber
+                from hub import FrameHub
+                if self.inference_workers > 0:
+                    from inference_pool import InferencePool
+                    self.inference_pool = InferencePool(self.inference_workers)
+                #capture runs on its own thread and keeps only the newest few frames
+                self.camera = FrameGrabber(self.camera_device)
+                self.camera_hub = FrameHub(self.camera, inference_pool=self.inference_pool, **self.hub_options)
+            return self.camera_hub
+
+    def new_hub(self, source):
+        # a hub for a source of its own (browser uploads), sharing the worker processes
+        self.build()
+        from hub import FrameHub
+        return FrameHub(source, inference_pool=self.inference_pool, **self.hub_options)
+
+    def built(self):
+        return self.camera_hub is not None
+
+    def warm_up(self):
+        # starts building and loading the model in the background, returns straight away
+        with self.lock:
+            if self.state in (WARMING, READY):
+                return
+            self.state = WARMING
+            self.error = None
+            self.started = time.monotonic()
+        threading.Thread(target=self._warm_up, name="VisionWarmUp", daemon=True).start()
+
+    def _warm_up(self):
+        stream = None
+        try:
+            hub = self.build()
+            from detectors import DEFAULT_PROFILE
+            import numpy as np
+
+            #one blank frame through the default detector loads the model (in the worker
+            #with a pool) and gets the first slow inference out of the way
+            stream = hub.detector_pool.get(DEFAULT_PROFILE)
+            done = threading.Event()
+            listener = lambda detection_result, timestamp, roi: done.set()
+            stream.add_listener(listener)
+            try:
+                stream.submit(np.zeros((256, 256, 3), dtype=np.uint8), time.monotonic())
+                if not done.wait(60.0):
+                    raise TimeoutError("no result from the pose model within 60 s")
+                #a pooled stream reports a detector that failed to load through its results
+                if getattr(stream, "last_error", None):
+                    raise RuntimeError(stream.last_error)
+            finally:
+                stream.remove_listener(listener)
+        except Exception as exc:
+            if stream is not None:
+                #the cached stream holds the broken detector, the next warm_up() must
+                #load the model again instead of asking it
+                self.camera_hub.detector_pool.discard(DEFAULT_PROFILE, stream)
+            with self.lock:
+                self.state = FAILED
+                self.error = repr(exc)
+            return
+        with self.lock:
+            self.state = READY
+            self.ready_seconds = round(time.monotonic() - self.started, 2)
+
+    def close_user(self, user_id):
+        # ends the user's camera streams, if the camera was ever started
+        if self.camera_hub is not None:
+            self.camera_hub.close_user(user_id)
+
+    def status(self):
+        with self.lock:
+            return {
+                "state": self.state,
+                "ready": self.state == READY,
+                "error": self.error,
+                "seconds_to_ready": self.ready_seconds,
+                "inference_workers": self.inference_workers,
+            }
+
+    def stats(self):
+        # for /metrics, None for whatever is not running yet
+        return {
+            "status": self.status(),
+            "inference_pool": self.inference_pool.stats() if self.inference_pool is not None else None,
+            "camera": self.camera.stats() if self.camera is not None else None,
+            "hub": self.camera_hub.stats() if self.camera_hub is not None else None,
+        }
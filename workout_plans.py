@@ -0,0 +1,203 @@
+# weekly workout plans. a plan kind is a list of days, each day a list of (group, how
+# many) picks from the exercise catalog. generation is seeded with the user and the week,
+# so the same user gets the same plan all week however often it is built, and plans for
+# every user can be made in one go (generate_all, or run this file) and stored for the
+# web app to hand out
+import argparse
+import hashlib
+import json
+import random
+import time
+from datetime import date
+
+WEEKDAYS = ("MON", "TUE", "WED", "THU", "FRI", "SAT", "SUN")
+
+
+class CatalogExercise:
+    __slots__ = ("name", "category", "groups", "tracked")
+
+    # category picks the rep range (strength, core or cardio), groups are what the plan
+    # days pick from, tracked is the EXERCISE_CONTROLLERS name if the camera counts it
+    def __init__(self, name, category, groups, tracked=None):
+        self.name = name
+        self.category = category
+        self.groups = groups
+        self.tracked = tracked
+
+
+CATALOG = [
+    CatalogExercise("Push-ups", "strength", ("upper_body", "push_day", "beginner"), "pushups"),
+    CatalogExercise("V Push-ups", "strength", ("upper_body",)),
+    CatalogExercise("Inverted Rows", "strength", ("upper_body",)),
+    CatalogExercise("Pull-ups", "strength", ("upper_body",)),
+    CatalogExercise("Shoulder Press", "strength", ("push_day",)),
+    CatalogExercise("Squats", "strength", ("lower_body", "leg_day", "beginner"), "squats"),
+    CatalogExercise("Lunges", "strength", ("lower_body", "leg_day", "beginner"), "lunges"),
+    CatalogExercise("Glute Bridges", "strength", ("lower_body", "beginner"), "glutebridges"),
+    CatalogExercise("Calf Raises", "strength", ("lower_body", "leg_day"), "calfraises"),
+    CatalogExercise("Sit-ups", "core", ("core", "beginner"), "situps"),
+    CatalogExercise("Plank", "core", ("core",), "plank"),
+    CatalogExercise("Supermans", "core", ("core", "beginner"), "supermans"),
+    CatalogExercise("Jumping Jacks", "cardio", ("cardio", "beginner"), "jumpingjacks"),
+    CatalogExercise("Jogging in Place", "cardio", ("cardio", "beginner")),
+    CatalogExercise("Running", "cardio", ("cardio",), "running"),
+    CatalogExercise("Jump Rope", "cardio", ("cardio",)),
+    CatalogExercise("Burpees", "cardio", ("cardio",)),
+]
+EXERCISES = {e.name: e for e in CATALOG}
+GROUPS = {} #group -> tuple of exercises, in catalog order
+for _exercise in CATALOG:
+    for _group in _exercise.groups:
+        GROUPS[_group] = GROUPS.get(_group, ()) + (_exercise,)
+del _exercise, _group
+
+REP_RANGES = {
+    "Beginner": {
+        "strength": "2 to 3 sets of 8 to 12 reps",
+        "core": "2 to 3 sets of 10 to 15 reps",
+        "cardio": "30 to 60 seconds",
+    },
+}
+
+# kind -> (title, {weekday: (day title, [(group, how many), ...])}), days left out are rest
+PLAN_KINDS = {
+    "beginner": ("Beginner workout plan", {
+        day: ("Full Body", [("beginner", 5)]) for day in ("MON", "WED", "FRI", "SUN")
+    }),
+    "strength": ("Strength + athleticism plan", {
+        "MON": ("Upper Body + Cardio + Core", [("upper_body", 3), ("cardio", 1), ("core", 1)]),
+        "TUE": ("Lower Body + Cardio + Core", [("lower_body", 3), ("cardio", 1), ("core", 1)]),
+        "THU": ("Upper Body", [("upper_body", 4)]),
+        "FRI": ("Lower Body", [("lower_body", 4)]),
+        "SUN": ("High Cardio", [("cardio", 3)]),
+    }),
+    "split": ("Weekly split workout plan", {
+        "MON": ("Upper Body + Cardio", [("upper_body", 3), ("cardio", 1)]),
+        "TUE": ("Lower Body + Cardio", [("lower_body", 3), ("cardio", 1)]),
+        "THU": ("Push Day", [("push_day", 3)]),
+        "FRI": ("Leg Day", [("leg_day", 3)]),
+        "SAT": ("Upper Body", [("upper_body", 4)]),
+    }),
+}
+
+
+class PlanDay:
+    __slots__ = ("day", "title", "exercises")
+
+    def __init__(self, day, title, exercises):
+        self.day = day
+        self.title = title
+        self.exercises = exercises #CatalogExercises, empty on a rest day
+
+    def to_dict(self):
+        return {
+            "day": self.day,
+            "title": self.title,
+            "exercises": [{"name": e.name, "category": e.category, "tracked": e.tracked,
+                           "reps": {level: reps[e.category] for level, reps in REP_RANGES.items()}}
+                          for e in self.exercises],
+        }
+
+
+class WorkoutPlan:
+    __slots__ = ("kind", "title", "week", "seed", "days")
+
+    def __init__(self, kind, title, week, seed, days):
+        self.kind = kind
+        self.title = title
+        self.week = week
+        self.seed = seed
+        self.days = days #one PlanDay per weekday, MON first
+
+    def to_dict(self):
+        return {"kind": self.kind, "title": self.title, "week": self.week, "seed": self.seed,
+                "days": [day.to_dict() for day in self.days]}
+
+    def to_text(self):
+        # the plain text layout the old script printed
+        lines = [self.title.upper(), ""]
+        for day in self.days:
+            lines.append(f"{day.day}: {day.title}")
+            for e in day.exercises:
+                lines.append(f"- {e.name}")
+                lines.extend(f"  - {level}: {reps[e.category]}" for level, reps in REP_RANGES.items())
+            lines.append("")
+        return "\n".join(lines)
+
+
+def current_week(today=None):
+    # ISO week, e.g. "2026-W42"
+    year, week, _ = (today or date.today()).isocalendar()
+    return f"{year}-W{week:02d}"
+
+
+def plan_seed(user_id, week):
+    # stable across processes and restarts, unlike hash(). 53 bits so it fits sqlite's
+    # integers and survives the trip through json to the browser
+    return int.from_bytes(hashlib.blake2b(f"{user_id}:{week}".encode(), digest_size=8).digest(), "little") >> 11
+
+
+def plan_kind(goal, workouts_per_week):
+    # from the intake quiz: four days or fewer get the beginner plan, more get the
+    # strength plan if that is the goal and the weekly split otherwise
+    try:
+        days = int(workouts_per_week)
+    except (TypeError, ValueError):
+        days = 3
+    if days <= 4:
+        return "beginner"
+    return "strength" if goal == "gain strength" else "split"
+
+
+def generate_plan(kind, seed, week=None):
+    rng = random.Random(seed)
+    title, schedule = PLAN_KINDS[kind]
+    days = []
+    for day in WEEKDAYS:
+        day_title, picks = schedule.get(day, ("Rest", ()))
+        exercises = []
+        for group, count in picks:
+            options = GROUPS[group]
+            exercises.extend(rng.sample(options, k=min(count, len(options))))
+        days.append(PlanDay(day, day_title, exercises))
+    return WorkoutPlan(kind, title, week, seed, days)
+
+
+def plan_for_user(user_id, goal, workouts_per_week, week):
+    return generate_plan(plan_kind(goal, workouts_per_week), plan_seed(user_id, week), week)
+
+
+def plan_row(user_id, plan):
+    # what Database.save_plans stores for a plan
+    return (user_id, plan.week, plan.kind, plan.seed, json.dumps(plan.to_dict(), separators=(",", ":")), time.time())
+
+
+def generate_all(database, week=None, batch_size=500):
+    # plans for every registered user, stored batch_size at a time. returns how many
+    week = week or current_week()
+    rows = []
+    total = 0
+    for user in database.users_for_plans():
+        rows.append(plan_row(user["id"], plan_for_user(user["id"], user["goal"], user["workouts_per_week"], week)))
+        if len(rows) >= batch_size:
+            database.save_plans(rows)
+            total += len(rows)
+            rows = []
+    if rows:
+        database.save_plans(rows)
+        total += len(rows)
+    return total
+
+
+if __name__ == "__main__":
+    import os
+    from db import Database
+
+    parser = argparse.ArgumentParser(description="generate this week's workout plan for every user")
+    parser.add_argument("--db", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "UserLogins.db"))
+    parser.add_argument("--week", default=None, help="ISO week like 2026-W42, default this week")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    count = generate_all(Database(args.db), args.week)
+    print(f"{count} plans for {args.week or current_week()} in {time.perf_counter() - start:.2f} s")